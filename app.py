@@ -1,38 +1,108 @@
 # ESP32 Toy Backend 123
 from dotenv import load_dotenv
 from flask import Flask, request, send_file, jsonify, g
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.http import http_date
+import orjson
 import os, datetime, time
+import decimal
+import random
 import struct
 import wave
 import threading
 import uuid
-from google.cloud import firestore
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Annotated, Optional
+from pydantic import BaseModel, StringConstraints, ValidationError
 
 # Load environment variables from .env file
 load_dotenv()
 
-from whisper_stt import transcribe_audio
-from gemini_reply import get_gpt_reply  # Using Google Gemini for Google Cloud Hackathon
-from tts_elevenlabs_streaming import synthesize_speech  # Using ElevenLabs Streaming TTS
+# NOTE: whisper_stt / gemini_reply / tts_elevenlabs_streaming (and the OpenAI, Gemini
+# and requests SDKs behind them) are imported inside the handlers that use them so
+# workers that only serve health checks or /audios never pay for them.
+# config/gunicorn.conf.py preloads them in post_fork for production workers.
+# The knowledge graph services are module-level since the graph endpoints use them
+# on every request (knowledge_graph_service brings the OpenAI SDK with it).
+from google.api_core.exceptions import NotFound
+from google.cloud import firestore
 from firebase_config import initialize_firebase
-from firestore_service import firestore_service
-from auth_middleware import require_device_auth
+from firestore_service import firestore_service, FIRESTORE_POOL
+from auth_middleware import require_device_auth, clear_negative_cache
 from session_manager import SessionManager
+from graph_query_service import GraphQueryService
+from knowledge_graph_service import knowledge_graph_service
 
 # Initialize logging configuration BEFORE creating Flask app
 from logging_config import setup_logging, get_logger, log_execution_time
 
 app = Flask(__name__)
 
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson (Rust) instead of the stdlib encoder.
+
+    Datetimes are passed through to ``_default`` so they keep Flask's HTTP-date
+    format; anything else orjson can't encode falls back to Flask's rules.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self._dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the Response - skips the str decode and
+        # re-encode that the base implementation does on large list payloads
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumpb(obj), mimetype="application/json")
+
+    def _dumpb(self, obj):
+        return orjson.dumps(
+            obj,
+            default=self._default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, datetime.date):
+            return http_date(obj)
+        if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+            return str(obj)
+        if hasattr(obj, "__html__"):
+            return str(obj.__html__())
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+app.json = ORJSONProvider(app)
+
 # Setup logging (will integrate with Gunicorn if running under Gunicorn)
 setup_logging(app)
 logger = get_logger(__name__)
 TEMP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp")
 AUDIO_DIR = os.path.join(os.path.dirname(__file__), "audio")
+FILLER_AUDIO_DIR = os.path.join(AUDIO_DIR, "filler_audios")
 os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+# Filler audio listing cache: (directory mtime, [urls])
+_filler_cache = (None, [])
+
+# Async /upload replies not fetched within this long are deleted
+ASYNC_REPLY_TTL_SECONDS = int(os.getenv("ASYNC_REPLY_TTL_SECONDS", 600))
+
+# Async /upload jobs (STT -> GPT -> TTS) run on a small bounded pool. At most
+# ASYNC_REPLY_MAX_PENDING jobs are running or queued per worker; beyond that
+# uploads are answered synchronously instead of piling up behind the pool.
+ASYNC_REPLY_WORKERS = int(os.getenv("ASYNC_REPLY_WORKERS", 4))
+ASYNC_REPLY_MAX_PENDING = ASYNC_REPLY_WORKERS * 2
+ASYNC_REPLY_POOL = ThreadPoolExecutor(max_workers=ASYNC_REPLY_WORKERS, thread_name_prefix="async-reply")
+_async_reply_slots = threading.BoundedSemaphore(ASYNC_REPLY_MAX_PENDING)
+
 # ==================== CORS CONFIGURATION ====================
 # Allowed origins - restrict to your domain only for security
 ALLOWED_ORIGINS = [
@@ -47,12 +117,13 @@ CORS(app,
      origins=ALLOWED_ORIGINS,
      allow_headers=['Content-Type', 'X-Audio-Format', 'X-Device-ID', 'X-User-Email',
                     'X-User-ID', 'X-Session-ID', 'X-Child-ID', 'X-Sample-Rate',
-                    'X-Channels', 'X-Bits-Per-Sample', 'User-Agent', 'X-Email'],
+                    'X-Channels', 'X-Bits-Per-Sample', 'User-Agent', 'X-Email',
+                    'X-Async-Reply'],
      methods=['GET', 'POST', 'PUT', 'OPTIONS'],
      supports_credentials=True,
      max_age=3600)  # Cache preflight requests for 1 hour
 
-logger.info(f"CORS configured for origins: {ALLOWED_ORIGINS}")
+logger.info("CORS configured for origins: %s", ALLOWED_ORIGINS)
 
 # ==================== MIDDLEWARE AND ERROR HANDLERS ====================
 
@@ -71,10 +142,11 @@ def before_request():
         g.device_id = '-'
 
     logger.info(
-        f"Incoming request: {request.method} {request.path} | "
-        f"Remote: {request.remote_addr} | "
-        f"Content-Type: {request.content_type} | "
-        f"Content-Length: {request.content_length or 0}"
+        "Incoming request: %s %s | "
+        "Remote: %s | "
+        "Content-Type: %s | "
+        "Content-Length: %s",
+        request.method, request.path, request.remote_addr, request.content_type, request.content_length or 0
     )
 
 
@@ -84,10 +156,11 @@ def after_request(response):
     duration = time.time() - g.get('start_time', time.time())
 
     logger.info(
-        f"Request completed: {request.method} {request.path} | "
-        f"Status: {response.status_code} | "
-        f"Duration: {duration:.3f}s | "
-        f"Response-Size: {response.content_length or 0}"
+        "Request completed: %s %s | "
+        "Status: %s | "
+        "Duration: %.3fs | "
+        "Response-Size: %s",
+        request.method, request.path, response.status_code, duration, response.content_length or 0
     )
 
     # Add request ID to response headers for tracking
@@ -99,28 +172,28 @@ def after_request(response):
 @app.errorhandler(400)
 def bad_request_error(error):
     """Handle 400 Bad Request errors"""
-    logger.warning(f"Bad request: {request.path} | Error: {str(error)}")
+    logger.warning("Bad request: %s | Error: %s", request.path, error)
     return jsonify({"error": "Bad request", "message": str(error)}), 400
 
 
 @app.errorhandler(403)
 def forbidden_error(error):
     """Handle 403 Forbidden errors"""
-    logger.warning(f"Forbidden access: {request.path} | Error: {str(error)}")
+    logger.warning("Forbidden access: %s | Error: %s", request.path, error)
     return jsonify({"error": "Forbidden", "message": str(error)}), 403
 
 
 @app.errorhandler(404)
 def not_found_error(error):
     """Handle 404 Not Found errors"""
-    logger.warning(f"Not found: {request.path}")
+    logger.warning("Not found: %s", request.path)
     return jsonify({"error": "Not found"}), 404
 
 
 @app.errorhandler(500)
 def internal_server_error(error):
     """Handle 500 Internal Server errors"""
-    logger.error(f"Internal server error: {request.path}", exc_info=True)
+    logger.error("Internal server error: %s", request.path, exc_info=True)
     return jsonify({"error": "Internal server error"}), 500
 
 
@@ -128,7 +201,7 @@ def internal_server_error(error):
 def handle_exception(error):
     """Handle all uncaught exceptions"""
     logger.error(
-        f"Unhandled exception in {request.method} {request.path}: {str(error)}",
+        "Unhandled exception in %s %s: %s", request.method, request.path, error,
         exc_info=True
     )
     return jsonify({"error": "Internal server error", "message": str(error)}), 500
@@ -148,80 +221,93 @@ logger.info("Session manager initialized successfully")
 # Note: This dict is now managed by session_manager (kept for backward compatibility)
 ACTIVE_CONVERSATIONS = session_manager.ACTIVE_CONVERSATIONS
 
-# Background session cleanup task
-def run_cleanup_loop():
-    """Background thread to cleanup expired sessions every 60 seconds"""
-    while True:
-        time.sleep(60)  # 1 minute - run more frequently to catch expired sessions quickly
-        try:
-            session_manager.cleanup_expired_sessions()
-        except Exception as e:
-            logger.error(f"Session cleanup failed: {str(e)}", exc_info=True)
-
-# Start cleanup thread as daemon (will exit when main program exits)
-cleanup_thread = threading.Thread(target=run_cleanup_loop, daemon=True)
-cleanup_thread.start()
-logger.info("Background session cleanup task started (60s interval)")
+# Background session cleanup: one scheduler thread ends sessions at their expiry
+# time, with a 10-minute safety-net sweep for orphans (no fixed 60s polling)
+session_manager.start_background_scheduler()
+logger.info("Background session expiry scheduler started")
 
 # Old get_or_create_conversation() and end_conversation_session() functions removed
 # Session management now handled by session_manager
 
 
+# IMA ADPCM step size table
+IMA_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17,
+    19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118,
+    130, 143, 157, 173, 190, 209, 230, 253, 279, 307,
+    337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
+    2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358,
+    5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+]
+
+# Index table for IMA ADPCM (matches ESP32 implementation)
+IMA_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8]
+
+
+def _build_adpcm_tables():
+    """
+    Precompute per-(step_index, nibble) signed deltas and next step indices.
+
+    The decode loop then does two table lookups per sample instead of four
+    data-dependent branches on the nibble bits. Deltas use the same bit math
+    as the ESP32 encoder:
+        diffq = (step >> 3) + bit2 * step + bit1 * (step >> 1) + bit0 * (step >> 2)
+        delta = diffq * (1 - 2 * bit3)
+    """
+    delta_table = []
+    next_index_table = []
+    for step_index, step in enumerate(IMA_STEP_TABLE):
+        deltas = []
+        next_indices = []
+        for nibble in range(16):
+            diffq = ((step >> 3)
+                     + ((nibble >> 2) & 1) * step
+                     + ((nibble >> 1) & 1) * (step >> 1)
+                     + (nibble & 1) * (step >> 2))
+            deltas.append(diffq * (1 - 2 * ((nibble >> 3) & 1)))
+            next_indices.append(max(0, min(88, step_index + IMA_INDEX_TABLE[nibble])))
+        delta_table.append(tuple(deltas))
+        next_index_table.append(tuple(next_indices))
+    return tuple(delta_table), tuple(next_index_table)
+
+
+ADPCM_DELTA_TABLE, ADPCM_NEXT_INDEX_TABLE = _build_adpcm_tables()
+
+
 def decompress_adpcm_to_wav(adpcm_data, output_path, sample_rate=16000):
     """
     Decompress ADPCM data to WAV format
     Assumes IMA ADPCM format commonly used by ESP32
     """
     try:
-        # IMA ADPCM step size table
-        step_table = [
-            7, 8, 9, 10, 11, 12, 13, 14, 16, 17,
-            19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
-            50, 55, 60, 66, 73, 80, 88, 97, 107, 118,
-            130, 143, 157, 173, 190, 209, 230, 253, 279, 307,
-            337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
-            876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
-            2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358,
-            5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899,
-            15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
-        ]
-        
-        # Index table for IMA ADPCM (matches ESP32 implementation)
-        index_table = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8]
-        
+        delta_table = ADPCM_DELTA_TABLE
+        next_index_table = ADPCM_NEXT_INDEX_TABLE
+
         # Initialize decoder state
         predicted_sample = 0
         step_index = 0
         decoded_samples = []
-        
+        append = decoded_samples.append
+
         # Process ADPCM data
         for byte in adpcm_data:
-            # Each byte contains two 4-bit ADPCM samples
-            for nibble in [(byte & 0x0F), (byte >> 4)]:
-                step = step_table[step_index]
-                
-                # Decode the nibble (matching ESP32 encoder logic)
-                diffq = step >> 3
-                if nibble & 4:
-                    diffq += step
-                if nibble & 2:
-                    diffq += step >> 1
-                if nibble & 1:
-                    diffq += step >> 2
-                
-                if nibble & 8:
-                    predicted_sample -= diffq
-                else:
-                    predicted_sample += diffq
-                
+            # Each byte contains two 4-bit ADPCM samples (low nibble first)
+            for nibble in (byte & 0x0F, byte >> 4):
+                predicted_sample += delta_table[step_index][nibble]
+
                 # Clamp to 16-bit range
-                predicted_sample = max(-32768, min(32767, predicted_sample))
-                decoded_samples.append(predicted_sample)
-                
-                # Update step index
-                step_index += index_table[nibble]
-                step_index = max(0, min(88, step_index))
-        
+                if predicted_sample > 32767:
+                    predicted_sample = 32767
+                elif predicted_sample < -32768:
+                    predicted_sample = -32768
+                append(predicted_sample)
+
+                # Update step index (pre-clamped in the table)
+                step_index = next_index_table[step_index][nibble]
+
         # Convert to bytes (16-bit PCM)
         pcm_data = struct.pack('<' + 'h' * len(decoded_samples), *decoded_samples)
         
@@ -233,13 +319,14 @@ def decompress_adpcm_to_wav(adpcm_data, output_path, sample_rate=16000):
             wav_file.writeframes(pcm_data)
 
         logger.info(
-            f"ADPCM decompression successful: {len(adpcm_data)} bytes -> "
-            f"{len(decoded_samples)} samples | Output: {output_path}"
+            "ADPCM decompression successful: %s bytes -> "
+            "%s samples | Output: %s",
+            len(adpcm_data), len(decoded_samples), output_path
         )
         return True
 
     except Exception as e:
-        logger.error(f"ADPCM decompression failed: {str(e)}", exc_info=True)
+        logger.error("ADPCM decompression failed: %s", e, exc_info=True)
         return False
 
 @app.route("/")
@@ -288,18 +375,19 @@ def upload_audio():
     child_id = request.headers.get('X-Child-ID')
 
     logger.info(
-        f"Audio upload started | Toy: {toy_id} | User: {user_id} | "
-        f"Child: {child_id or 'None'} | Timestamp: {timestamp}"
+        "Audio upload started | Toy: %s | User: %s | "
+        "Child: %s | Timestamp: %s",
+        toy_id, user_id, child_id or 'None', timestamp
     )
 
     # Fallback: If child_id not provided, use toy's assigned child
     if not child_id and hasattr(request, 'auth_context'):
         child_id = request.auth_context.get('toy_data', {}).get('assignedChildId')
         if child_id:
-            logger.info(f"Using toy's assigned child ID: {child_id}")
+            logger.info("Using toy's assigned child ID: %s", child_id)
 
     # Get or create session (backend-managed)
-    logger.debug(f"Getting or creating session for toy {toy_id}, user {user_id}, child {child_id}")
+    logger.debug("Getting or creating session for toy %s, user %s, child %s", toy_id, user_id, child_id)
     session_data = session_manager.get_or_create_session(
         toy_id=toy_id,
         user_id=user_id,
@@ -307,14 +395,15 @@ def upload_audio():
     )
 
     if not session_data:
-        logger.error(f"Failed to create session for toy {toy_id}, user {user_id}")
+        logger.error("Failed to create session for toy %s, user %s", toy_id, user_id)
         return jsonify({"error": "Session creation failed"}), 500
 
     session_id = session_data['session_id']
     conversation_id = session_data['conversation_id']
     logger.info(
-        f"Session established | SessionID: {session_id} | "
-        f"ConversationID: {conversation_id}"
+        "Session established | SessionID: %s | "
+        "ConversationID: %s",
+        session_id, conversation_id
     )
 
     # Store session info in g for logging context
@@ -338,131 +427,215 @@ def upload_audio():
     if content_type == "audio/adpcm" or request.headers.get('X-Audio-Format') == 'adpcm':
         # ADPCM format - decompress to WAV
         logger.info(
-            f"Processing ADPCM audio | Size: {len(audio_data)} bytes | "
-            f"Session: {session_id}"
+            "Processing ADPCM audio | Size: %s bytes | "
+            "Session: %s",
+            len(audio_data), session_id
         )
 
         if not decompress_adpcm_to_wav(audio_data, input_path):
-            logger.error(f"ADPCM decompression failed for session {session_id}")
+            logger.error("ADPCM decompression failed for session %s", session_id)
             return jsonify({"error": "ADPCM decompression failed"}), 500
 
-        logger.info(f"ADPCM decompressed successfully to {input_path}")
+        logger.info("ADPCM decompressed successfully to %s", input_path)
 
     elif content_type == "audio/wav":
         # Already WAV format - save directly
         with open(input_path, "wb") as f:
             f.write(audio_data)
         logger.info(
-            f"Saved WAV audio directly | Size: {len(audio_data)} bytes | "
-            f"Path: {input_path} | Session: {session_id}"
+            "Saved WAV audio directly | Size: %s bytes | "
+            "Path: %s | Session: %s",
+            len(audio_data), input_path, session_id
         )
 
     else:
         # Assume ADPCM by default for ESP32 compatibility
         logger.warning(
-            f"No audio format specified, assuming ADPCM | Size: {len(audio_data)} bytes | "
-            f"Session: {session_id}"
+            "No audio format specified, assuming ADPCM | Size: %s bytes | "
+            "Session: %s",
+            len(audio_data), session_id
         )
 
         if not decompress_adpcm_to_wav(audio_data, input_path):
-            logger.error(f"ADPCM decompression failed for session {session_id}")
+            logger.error("ADPCM decompression failed for session %s", session_id)
             return jsonify({"error": "ADPCM decompression failed"}), 500
 
-        logger.info(f"ADPCM decompressed successfully to {input_path}")
+        logger.info("ADPCM decompressed successfully to %s", input_path)
 
     timing_log["audio_saved"] = time.time()
 
+    # Async reply mode: hand the ESP32 a filler clip right away and run
+    # STT -> GPT -> TTS in the background; the real reply is fetched from /reply/<task_id>
+    async_reply = request.headers.get('X-Async-Reply') == '1'
+    if async_reply and not _async_reply_slots.acquire(blocking=False):
+        logger.warning(
+            "Async reply pool saturated (%s pending), replying synchronously | Session: %s",
+            ASYNC_REPLY_MAX_PENDING, session_id
+        )
+        async_reply = False
+
+    if async_reply:
+        task_id = uuid.uuid4().hex
+        filler_urls = _get_filler_audio_urls()
+        filler_url = random.choice(filler_urls) if filler_urls else None
+
+        try:
+            _sweep_async_replies()
+            # Task marker recording the owner - /reply/<task_id> only serves this device
+            with open(_reply_paths(task_id)[2], "wb") as f:
+                f.write(orjson.dumps({"user_id": user_id, "toy_id": toy_id}))
+
+            ASYNC_REPLY_POOL.submit(
+                _run_async_reply,
+                task_id, input_path, session_id, conversation_id, user_id, child_id, timing_log
+            )
+        except Exception:
+            _async_reply_slots.release()  # the job never started, so it won't release it
+            raise
+
+        logger.info(
+            "Async reply job queued | Task: %s | Filler: %s | "
+            "Session: %s",
+            task_id, filler_url, session_id
+        )
+        return jsonify({
+            "task_id": task_id,
+            "filler_url": filler_url,
+            "reply_url": f"/reply/{task_id}"
+        }), 202
+
+    output_path = os.path.join(TEMP_DIR, f"reply_{timestamp}.wav")
+    error = _run_reply_pipeline(
+        input_path, output_path, session_id, conversation_id, user_id, child_id, timing_log
+    )
+    if error:
+        return jsonify({"error": error}), 500
+
+    # 6. Send back WAV with proper headers
+    timings = _log_reply_timing(timing_log, output_path, session_id, conversation_id)
+
+    response = send_file(output_path, mimetype="audio/wav", as_attachment=False)
+    response.headers["Connection"] = "keep-alive"
+    response.headers["X-Response-Time"] = f"{timings['total']:.2f}"
+    response.headers["X-STT-Time"] = f"{timings['stt']:.2f}"
+    response.headers["X-GPT-Time"] = f"{timings['gpt']:.2f}"
+    response.headers["X-TTS-Time"] = f"{timings['tts']:.2f}"
+    return response
+
+
+def _run_reply_pipeline(input_path, output_path, session_id, conversation_id, user_id, child_id, timing_log):
+    """
+    Run STT -> GPT -> TTS for a saved WAV input and write the reply to output_path.
+
+    Shared by the synchronous /upload response and the async reply worker.
+
+    Returns:
+        None on success, or an error message suitable for the client
+    """
+    from whisper_stt import transcribe_audio
+    from gemini_reply import stream_gpt_reply  # Using Google Gemini for Google Cloud Hackathon
+    from tts_elevenlabs_streaming import synthesize_speech_from_stream  # Using ElevenLabs Streaming TTS
+
     # 2. STT (Server-side Whisper API)
     stt_start = time.time()
-    logger.info(f"Starting Whisper STT | Session: {session_id} | Input: {input_path}")
+    logger.info("Starting Whisper STT | Session: %s | Input: %s", session_id, input_path)
 
     try:
         user_text = transcribe_audio(input_path)
         if not user_text:
-            logger.error(f"STT failed - no transcription returned | Session: {session_id}")
-            return jsonify({"error": "Speech transcription failed"}), 500
+            logger.error("STT failed - no transcription returned | Session: %s", session_id)
+            return "Speech transcription failed"
 
         timing_log["stt_complete"] = time.time()
         stt_time = timing_log["stt_complete"] - stt_start
         logger.info(
-            f"STT completed successfully | Duration: {stt_time:.2f}s | "
-            f"Transcription: '{user_text}' | Session: {session_id}"
+            "STT completed successfully | Duration: %.2fs | "
+            "Transcription: '%s' | Session: %s",
+            stt_time, user_text, session_id
         )
     except Exception as e:
-        logger.error(f"STT exception: {str(e)} | Session: {session_id}", exc_info=True)
-        return jsonify({"error": "Speech transcription failed"}), 500
+        logger.error("STT exception: %s | Session: %s", e, session_id, exc_info=True)
+        return "Speech transcription failed"
 
-    # 3. GPT with memory context (includes Firestore batch saving - 3 writes instead of 6)
+    # 3+4. GPT streamed straight into TTS: each sentence is synthesized while
+    # Gemini is still generating the rest of the reply (messages saved once the stream ends)
     gpt_start = time.time()
     logger.info(
-        f"Starting GPT generation | Session: {session_id} | "
-        f"UserText: '{user_text[:100]}{'...' if len(user_text) > 100 else ''}'"
+        "Starting streamed GPT -> TTS | Session: %s | Output: %s | "
+        "UserText: '%s%s'",
+        session_id, output_path, user_text[:100], '...' if len(user_text) > 100 else ''
     )
 
-    try:
-        gpt_reply = get_gpt_reply(
+    def timed_reply_stream():
+        yield from stream_gpt_reply(
             user_text=user_text,
             session_id=session_id,
             user_id=user_id,
             conversation_id=conversation_id,
             child_id=child_id
         )
-
         timing_log["gpt_complete"] = time.time()
+
+    try:
+        gpt_reply = synthesize_speech_from_stream(timed_reply_stream(), output_path)
+
         gpt_time = timing_log["gpt_complete"] - gpt_start
         logger.info(
-            f"GPT completed successfully | Duration: {gpt_time:.2f}s | "
-            f"Reply: '{gpt_reply[:100]}{'...' if len(gpt_reply) > 100 else ''}' | "
-            f"Session: {session_id}"
+            "Streamed GPT -> TTS completed | GPT Duration: %.2fs | "
+            "Reply: '%s%s' | "
+            "Session: %s",
+            gpt_time, gpt_reply[:100], '...' if len(gpt_reply) > 100 else '', session_id
         )
     except Exception as e:
-        logger.error(f"GPT generation exception: {str(e)} | Session: {session_id}", exc_info=True)
-        return jsonify({"error": "GPT processing failed"}), 500
-
-    # 4. TTS
-    tts_start = time.time()
-    output_path = os.path.join(TEMP_DIR, f"reply_{timestamp}.wav")
-    logger.info(
-        f"Starting TTS generation | Output: {output_path} | "
-        f"Text length: {len(gpt_reply)} chars | Session: {session_id}"
-    )
-
-    try:
-        synthesize_speech(gpt_reply, output_path)
-    except Exception as e:
-        logger.error(f"TTS synthesis exception: {str(e)} | Session: {session_id}", exc_info=True)
-        return jsonify({"error": "Speech synthesis failed"}), 500
+        logger.error("Streamed GPT -> TTS exception: %s | Session: %s", e, session_id, exc_info=True)
+        if "gpt_complete" not in timing_log:
+            return "GPT processing failed"
+        return "Speech synthesis failed"
 
     # 5. Wait for TTS output file to be created (with retry)
     max_retries = 60
     retry_delay = 1.0
-    logger.debug(f"Waiting for TTS output file: {output_path}")
+    logger.debug("Waiting for TTS output file: %s", output_path)
 
     for attempt in range(max_retries):
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            logger.info(f"TTS output file ready after {attempt + 1} attempts")
+            logger.info("TTS output file ready after %s attempts", attempt + 1)
             break
 
         if attempt % 10 == 0:  # Log every 10 attempts to reduce noise
             logger.debug(
-                f"TTS file not ready yet | Attempt {attempt + 1}/{max_retries} | "
-                f"Waiting {retry_delay}s..."
+                "TTS file not ready yet | Attempt %s/%s | "
+                "Waiting %ss...",
+                attempt + 1, max_retries, retry_delay
             )
         time.sleep(retry_delay)
     else:
         logger.error(
-            f"TTS output file not created after {max_retries} attempts | "
-            f"Path: {os.path.abspath(output_path)} | "
-            f"CWD: {os.getcwd()} | "
-            f"Session: {session_id}"
+            "TTS output file not created after %s attempts | "
+            "Path: %s | "
+            "CWD: %s | "
+            "Session: %s",
+            max_retries, os.path.abspath(output_path), os.getcwd(), session_id
         )
         if os.path.exists('../temp'):
             temp_files = os.listdir('../temp')
-            logger.error(f"Files in temp directory: {temp_files}")
-        return jsonify({"error": "Speech synthesis failed"}), 500
+            logger.error("Files in temp directory: %s", temp_files)
+        return "Speech synthesis failed"
 
-    # 6. Send back WAV with proper headers
     timing_log["tts_complete"] = time.time()
+
+    # Update session activity
+    try:
+        session_manager.update_session_activity(session_id, user_id)
+        logger.debug("Session activity updated | Session: %s", session_id)
+    except Exception as e:
+        logger.warning("Failed to update session activity: %s", e, exc_info=True)
+
+    return None
+
+
+def _log_reply_timing(timing_log, output_path, session_id, conversation_id):
+    """Log the STT/GPT/TTS timing breakdown for a completed reply and return it"""
     file_size = os.path.getsize(output_path)
 
     # Calculate timing breakdown
@@ -473,32 +646,138 @@ def upload_audio():
 
     # Log comprehensive timing analysis
     logger.info(
-        f"\n"
-        f"=== RESPONSE TIME ANALYSIS ===\n"
-        f"Session: {session_id} | Conversation: {conversation_id}\n"
-        f"Total Response Time: {total_time:.2f}s\n"
-        f"├─ STT Processing: {stt_time:.2f}s ({stt_time/total_time*100:.1f}%)\n"
-        f"├─ GPT Generation: {gpt_time:.2f}s ({gpt_time/total_time*100:.1f}%)\n"
-        f"└─ TTS Generation: {tts_time:.2f}s ({tts_time/total_time*100:.1f}%)\n"
-        f"Audio file size: {file_size} bytes\n"
-        f"=== END TIMING ANALYSIS ==="
+        "\n"
+        "=== RESPONSE TIME ANALYSIS ===\n"
+        "Session: %s | Conversation: %s\n"
+        "Total Response Time: %.2fs\n"
+        "├─ STT Processing: %.2fs (%.1f%%)\n"
+        "├─ GPT Generation: %.2fs (%.1f%%)\n"
+        "└─ TTS Generation: %.2fs (%.1f%%)\n"
+        "Audio file size: %s bytes\n"
+        "=== END TIMING ANALYSIS ===",
+        session_id, conversation_id, total_time,
+        stt_time, stt_time/total_time*100,
+        gpt_time, gpt_time/total_time*100,
+        tts_time, tts_time/total_time*100,
+        file_size
     )
 
-    # Update session activity
+    return {
+        "total": total_time,
+        "stt": stt_time,
+        "gpt": gpt_time,
+        "tts": tts_time,
+        "file_size": file_size,
+    }
+
+
+def _reply_paths(task_id):
+    """Return (ready_path, error_path, task_path, part_path) for an async reply job"""
+    return (
+        os.path.join(TEMP_DIR, f"reply_{task_id}.wav"),
+        os.path.join(TEMP_DIR, f"reply_{task_id}.error"),
+        os.path.join(TEMP_DIR, f"reply_{task_id}.task"),
+        os.path.join(TEMP_DIR, f"reply_{task_id}.part.wav"),
+    )
+
+
+def _remove_async_reply(task_id):
+    """Delete every file belonging to an async reply job"""
+    for path in _reply_paths(task_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _sweep_async_replies():
+    """Delete async reply jobs whose task marker is older than ASYNC_REPLY_TTL_SECONDS"""
+    cutoff = time.time() - ASYNC_REPLY_TTL_SECONDS
     try:
-        session_manager.update_session_activity(session_id, user_id)
-        logger.debug(f"Session activity updated | Session: {session_id}")
+        with os.scandir(TEMP_DIR) as entries:
+            for entry in entries:
+                if entry.name.startswith("reply_") and entry.name.endswith(".task") \
+                        and entry.stat().st_mtime < cutoff:
+                    _remove_async_reply(entry.name[len("reply_"):-len(".task")])
+    except OSError as e:
+        logger.warning("Async reply sweep failed: %s", e)
+
+
+def _run_async_reply(task_id, input_path, session_id, conversation_id, user_id, child_id, timing_log):
+    """
+    Background worker for async /upload replies.
+
+    Results live on disk (not in worker memory) so the follow-up /reply/<task_id>
+    fetch can be served by any Gunicorn worker. The WAV is rendered to a .part
+    file and renamed into place so it is never served half-written. Releases the
+    async reply slot taken by /upload.
+    """
+    ready_path, error_path, _, part_path = _reply_paths(task_id)
+
+    try:
+        error = _run_reply_pipeline(
+            input_path, part_path, session_id, conversation_id, user_id, child_id, timing_log
+        )
+        if error:
+            with open(error_path, "w") as f:
+                f.write(error)
+            return
+
+        _log_reply_timing(timing_log, part_path, session_id, conversation_id)
+        os.replace(part_path, ready_path)
+        logger.info("Async reply ready | Task: %s | Session: %s", task_id, session_id)
+
     except Exception as e:
-        logger.warning(f"Failed to update session activity: {str(e)}", exc_info=True)
+        logger.error("Async reply job failed | Task: %s | Error: %s", task_id, e, exc_info=True)
+        with open(error_path, "w") as f:
+            f.write("Reply generation failed")
+
+    finally:
+        _async_reply_slots.release()
+
+
+@app.route("/reply/<task_id>", methods=["GET"])
+@require_device_auth
+def get_async_reply(task_id):
+    """
+    Poll for the reply audio of an async /upload job
+
+    Only the device that started the job can fetch it. The job's files are deleted
+    once the reply (or its error) has been served.
+
+    Returns:
+        200 with WAV audio when ready, 202 while processing, 500 if the job failed,
+        404 for malformed, unknown, expired or another device's task IDs
+    """
+    if not task_id.isalnum():
+        return jsonify({"error": "Invalid task ID"}), 404
+
+    ready_path, error_path, task_path, _ = _reply_paths(task_id)
+
+    try:
+        with open(task_path, "rb") as f:
+            owner = orjson.loads(f.read())
+    except FileNotFoundError:
+        return jsonify({"error": "Unknown task ID"}), 404
+
+    if owner != {"user_id": request.auth_context.get('user_id'),
+                 "toy_id": request.auth_context.get('toy_id')}:
+        return jsonify({"error": "Unknown task ID"}), 404
+
+    if os.path.exists(ready_path):
+        response = send_file(ready_path, mimetype="audio/wav", as_attachment=False)
+        response.headers["Connection"] = "keep-alive"
+        response.call_on_close(lambda: _remove_async_reply(task_id))
+        return response
+
+    if os.path.exists(error_path):
+        with open(error_path) as f:
+            error = f.read()
+        _remove_async_reply(task_id)
+        return jsonify({"error": error}), 500
+
+    return jsonify({"status": "processing", "task_id": task_id}), 202
 
-    response = send_file(output_path, mimetype="audio/wav", as_attachment=False)
-    response.headers["Content-Length"] = str(file_size)
-    response.headers["Connection"] = "keep-alive"
-    response.headers["X-Response-Time"] = f"{total_time:.2f}"
-    response.headers["X-STT-Time"] = f"{stt_time:.2f}"
-    response.headers["X-GPT-Time"] = f"{gpt_time:.2f}"
-    response.headers["X-TTS-Time"] = f"{tts_time:.2f}"
-    return response
 
 @app.route("/wakeup", methods=["GET"])
 def wakeup():
@@ -520,22 +799,42 @@ def wakeup():
 
         # Verify file exists and has content
         if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            logger.error(f"Wakeup audio file not found or empty: {file_path}")
+            logger.error("Wakeup audio file not found or empty: %s", file_path)
             return jsonify({"error": "Audio file not found or empty"}), 404
 
         file_size = os.path.getsize(file_path)
-        logger.info(f"Serving wakeup audio: {latest_file} ({file_size} bytes)")
+        logger.info("Serving wakeup audio: %s (%s bytes)", latest_file, file_size)
 
         # Send the WAV file with proper headers
         response = send_file(file_path, mimetype="audio/wav", as_attachment=False)
-        response.headers["Content-Length"] = str(file_size)
         response.headers["Connection"] = "keep-alive"
         return response
 
     except Exception as e:
-        logger.error(f"Wakeup route error: {str(e)}", exc_info=True)
+        logger.error("Wakeup route error: %s", e, exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
+def _get_filler_audio_urls():
+    """
+    List filler audio URLs, cached until the filler_audios directory changes.
+
+    Used by /audios discovery and by async /upload to pick a filler clip.
+    """
+    global _filler_cache
+    if not os.path.exists(FILLER_AUDIO_DIR):
+        logger.warning("Filler audio directory does not exist: %s", FILLER_AUDIO_DIR)
+        return []
+
+    mtime = os.path.getmtime(FILLER_AUDIO_DIR)
+    if _filler_cache[0] != mtime:
+        # List all audio files in filler_audios subdirectory
+        audio_files = [f for f in os.listdir(FILLER_AUDIO_DIR) if f.endswith(('.wav', '.mp3'))]
+        # Build flattened URLs for the client
+        _filler_cache = (mtime, [f"/audio/{fname}" for fname in audio_files])
+
+    return _filler_cache[1]
+
+
 @app.route("/audios")
 def get_audios():
     """
@@ -544,28 +843,17 @@ def get_audios():
     logger.info("Filler audio discovery requested")
 
     try:
-        filler_dir = os.path.join(AUDIO_DIR, "filler_audios")
-
-        # Check if filler_audios directory exists
-        if not os.path.exists(filler_dir):
-            logger.warning(f"Filler audio directory does not exist: {filler_dir}")
-            return jsonify({"audio_urls": []})
-
-        # List all audio files in filler_audios subdirectory
-        files = os.listdir(filler_dir)
-        audio_files = [f for f in files if f.endswith(('.wav', '.mp3'))]
-
-        # Build flattened URLs for the client
-        urls = [f"/audio/{fname}" for fname in audio_files]
+        urls = _get_filler_audio_urls()
 
         logger.info(
-            f"Filler audio discovery completed | Found {len(audio_files)} files | "
-            f"Directory: {filler_dir}"
+            "Filler audio discovery completed | Found %s files | "
+            "Directory: %s",
+            len(urls), FILLER_AUDIO_DIR
         )
         return jsonify({"audio_urls": urls})
 
     except Exception as e:
-        logger.error(f"Filler audio discovery failed: {str(e)}", exc_info=True)
+        logger.error("Filler audio discovery failed: %s", e, exc_info=True)
         return jsonify({"error": "Failed to list filler audio files"}), 500
 
 @app.route("/audio/<filename>")
@@ -581,17 +869,16 @@ def serve_filler_audio(filename):
         if not os.path.exists(file_path) or not filename.endswith(('.wav', '.mp3')):
             return jsonify({"error": "Filler audio file not found"}), 404
 
-        print(f"[INFO] Serving filler audio: {filename}")
+        logger.info("Serving filler audio: %s", filename)
 
         # Determine MIME type
         mimetype = "audio/wav" if filename.endswith('.wav') else "audio/mpeg"
 
         response = send_file(file_path, mimetype=mimetype, as_attachment=True)
-        response.headers["Content-Length"] = str(os.path.getsize(file_path))
         return response
 
     except Exception as e:
-        print(f"[ERROR] Filler audio serving failed for {filename}: {str(e)}")
+        logger.error("Filler audio serving failed for %s: %s", filename, e)
         return jsonify({"error": "Failed to serve filler audio file"}), 500
 
 @app.route("/text_upload", methods=["POST"])
@@ -618,9 +905,9 @@ def upload_text():
         if not child_id and hasattr(request, 'auth_context'):
             child_id = request.auth_context.get('toy_data', {}).get('assignedChildId')
             if child_id:
-                print(f"[INFO] Using toy's assigned child ID: {child_id}")
+                logger.info("Using toy's assigned child ID: %s", child_id)
 
-        print(f"[INFO] Received text from local STT: {user_text}")
+        logger.info("Received text from local STT: %s", user_text)
     except Exception as e:
         return jsonify({"error": f"Invalid JSON: {str(e)}"}), 400
 
@@ -632,15 +919,18 @@ def upload_text():
     )
 
     if not session_data:
-        print(f"[ERROR] Failed to create session for toy {toy_id}")
+        logger.error("Failed to create session for toy %s", toy_id)
         return jsonify({"error": "Session creation failed"}), 500
 
     session_id = session_data['session_id']
     conversation_id = session_data['conversation_id']
-    print(f"[INFO] Session ID: {session_id}, Conversation ID: {conversation_id}")
+    logger.info("Session ID: %s, Conversation ID: %s", session_id, conversation_id)
 
     timing_log["text_received"] = time.time()
 
+    from gemini_reply import get_gpt_reply
+    from tts_elevenlabs_streaming import synthesize_speech
+
     # Process with GPT with memory context (skip STT since we have text - using batch writes)
     gpt_start = time.time()
     gpt_reply = get_gpt_reply(
@@ -653,7 +943,7 @@ def upload_text():
     timing_log["gpt_complete"] = time.time()
     if not gpt_reply:
         return jsonify({"error": "GPT processing failed"}), 500
-    print("[GPT]", gpt_reply)
+    logger.info("[GPT] %s", gpt_reply)
 
     # Generate TTS response
     tts_start = time.time()
@@ -667,7 +957,7 @@ def upload_text():
     for attempt in range(max_retries):
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
             break
-        print(f"[DEBUG] Attempt {attempt + 1}: File not ready, waiting {retry_delay}s...")
+        logger.debug("Attempt %s: File not ready, waiting %ss...", attempt + 1, retry_delay)
         time.sleep(retry_delay)
     else:
         return jsonify({"error": "Speech synthesis failed"}), 500
@@ -680,19 +970,25 @@ def upload_text():
     gpt_time = timing_log["gpt_complete"] - timing_log["text_received"]
     tts_time = timing_log["tts_complete"] - timing_log["gpt_complete"]
     
-    print(f"\n=== LOCAL STT RESPONSE TIME ANALYSIS ===")
-    print(f"Total Response Time: {total_time:.2f}s")
-    print(f"├─ GPT Generation: {gpt_time:.2f}s ({gpt_time/total_time*100:.1f}%)")
-    print(f"└─ TTS Generation: {tts_time:.2f}s ({tts_time/total_time*100:.1f}%)")
-    print(f"Audio file size: {file_size} bytes")
-    print(f"NOTE: STT was done locally on ESP32 (not measured here)")
-    print(f"=== END TIMING ANALYSIS ===\n")
+    logger.info(
+        "\n"
+        "=== LOCAL STT RESPONSE TIME ANALYSIS ===\n"
+        "Total Response Time: %.2fs\n"
+        "├─ GPT Generation: %.2fs (%.1f%%)\n"
+        "└─ TTS Generation: %.2fs (%.1f%%)\n"
+        "Audio file size: %s bytes\n"
+        "NOTE: STT was done locally on ESP32 (not measured here)\n"
+        "=== END TIMING ANALYSIS ===",
+        total_time,
+        gpt_time, gpt_time/total_time*100,
+        tts_time, tts_time/total_time*100,
+        file_size
+    )
 
     # Update session activity
     session_manager.update_session_activity(session_id, user_id)
 
     response = send_file(output_path, mimetype="audio/wav", as_attachment=False)
-    response.headers["Content-Length"] = str(file_size)
     response.headers["Connection"] = "keep-alive"
     response.headers["X-Response-Time"] = f"{total_time:.2f}"
     response.headers["X-GPT-Time"] = f"{gpt_time:.2f}"
@@ -702,7 +998,7 @@ def upload_text():
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route("/auth/test", methods=["GET"])
-@require_device_auth
+@require_device_auth(conditional=True)
 def test_auth():
     """
     Test endpoint to verify authentication is working
@@ -732,7 +1028,7 @@ def test_auth():
 
 
 @app.route("/device/info", methods=["GET"])
-@require_device_auth
+@require_device_auth(conditional=True)
 def get_device_info():
     """
     Get device/toy information including assigned child
@@ -756,14 +1052,40 @@ def get_device_info():
     auth_context = request.auth_context
     toy_data = auth_context.get('toy_data', {})
     user_id = auth_context.get('user_id')
+    toy_id = auth_context['toy_id']
 
     # Get assigned child ID
     assigned_child_id = toy_data.get('assignedChildId')
 
+    # Fetch the toy doc (the auth cache may hold a stale assignment) and the assigned
+    # child's doc through the short-TTL doc cache; misses share one get_all round-trip
+    child_data = None
+    child_error = None
+    if user_id and firestore_service.is_available():
+        try:
+            user_ref = firestore_service.db.collection("users").document(user_id)
+            toy_ref = user_ref.collection("toys").document(toy_id)
+            refs = [toy_ref]
+            if assigned_child_id:
+                refs.append(user_ref.collection("children").document(assigned_child_id))
+
+            docs = firestore_service.get_documents_cached(refs)
+            if docs.get(toy_ref.path) is not None:
+                toy_data = docs[toy_ref.path]
+
+            # Assignment may have changed since auth was cached - a cache hit if it didn't
+            assigned_child_id = toy_data.get('assignedChildId')
+            if assigned_child_id:
+                child_data = firestore_service.get_child_cached(user_id, assigned_child_id)
+
+        except Exception as e:
+            logger.error("Failed to fetch device info: %s", e)
+            child_error = "Could not fetch child details"
+
     # Build response
     response_data = {
         "success": True,
-        "toyId": auth_context['toy_id'],
+        "toyId": toy_id,
         "toyName": toy_data.get('name', 'Unknown Toy'),
         "assignedChildId": assigned_child_id,
         "toySettings": {
@@ -779,44 +1101,80 @@ def get_device_info():
         }
     }
 
-    # If toy is assigned to a child, fetch child details
+    # If toy is assigned to a child, include child details
     if assigned_child_id and user_id:
-        try:
-            child_doc = firestore_service.db.collection("users").document(user_id)\
-                .collection("children").document(assigned_child_id).get()
-
-            if child_doc.exists:
-                child_data = child_doc.to_dict()
-                response_data["childName"] = child_data.get('name', 'Unknown Child')
-                response_data["childAvatar"] = child_data.get('avatar', '🧒')
-
-                # Include parental control settings that ESP32 might need
-                response_data["parentalControls"] = {
-                    "dailyLimitHours": child_data.get('dailyLimitHours', 2),
-                    "quietHoursEnabled": child_data.get('quietHoursEnabled', False),
-                    "contentFilterEnabled": child_data.get('contentFilterEnabled', True)
-                }
-            else:
-                response_data["childName"] = None
-                response_data["warning"] = "Toy is assigned but child not found"
-
-        except Exception as e:
-            print(f"[ERROR] Failed to fetch child info: {str(e)}")
+        if child_data is not None:
+            response_data["childName"] = child_data.get('name', 'Unknown Child')
+            response_data["childAvatar"] = child_data.get('avatar', '🧒')
+
+            # Include parental control settings that ESP32 might need
+            response_data["parentalControls"] = {
+                "dailyLimitHours": child_data.get('dailyLimitHours', 2),
+                "quietHoursEnabled": child_data.get('quietHoursEnabled', False),
+                "contentFilterEnabled": child_data.get('contentFilterEnabled', True)
+            }
+        else:
             response_data["childName"] = None
-            response_data["warning"] = "Could not fetch child details"
+            response_data["warning"] = child_error or "Toy is assigned but child not found"
     else:
         # Toy not assigned to any child yet
         response_data["childName"] = None
         response_data["assignedChildId"] = None
         response_data["warning"] = "Toy not assigned to any child yet"
 
-    print(f"[INFO] Device info fetched for toy {auth_context['toy_id']}, assigned to child: {assigned_child_id}")
+    logger.info("Device info fetched for toy %s, assigned to child: %s", toy_id, assigned_child_id)
 
     return jsonify(response_data), 200
 
 
 # ==================== CONVERSATION MANAGEMENT ROUTES ====================
 
+# Largest page any paginated listing returns, whatever ?limit= asks for
+PAGE_LIMIT_MAX = 100
+
+
+def _next_cursor(items, limit, id_field):
+    """Cursor for the next page: the last item's ID when the page came back full"""
+    if items and len(items) >= limit:
+        return items[-1][id_field]
+    return None
+
+
+def _page_limit(default):
+    """
+    Parse ?limit=N for a paginated listing, clamped to 1..PAGE_LIMIT_MAX
+
+    Raises:
+        ValueError: If limit is not an integer
+    """
+    raw_limit = request.args.get('limit', default)
+    try:
+        limit = int(raw_limit)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid limit: {raw_limit}")
+    return max(1, min(limit, PAGE_LIMIT_MAX))
+
+
+def _paginate(query, collection_ref):
+    """
+    Apply ?cursor=<docId>&limit=N to a subcollection query
+
+    Returns:
+        tuple: (query, limit)
+
+    Raises:
+        ValueError: If limit is not an integer or cursor is not a document ID
+    """
+    limit = _page_limit(50)
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor_doc = collection_ref.document(cursor).get()
+        if not cursor_doc.exists:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        query = query.start_after(cursor_doc)
+    return query.limit(limit), limit
+
+
 @app.route("/api/conversations/end", methods=["POST"])
 def end_conversation():
     """
@@ -827,7 +1185,8 @@ def end_conversation():
     - OR toy_id + user_id: To lookup active session
     """
     try:
-        data = request.get_json()
+        # Non-JSON or empty bodies fall through to the 400s below instead of a 500
+        data = request.get_json(cache=True, silent=True) or {}
         session_id = data.get('session_id')
         toy_id = data.get('toy_id')
         user_id = data.get('user_id')
@@ -842,8 +1201,10 @@ def end_conversation():
             return jsonify({"error": "session_id (or toy_id + user_id) is required"}), 400
 
         # Get user_id for session if not provided
-        if not user_id and session_id in ACTIVE_CONVERSATIONS:
-            user_id = ACTIVE_CONVERSATIONS[session_id].get('user_id')
+        # Single atomic lookup - the session may be ended concurrently by the expiry scheduler
+        if not user_id:
+            session = ACTIVE_CONVERSATIONS.get(session_id)
+            user_id = session.get('user_id') if session else None
 
         if not user_id:
             return jsonify({"error": "Could not determine user_id for session"}), 400
@@ -856,12 +1217,12 @@ def end_conversation():
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to end conversation: {e}")
+        logger.error("Failed to end conversation: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/conversations/<conversation_id>", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_conversation(conversation_id):
     """
     Get conversation details (UNIFIED SCHEMA) - requires authentication
@@ -875,11 +1236,6 @@ def get_conversation(conversation_id):
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is requesting their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only access your own conversations"}), 403
-
         conversation = firestore_service.get_conversation(user_id, conversation_id)
 
         if not conversation:
@@ -891,12 +1247,12 @@ def get_conversation(conversation_id):
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to get conversation: {e}")
+        logger.error("Failed to get conversation: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/conversations/<conversation_id>/messages", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_conversation_messages(conversation_id):
     """
     Get messages for a conversation (UNIFIED SCHEMA) - requires authentication
@@ -904,36 +1260,39 @@ def get_conversation_messages(conversation_id):
     Query params:
         user_id: Parent user ID
         limit: Max number of messages (default: 100)
+        cursor: nextCursor from the previous page - the ID of the oldest message
+                returned so far (returns the messages before it)
     """
     try:
         user_id = request.args.get('user_id')
-        limit = int(request.args.get('limit', 100))
+        limit = _page_limit(100)
+        cursor = request.args.get('cursor')
 
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is requesting their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only access your own conversations"}), 403
-
-        messages = firestore_service.get_conversation_messages(
-            user_id, conversation_id, limit
+        messages, next_cursor = firestore_service.get_conversation_messages_page(
+            user_id, conversation_id, limit, cursor
         )
 
         return jsonify({
             "success": True,
             "messages": messages,
-            "count": len(messages)
+            "count": len(messages),
+            "nextCursor": next_cursor
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a message ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to get conversation messages: {e}")
+        logger.error("Failed to get conversation messages: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/children/<child_id>/conversations", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_child_conversations(child_id):
     """
     Get conversations for a child - requires authentication
@@ -941,34 +1300,36 @@ def get_child_conversations(child_id):
     Query params:
         user_id: Parent user ID
         limit: Max number of conversations (default: 50)
+        cursor: nextCursor from the previous page
     """
     try:
         user_id = request.args.get('user_id')
-        limit = int(request.args.get('limit', 50))
+        limit = _page_limit(50)
+        cursor = request.args.get('cursor')
 
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is requesting their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only access your own data"}), 403
-
-        conversations = firestore_service.get_child_conversations(user_id, child_id, limit)
+        conversations = firestore_service.get_child_conversations(user_id, child_id, limit, cursor)
 
         return jsonify({
             "success": True,
             "conversations": conversations,
-            "count": len(conversations)
+            "count": len(conversations),
+            "nextCursor": _next_cursor(conversations, limit, 'id')
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a conversation ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to get child conversations: {e}")
+        logger.error("Failed to get child conversations: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/conversations/active", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_active_conversations():
     """
     Get all active conversations across all children - requires authentication
@@ -976,34 +1337,36 @@ def get_active_conversations():
     Query params:
         user_id: Parent user ID
         limit: Max number of conversations (default: 20)
+        cursor: nextCursor from the previous page
     """
     try:
         user_id = request.args.get('user_id')
-        limit = int(request.args.get('limit', 20))
+        limit = _page_limit(20)
+        cursor = request.args.get('cursor')
 
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is requesting their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only access your own data"}), 403
-
-        conversations = firestore_service.get_active_conversations(user_id, limit)
+        conversations = firestore_service.get_active_conversations(user_id, limit, cursor)
 
         return jsonify({
             "success": True,
             "conversations": conversations,
-            "count": len(conversations)
+            "count": len(conversations),
+            "nextCursor": _next_cursor(conversations, limit, 'id')
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a conversation ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to get active conversations: {e}")
+        logger.error("Failed to get active conversations: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/conversations/flagged", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_flagged_conversations():
     """
     Get all flagged conversations - requires authentication
@@ -1011,34 +1374,36 @@ def get_flagged_conversations():
     Query params:
         user_id: Parent user ID
         limit: Max number of conversations (default: 50)
+        cursor: nextCursor from the previous page
     """
     try:
         user_id = request.args.get('user_id')
-        limit = int(request.args.get('limit', 50))
+        limit = _page_limit(50)
+        cursor = request.args.get('cursor')
 
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is requesting their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only access your own data"}), 403
-
-        conversations = firestore_service.get_flagged_conversations(user_id, limit)
+        conversations = firestore_service.get_flagged_conversations(user_id, limit, cursor)
 
         return jsonify({
             "success": True,
             "conversations": conversations,
-            "count": len(conversations)
+            "count": len(conversations),
+            "nextCursor": _next_cursor(conversations, limit, 'id')
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a conversation ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to get flagged conversations: {e}")
+        logger.error("Failed to get flagged conversations: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/conversations/<conversation_id>/flag", methods=["PUT"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def flag_conversation(conversation_id):
     """
     Flag or unflag a conversation - requires authentication
@@ -1050,25 +1415,26 @@ def flag_conversation(conversation_id):
     }
     """
     try:
-        data = request.get_json()
+        # Already parsed (and cached) by require_device_auth's user check
+        data = request.get_json(cache=True, silent=True) or {}
         user_id = data.get('user_id')
         flag_status = data.get('flag_status', 'reviewed')
 
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
 
-        # Verify the authenticated user is modifying their own data
-        auth_user_id = request.auth_context.get('user_id')
-        if auth_user_id != user_id:
-            return jsonify({"error": "Unauthorized - can only modify your own data"}), 403
-
         # NEW LOCATION: conversations directly under user
         conversation_ref = firestore_service.db.collection("users").document(user_id)\
             .collection("conversations").document(conversation_id)
 
-        conversation_ref.update({
-            "flagStatus": flag_status,
-        })
+        # Written inline - update() fails on a missing conversation, so an unknown
+        # ID gets a 404 rather than a false success
+        try:
+            conversation_ref.update({
+                "flagStatus": flag_status,
+            })
+        except NotFound:
+            return jsonify({"error": "Conversation not found"}), 404
 
         return jsonify({
             "success": True,
@@ -1076,41 +1442,127 @@ def flag_conversation(conversation_id):
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to update conversation flag: {e}")
+        logger.error("Failed to update conversation flag: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+# Static fields for simulator setup docs, built once at import. Per-call values
+# (IDs, names, timestamps) are merged in by the handlers. Nested dicts stay plain
+# dicts (the Firestore encoder rejects mapping proxies) and must be treated as
+# read-only.
+CHILD_DEFAULTS = MappingProxyType({
+    "birthDate": "01/01/2015",
+    "avatar": "🧒",
+    "ageLevel": "elementary",
+    "dailyLimitHours": 2,
+    "contentFilterEnabled": True,
+    "quietHoursEnabled": False,
+    "dailyLimitEnabled": True,
+    "creativeModeEnabled": True,
+    "recordConversations": True,
+    "blockedTopics": {
+        "violence": True,
+        "matureContent": True,
+        "politics": False,
+        "religion": False,
+        "personalInfo": True
+    },
+    "alertTypes": {
+        "personalInfo": True,
+        "inappropriateContent": True,
+        "emotionalDistress": True,
+        "unusualPatterns": True
+    },
+    "alertSensitivity": "Medium"
+})
+
+TOY_DEFAULTS = MappingProxyType({
+    "emoji": "🦄",
+    "status": "online",
+    "batteryLevel": 100,
+    "model": "Luno Simulator",
+    "firmwareVersion": "v1.0.0",
+    "volume": 70,
+    "ledBrightness": "Medium",
+    "soundEffects": True,
+    "voiceType": "Female, Child-friendly",
+    "autoUpdate": True,
+    "connectionType": "Wi-Fi",
+    "wifiNetwork": "Simulator-Network"
+})
+
+
+RequiredStr = Annotated[str, StringConstraints(min_length=1)]
+
+
+class CreateAccountRequest(BaseModel):
+    """Body of POST /api/setup/create_account"""
+    user_id: RequiredStr
+    email: RequiredStr
+    display_name: RequiredStr
+    child_id: RequiredStr
+    child_name: RequiredStr
+    toy_id: RequiredStr
+    toy_name: RequiredStr
+
+
+class AddToyRequest(BaseModel):
+    """Body of POST /api/setup/add_toy"""
+    user_id: RequiredStr
+    toy_id: RequiredStr
+    toy_name: RequiredStr
+    assigned_child_id: Optional[str] = None
+
+
+def _parse_body(model, error_message):
+    """
+    Parse and validate the JSON body in one pass (pydantic's Rust core)
+
+    Returns (parsed, None) or (None, 400 response naming the offending fields).
+    """
+    try:
+        return model.model_validate_json(request.get_data() or b"{}"), None
+    except ValidationError as e:
+        fields = [".".join(str(part) for part in err["loc"]) for err in e.errors() if err["loc"]]
+        if not fields:
+            return None, (jsonify({"error": "Invalid JSON body"}), 400)
+        return None, (jsonify({"error": error_message, "fields": fields}), 400)
+
+
 @app.route("/api/setup/create_account", methods=["POST"])
 def create_account():
     """Create a complete test account (user + child + toy)"""
     try:
-        data = request.get_json()
-
-        user_id = data.get('user_id')
-        email = data.get('email')
-        display_name = data.get('display_name')
-        child_id = data.get('child_id')
-        child_name = data.get('child_name')
-        toy_id = data.get('toy_id')
-        toy_name = data.get('toy_name')
-
-        if not all([user_id, email, display_name, child_id, child_name, toy_id, toy_name]):
-            return jsonify({"error": "Missing required fields"}), 400
+        req, error = _parse_body(CreateAccountRequest, "Missing required fields")
+        if error:
+            return error
+
+        user_id = req.user_id
+        email = req.email
+        display_name = req.display_name
+        child_id = req.child_id
+        child_name = req.child_name
+        toy_id = req.toy_id
+        toy_name = req.toy_name
 
         if not firestore_service or not firestore_service.is_available():
             error_msg = "Firestore not initialized. Please set up Firebase credentials. See FIRESTORE_INTEGRATION_GUIDE.md for setup instructions."
-            print(f"[ERROR] {error_msg}")
+            logger.error(error_msg)
             return jsonify({
                 "error": error_msg,
                 "hint": "Run: python3 setup_test_data.py to initialize Firestore with test data"
             }), 503
 
+        # Client-side timestamp shared by all three docs - avoids a server-side
+        # transform per field in the batch commit
+        now = datetime.datetime.now(datetime.timezone.utc)
+
         # Create user
         user_data = {
             "uid": user_id,
             "email": email,
             "displayName": display_name,
-            "createdAt": firestore.SERVER_TIMESTAMP,
+            "createdAt": now,
             "onboardingCompleted": True,
             "preferences": {
                 "notifications": True,
@@ -1125,66 +1577,42 @@ def create_account():
             }
         }
 
-        firestore_service.db.collection("users").document(user_id).set(user_data)
-        print(f"[SETUP] Created user: {user_id} ({email})")
+        user_ref = firestore_service.db.collection("users").document(user_id)
 
         # Create child
         child_data = {
+            **CHILD_DEFAULTS,
             "name": child_name,
-            "birthDate": "01/01/2015",
-            "avatar": "🧒",
-            "ageLevel": "elementary",
-            "dailyLimitHours": 2,
-            "createdAt": firestore.SERVER_TIMESTAMP,
-            "contentFilterEnabled": True,
-            "quietHoursEnabled": False,
-            "dailyLimitEnabled": True,
-            "creativeModeEnabled": True,
-            "recordConversations": True,
-            "blockedTopics": {
-                "violence": True,
-                "matureContent": True,
-                "politics": False,
-                "religion": False,
-                "personalInfo": True
-            },
-            "alertTypes": {
-                "personalInfo": True,
-                "inappropriateContent": True,
-                "emotionalDistress": True,
-                "unusualPatterns": True
-            },
-            "alertSensitivity": "Medium"
+            "createdAt": now,
         }
 
-        firestore_service.db.collection("users").document(user_id)\
-            .collection("children").document(child_id).set(child_data)
-        print(f"[SETUP] Created child: {child_id} ({child_name})")
+        child_ref = user_ref.collection("children").document(child_id)
 
         # Create toy
         toy_data = {
+            **TOY_DEFAULTS,
             "name": toy_name,
-            "emoji": "🦄",
             "assignedChildId": child_id,
-            "pairedAt": firestore.SERVER_TIMESTAMP,
-            "status": "online",
-            "batteryLevel": 100,
-            "lastConnected": firestore.SERVER_TIMESTAMP,
-            "model": "Luno Simulator",
+            "pairedAt": now,
+            "lastConnected": now,
             "serialNumber": f"SIM-{toy_id}",
-            "firmwareVersion": "v1.0.0",
-            "volume": 70,
-            "ledBrightness": "Medium",
-            "soundEffects": True,
-            "voiceType": "Female, Child-friendly",
-            "autoUpdate": True,
-            "connectionType": "Wi-Fi",
-            "wifiNetwork": "Simulator-Network"
         }
 
-        firestore_service.db.collection("users").document(user_id)\
-            .collection("toys").document(toy_id).set(toy_data)
-        print(f"[SETUP] Created toy: {toy_id} ({toy_name})")
+        toy_ref = user_ref.collection("toys").document(toy_id)
+
+        # Write user + child + toy atomically in one commit (1 RPC instead of 3)
+        batch = firestore_service.db.batch()
+        batch.set(user_ref, user_data)
+        batch.set(child_ref, child_data)
+        batch.set(toy_ref, toy_data)
+        batch.set(firestore_service.email_lookup_ref(email), {"user_id": user_id})
+        batch.commit()
+        firestore_service.invalidate_cached_docs(user_ref, child_ref, toy_ref)
+        clear_negative_cache(toy_id)
+
+        logger.info("[SETUP] Created user: %s (%s)", user_id, email)
+        logger.info("[SETUP] Created child: %s (%s)", child_id, child_name)
+        logger.info("[SETUP] Created toy: %s (%s)", toy_id, toy_name)
 
         return jsonify({
             "success": True,
@@ -1195,7 +1623,7 @@ def create_account():
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to create account: {e}")
+        logger.error("Failed to create account: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -1203,51 +1631,43 @@ def create_account():
 def add_toy():
     """Add a toy to an existing user account"""
     try:
-        data = request.get_json()
-
-        user_id = data.get('user_id')
-        toy_id = data.get('toy_id')
-        toy_name = data.get('toy_name')
-        assigned_child_id = data.get('assigned_child_id')
+        req, error = _parse_body(AddToyRequest, "Missing required fields (user_id, toy_id, toy_name)")
+        if error:
+            return error
 
-        if not all([user_id, toy_id, toy_name]):
-            return jsonify({"error": "Missing required fields (user_id, toy_id, toy_name)"}), 400
+        user_id = req.user_id
+        toy_id = req.toy_id
+        toy_name = req.toy_name
+        assigned_child_id = req.assigned_child_id
 
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
 
-        # Verify user exists
+        # Verify user exists - through the doc cache, so repeated add_toy calls for
+        # the same account skip the read
         user_ref = firestore_service.db.collection("users").document(user_id)
-        user_doc = user_ref.get()
-
-        if not user_doc.exists:
+        if firestore_service.get_documents_cached([user_ref]).get(user_ref.path) is None:
             return jsonify({"error": f"User {user_id} not found"}), 404
 
+        now = datetime.datetime.now(datetime.timezone.utc)
+
         # Create toy
         toy_data = {
+            **TOY_DEFAULTS,
             "name": toy_name,
-            "emoji": "🦄",
             "assignedChildId": assigned_child_id,
-            "pairedAt": firestore.SERVER_TIMESTAMP,
-            "status": "online",
-            "batteryLevel": 100,
-            "lastConnected": firestore.SERVER_TIMESTAMP,
-            "model": "Luno Simulator",
+            "pairedAt": now,
+            "lastConnected": now,
             "serialNumber": f"SIM-{toy_id}",
-            "firmwareVersion": "v1.0.0",
-            "volume": 70,
-            "ledBrightness": "Medium",
-            "soundEffects": True,
-            "voiceType": "Female, Child-friendly",
-            "autoUpdate": True,
-            "connectionType": "Wi-Fi",
-            "wifiNetwork": "Simulator-Network"
         }
 
-        firestore_service.db.collection("users").document(user_id)\
-            .collection("toys").document(toy_id).set(toy_data)
+        toy_ref = firestore_service.db.collection("users").document(user_id)\
+            .collection("toys").document(toy_id)
+        toy_ref.set(toy_data)
+        firestore_service.invalidate_cached_docs(toy_ref)
+        clear_negative_cache(toy_id)
 
-        print(f"[SETUP] Added toy {toy_id} ({toy_name}) to user {user_id}")
+        logger.info("[SETUP] Added toy %s (%s) to user %s", toy_id, toy_name, user_id)
 
         return jsonify({
             "success": True,
@@ -1257,19 +1677,14 @@ def add_toy():
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to add toy: {e}")
+        logger.error("Failed to add toy: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/users/<user_id>/stats", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def get_user_stats(user_id):
     """Get user statistics - requires authentication"""
-    # Verify the authenticated user is requesting their own data
-    auth_user_id = request.auth_context.get('user_id')
-    if auth_user_id != user_id:
-        return jsonify({"error": "Unauthorized - can only access your own stats"}), 403
-
     try:
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
@@ -1289,7 +1704,7 @@ def get_user_stats(user_id):
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to get user stats: {e}")
+        logger.error("Failed to get user stats: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -1301,15 +1716,15 @@ def list_users():
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
 
-        # Only return the authenticated user's data
+        # Only return the authenticated user's data - auth already read the user
+        # doc, so reuse it rather than paying another point read
         auth_user_id = request.auth_context.get('user_id')
-        user_ref = firestore_service.db.collection("users").document(auth_user_id)
-        user_doc = user_ref.get()
-
-        if not user_doc.exists:
-            return jsonify({"error": "User not found"}), 404
-
-        user_data = user_doc.to_dict()
+        user_data = request.auth_context.get('user_data')
+        if user_data is None:
+            user_doc = firestore_service.db.collection("users").document(auth_user_id).get()
+            if not user_doc.exists:
+                return jsonify({"error": "User not found"}), 404
+            user_data = user_doc.to_dict()
         users = [{
             "userId": auth_user_id,
             "email": user_data.get('email', 'N/A'),
@@ -1323,25 +1738,28 @@ def list_users():
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to get user: {e}")
+        logger.error("Failed to get user: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/users/<user_id>/children", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def list_children(user_id):
-    """List children for a specific user - requires authentication"""
-    # Verify the authenticated user is requesting their own data
-    auth_user_id = request.auth_context.get('user_id')
-    if auth_user_id != user_id:
-        return jsonify({"error": "Unauthorized - can only access your own children"}), 403
+    """
+    List children for a specific user - requires authentication
 
+    Query params:
+        limit: Max number of children (default: 50)
+        cursor: nextCursor from the previous page
+    """
     try:
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
 
         children_ref = firestore_service.db.collection("users").document(user_id).collection("children")
-        children_docs = children_ref.stream()
+        # Project only the fields the response uses
+        children_query, limit = _paginate(children_ref.select(['name', 'avatar', 'ageLevel']), children_ref)
+        children_docs = children_query.stream()
 
         children = []
         for doc in children_docs:
@@ -1356,29 +1774,37 @@ def list_children(user_id):
         return jsonify({
             "success": True,
             "children": children,
-            "count": len(children)
+            "count": len(children),
+            "nextCursor": _next_cursor(children, limit, 'childId')
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a child ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to list children: {e}")
+        logger.error("Failed to list children: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/users/<user_id>/toys", methods=["GET"])
-@require_device_auth
+@require_device_auth(enforce_user_match=True)
 def list_toys(user_id):
-    """List toys for a specific user - requires authentication"""
-    # Verify the authenticated user is requesting their own data
-    auth_user_id = request.auth_context.get('user_id')
-    if auth_user_id != user_id:
-        return jsonify({"error": "Unauthorized - can only access your own toys"}), 403
+    """
+    List toys for a specific user - requires authentication
 
+    Query params:
+        limit: Max number of toys (default: 50)
+        cursor: nextCursor from the previous page
+    """
     try:
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
 
         toys_ref = firestore_service.db.collection("users").document(user_id).collection("toys")
-        toys_docs = toys_ref.stream()
+        # Project only the fields the response uses
+        toys_query, limit = _paginate(toys_ref.select(['name', 'emoji', 'assignedChildId', 'status']), toys_ref)
+        toys_docs = toys_query.stream()
 
         toys = []
         for doc in toys_docs:
@@ -1394,11 +1820,16 @@ def list_toys(user_id):
         return jsonify({
             "success": True,
             "toys": toys,
-            "count": len(toys)
+            "count": len(toys),
+            "nextCursor": _next_cursor(toys, limit, 'toyId')
         }), 200
 
+    except ValueError as e:
+        # Non-numeric limit or a cursor that isn't a toy ID
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
-        print(f"[ERROR] Failed to list toys: {e}")
+        logger.error("Failed to list toys: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -1413,8 +1844,9 @@ def simulator_list_users():
         if not firestore_service.is_available():
             return jsonify({"error": "Firestore not available"}), 503
 
+        # Project only the fields the response uses
         users_ref = firestore_service.db.collection("users")
-        users_docs = users_ref.stream()
+        users_docs = users_ref.select(['email', 'displayName']).stream()
 
         users = []
         for doc in users_docs:
@@ -1432,7 +1864,7 @@ def simulator_list_users():
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to list users: {e}")
+        logger.error("Failed to list users: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -1444,17 +1876,9 @@ def simulator_list_children(user_id):
             return jsonify({"error": "Firestore not available"}), 503
 
         children_ref = firestore_service.db.collection("users").document(user_id).collection("children")
-        children_docs = children_ref.stream()
+        children_docs = children_ref.select(SIMULATOR_CHILD_FIELDS).stream()
 
-        children = []
-        for doc in children_docs:
-            child_data = doc.to_dict()
-            children.append({
-                "childId": doc.id,
-                "name": child_data.get('name', 'N/A'),
-                "avatar": child_data.get('avatar', '🧒'),
-                "ageLevel": child_data.get('ageLevel', 'N/A')
-            })
+        children = [_simulator_child_summary(doc) for doc in children_docs]
 
         return jsonify({
             "success": True,
@@ -1463,7 +1887,7 @@ def simulator_list_children(user_id):
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to list children: {e}")
+        logger.error("Failed to list children: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -1475,18 +1899,9 @@ def simulator_list_toys(user_id):
             return jsonify({"error": "Firestore not available"}), 503
 
         toys_ref = firestore_service.db.collection("users").document(user_id).collection("toys")
-        toys_docs = toys_ref.stream()
+        toys_docs = toys_ref.select(SIMULATOR_TOY_FIELDS).stream()
 
-        toys = []
-        for doc in toys_docs:
-            toy_data = doc.to_dict()
-            toys.append({
-                "toyId": doc.id,
-                "name": toy_data.get('name', 'N/A'),
-                "emoji": toy_data.get('emoji', '🦄'),
-                "assignedChildId": toy_data.get('assignedChildId'),
-                "status": toy_data.get('status', 'offline')
-            })
+        toys = [_simulator_toy_summary(doc) for doc in toys_docs]
 
         return jsonify({
             "success": True,
@@ -1495,10 +1910,68 @@ def simulator_list_toys(user_id):
         }), 200
 
     except Exception as e:
-        print(f"[ERROR] Failed to list toys: {e}")
+        logger.error("Failed to list toys: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/simulator/users/<user_id>/overview", methods=["GET"])
+def simulator_user_overview(user_id):
+    """
+    List a user's children and toys in one call (SIMULATOR ONLY - No auth required)
+
+    The two subcollection streams run concurrently, so this costs one round-trip
+    instead of the two sequential /children + /toys calls.
+    """
+    try:
+        if not firestore_service.is_available():
+            return jsonify({"error": "Firestore not available"}), 503
+
+        user_ref = firestore_service.db.collection("users").document(user_id)
+        children_query = user_ref.collection("children").select(SIMULATOR_CHILD_FIELDS)
+        toys_query = user_ref.collection("toys").select(SIMULATOR_TOY_FIELDS)
+        children_future = FIRESTORE_POOL.submit(lambda: list(children_query.stream()))
+        toys_future = FIRESTORE_POOL.submit(lambda: list(toys_query.stream()))
+
+        children = [_simulator_child_summary(doc) for doc in children_future.result()]
+        toys = [_simulator_toy_summary(doc) for doc in toys_future.result()]
+
+        return jsonify({
+            "success": True,
+            "children": {"success": True, "children": children, "count": len(children)},
+            "toys": {"success": True, "toys": toys, "count": len(toys)}
+        }), 200
+
+    except Exception as e:
+        logger.error("Failed to get user overview: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+# Fields the simulator summaries read - list queries project to just these
+SIMULATOR_CHILD_FIELDS = ['name', 'avatar', 'ageLevel']
+SIMULATOR_TOY_FIELDS = ['name', 'emoji', 'assignedChildId', 'status']
+
+
+def _simulator_child_summary(doc):
+    child_data = doc.to_dict()
+    return {
+        "childId": doc.id,
+        "name": child_data.get('name', 'N/A'),
+        "avatar": child_data.get('avatar', '🧒'),
+        "ageLevel": child_data.get('ageLevel', 'N/A')
+    }
+
+
+def _simulator_toy_summary(doc):
+    toy_data = doc.to_dict()
+    return {
+        "toyId": doc.id,
+        "name": toy_data.get('name', 'N/A'),
+        "emoji": toy_data.get('emoji', '🦄'),
+        "assignedChildId": toy_data.get('assignedChildId'),
+        "status": toy_data.get('status', 'offline')
+    }
+
+
 @app.route("/api/simulator/children/<child_id>/knowledge/graph", methods=["GET"])
 def simulator_get_knowledge_graph(child_id):
     """
@@ -1510,12 +1983,9 @@ def simulator_get_knowledge_graph(child_id):
     - entityTypes: comma-separated types (default: all)
     - edgeTypes: comma-separated edge types (default: all)
     - minWeight: 0.0-1.0 (default: 0.3)
-    - limit: max nodes (default: 50)
+    - limit: max nodes (default: 50); at most limit^2 links, heaviest first
     """
     try:
-        from knowledge_graph_service import knowledge_graph_service
-        from datetime import datetime, timedelta
-
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
@@ -1530,72 +2000,59 @@ def simulator_get_knowledge_graph(child_id):
         entity_types = [t.strip() for t in entity_types_param.split(',') if t.strip()] if entity_types_param else None
         edge_types = [t.strip() for t in edge_types_param.split(',') if t.strip()] if edge_types_param else None
 
+        cache_key = ('simulator_graph', user_id, child_id,
+                     knowledge_graph_service.get_graph_version(user_id, child_id),
+                     time_range, tuple(entity_types or ()), tuple(edge_types or ()), min_weight, limit)
+        payload = _graph_cache_get(cache_key)
+        if payload is not None:
+            return jsonify(payload), 200
+
         # Get entities with filters
         query_filter = {"limit": limit}
-        if entity_types and len(entity_types) == 1:
-            query_filter["type"] = entity_types[0]
+        if entity_types:
+            query_filter["types"] = entity_types
 
         entities = knowledge_graph_service.get_entities(user_id, child_id, query_filter)
 
-        # Apply time filter if needed
+        # Apply time filter if needed - compare epoch seconds (Firestore returns tz-aware
+        # datetimes, which can't be compared against a naive utcnow())
         if time_range != 'all_time':
-            cutoff_date = datetime.utcnow()
-            if time_range == 'last_week':
-                cutoff_date -= timedelta(days=7)
-            elif time_range == 'last_month':
-                cutoff_date -= timedelta(days=30)
-
+            cutoff_ts = time.time() - TIME_RANGE_SECONDS.get(time_range, 0)
             entities = [e for e in entities
-                       if e.get('lastMentionedAt') and e['lastMentionedAt'] > cutoff_date]
-
-        # Apply entity type filter (if multiple types)
-        if entity_types:
-            entities = [e for e in entities if e.get('type') in entity_types]
+                       if (t := e.get('lastMentionedAt')) is not None and t.timestamp() > cutoff_ts]
 
-        entity_ids = {e['id'] for e in entities}
+        entity_ids = frozenset(e['id'] for e in entities)
 
         # Get edges between these entities
         edges_ref = firestore_service.db.collection("users").document(user_id)\
             .collection("children").document(child_id)\
             .collection("edges")
 
-        all_edges = []
-        query = edges_ref.where("weight", ">=", min_weight)
-
-        for edge_doc in query.stream():
-            edge = edge_doc.to_dict()
-
-            # Check if both entities are in our set
-            if edge['sourceEntityId'] in entity_ids and edge['targetEntityId'] in entity_ids:
-                # Apply edge type filter
-                if not edge_types or edge['edgeType'] in edge_types:
-                    all_edges.append(edge)
+        # A graph of `limit` nodes can't usefully show more than limit^2 links
+        max_links = limit * limit
+        all_edges = _query_edges_filtered(edges_ref, entity_ids, min_weight, edge_types, max_links)
 
         # Convert to D3 format
-        nodes = []
-        for idx, entity in enumerate(entities):
-            nodes.append({
-                'id': entity['id'],
-                'name': entity['name'],
-                'type': entity['type'],
-                'strength': entity.get('strength', 0),
-                'mentionCount': entity.get('mentionCount', 0),
-                'group': _get_node_group(entity['type']),
-                'centrality': entity.get('centrality', 0),
-                'cluster': entity.get('clusterId')
-            })
-
-        links = []
-        for edge in all_edges:
-            links.append({
-                'source': edge['sourceEntityId'],
-                'target': edge['targetEntityId'],
-                'type': edge['edgeType'],
-                'weight': edge['weight'],
-                'value': edge['weight'] * 10
-            })
-
-        return jsonify({
+        nodes = [{
+            'id': entity['id'],
+            'name': entity['name'],
+            'type': entity['type'],
+            'strength': entity.get('strength', 0),
+            'mentionCount': entity.get('mentionCount', 0),
+            'group': NODE_GROUP_BY_TYPE.get(entity['type'], 0),
+            'centrality': entity.get('centrality', 0),
+            'cluster': entity.get('clusterId')
+        } for entity in entities]
+
+        links = [{
+            'source': edge['sourceEntityId'],
+            'target': edge['targetEntityId'],
+            'type': edge['edgeType'],
+            'weight': edge['weight'],
+            'value': edge['weight'] * 10
+        } for edge in all_edges]
+
+        payload = {
             'success': True,
             'graph': {
                 'nodes': nodes,
@@ -1611,10 +2068,12 @@ def simulator_get_knowledge_graph(child_id):
                     }
                 }
             }
-        }), 200
+        }
+        _graph_cache_put(cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
-        logger.error(f"Failed to get simulator graph visualization: {e}", exc_info=True)
+        logger.error("Failed to get simulator graph visualization: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1630,7 +2089,6 @@ def get_child_knowledge_summary(child_id):
     """
     try:
         user_id = get_current_user_id()
-        from knowledge_graph_service import knowledge_graph_service
 
         summary = knowledge_graph_service.get_summary(user_id, child_id)
 
@@ -1640,7 +2098,7 @@ def get_child_knowledge_summary(child_id):
         return jsonify({"success": True, "summary": summary}), 200
 
     except Exception as e:
-        logger.error(f"Failed to get knowledge summary: {e}", exc_info=True)
+        logger.error("Failed to get knowledge summary: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1665,13 +2123,12 @@ def get_child_entities(child_id):
             "orderBy": request.args.get("orderBy", "strength")
         }
 
-        from knowledge_graph_service import knowledge_graph_service
         entities = knowledge_graph_service.get_entities(user_id, child_id, filters)
 
         return jsonify({"success": True, "entities": entities, "count": len(entities)}), 200
 
     except Exception as e:
-        logger.error(f"Failed to get entities: {e}", exc_info=True)
+        logger.error("Failed to get entities: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1706,7 +2163,7 @@ def get_child_observations(child_id):
         return jsonify({"success": True, "observations": observations, "count": len(observations)}), 200
 
     except Exception as e:
-        logger.error(f"Failed to get observations: {e}", exc_info=True)
+        logger.error("Failed to get observations: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1736,7 +2193,7 @@ def get_entity_details(child_id, entity_id):
         return jsonify({"success": True, "entity": entity_data}), 200
 
     except Exception as e:
-        logger.error(f"Failed to get entity details: {e}", exc_info=True)
+        logger.error("Failed to get entity details: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1755,16 +2212,12 @@ def get_knowledge_graph_visualization(child_id):
     - entityTypes: comma-separated types (default: all)
     - edgeTypes: comma-separated edge types (default: all)
     - minWeight: 0.0-1.0 (default: 0.5)
-    - limit: max nodes (default: 50)
+    - limit: max nodes (default: 50); at most limit^2 links, heaviest first
 
     Returns:
         JSON with graph data (nodes and links in D3.js format)
     """
     try:
-        from graph_query_service import GraphQueryService
-        from knowledge_graph_service import knowledge_graph_service
-        from datetime import datetime, timedelta
-
         user_id = g.user_id
 
         # Parse query parameters
@@ -1777,73 +2230,59 @@ def get_knowledge_graph_visualization(child_id):
         entity_types = [t.strip() for t in entity_types_param.split(',') if t.strip()] if entity_types_param else None
         edge_types = [t.strip() for t in edge_types_param.split(',') if t.strip()] if edge_types_param else None
 
+        cache_key = ('graph', user_id, child_id,
+                     knowledge_graph_service.get_graph_version(user_id, child_id),
+                     time_range, tuple(entity_types or ()), tuple(edge_types or ()), min_weight, limit)
+        payload = _graph_cache_get(cache_key)
+        if payload is not None:
+            return jsonify(payload), 200
+
         # Get entities with filters
         query_filter = {"limit": limit}
-        if entity_types and len(entity_types) == 1:
-            query_filter["type"] = entity_types[0]
+        if entity_types:
+            query_filter["types"] = entity_types
 
-        entities_result = knowledge_graph_service.get_entities(user_id, child_id, query_filter)
-        entities = entities_result.get('entities', [])
+        entities = knowledge_graph_service.get_entities(user_id, child_id, query_filter)
 
-        # Apply time filter if needed
+        # Apply time filter if needed - compare epoch seconds (Firestore returns tz-aware
+        # datetimes, which can't be compared against a naive utcnow())
         if time_range != 'all_time':
-            cutoff_date = datetime.utcnow()
-            if time_range == 'last_week':
-                cutoff_date -= timedelta(days=7)
-            elif time_range == 'last_month':
-                cutoff_date -= timedelta(days=30)
-
+            cutoff_ts = time.time() - TIME_RANGE_SECONDS.get(time_range, 0)
             entities = [e for e in entities
-                       if e.get('lastMentionedAt') and e['lastMentionedAt'] > cutoff_date]
-
-        # Apply entity type filter (if multiple types)
-        if entity_types:
-            entities = [e for e in entities if e.get('type') in entity_types]
+                       if (t := e.get('lastMentionedAt')) is not None and t.timestamp() > cutoff_ts]
 
-        entity_ids = {e['id'] for e in entities}
+        entity_ids = frozenset(e['id'] for e in entities)
 
         # Get edges between these entities
-        edges_ref = db.collection("users").document(user_id)\
+        edges_ref = firestore_service.db.collection("users").document(user_id)\
             .collection("children").document(child_id)\
             .collection("edges")
 
-        all_edges = []
-        query = edges_ref.where("weight", ">=", min_weight)
-
-        for edge_doc in query.stream():
-            edge = edge_doc.to_dict()
-
-            # Check if both entities are in our set
-            if edge['sourceEntityId'] in entity_ids and edge['targetEntityId'] in entity_ids:
-                # Apply edge type filter
-                if not edge_types or edge['edgeType'] in edge_types:
-                    all_edges.append(edge)
+        # A graph of `limit` nodes can't usefully show more than limit^2 links
+        max_links = limit * limit
+        all_edges = _query_edges_filtered(edges_ref, entity_ids, min_weight, edge_types, max_links)
 
         # Convert to D3 format
-        nodes = []
-        for idx, entity in enumerate(entities):
-            nodes.append({
-                'id': entity['id'],
-                'name': entity['name'],
-                'type': entity['type'],
-                'strength': entity.get('strength', 0),
-                'mentionCount': entity.get('mentionCount', 0),
-                'group': _get_node_group(entity['type']),  # For color coding
-                'centrality': entity.get('centrality', 0),
-                'cluster': entity.get('clusterId')
-            })
-
-        links = []
-        for edge in all_edges:
-            links.append({
-                'source': edge['sourceEntityId'],
-                'target': edge['targetEntityId'],
-                'type': edge['edgeType'],
-                'weight': edge['weight'],
-                'value': edge['weight'] * 10  # D3 link strength
-            })
-
-        return jsonify({
+        nodes = [{
+            'id': entity['id'],
+            'name': entity['name'],
+            'type': entity['type'],
+            'strength': entity.get('strength', 0),
+            'mentionCount': entity.get('mentionCount', 0),
+            'group': NODE_GROUP_BY_TYPE.get(entity['type'], 0),  # For color coding
+            'centrality': entity.get('centrality', 0),
+            'cluster': entity.get('clusterId')
+        } for entity in entities]
+
+        links = [{
+            'source': edge['sourceEntityId'],
+            'target': edge['targetEntityId'],
+            'type': edge['edgeType'],
+            'weight': edge['weight'],
+            'value': edge['weight'] * 10  # D3 link strength
+        } for edge in all_edges]
+
+        payload = {
             'success': True,
             'graph': {
                 'nodes': nodes,
@@ -1859,10 +2298,12 @@ def get_knowledge_graph_visualization(child_id):
                     }
                 }
             }
-        }), 200
+        }
+        _graph_cache_put(cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
-        logger.error(f"Failed to get graph visualization: {e}", exc_info=True)
+        logger.error("Failed to get graph visualization: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1883,8 +2324,6 @@ def get_knowledge_subgraph(child_id):
         JSON with subgraph in D3.js format
     """
     try:
-        from graph_query_service import GraphQueryService
-
         user_id = g.user_id
         data = request.json
 
@@ -1895,32 +2334,28 @@ def get_knowledge_subgraph(child_id):
         if not entity_ids:
             return jsonify({"success": False, "error": "entityIds required"}), 400
 
-        graph_service = GraphQueryService(db)
+        graph_service = GraphQueryService(firestore_service.db)
         subgraph = graph_service.extract_context_subgraph(
             user_id, child_id, entity_ids, max_nodes, depth
         )
 
         # Convert to D3 format
-        nodes = []
-        for entity in subgraph['entities']:
-            nodes.append({
-                'id': entity['id'],
-                'name': entity['name'],
-                'type': entity['type'],
-                'strength': entity.get('strength', 0),
-                'group': _get_node_group(entity['type']),
-                'isSeed': entity.get('isSeed', False)
-            })
-
-        links = []
-        for edge in subgraph['edges']:
-            links.append({
-                'source': edge['sourceEntityId'],
-                'target': edge['targetEntityId'],
-                'type': edge['edgeType'],
-                'weight': edge['weight'],
-                'value': edge['weight'] * 10
-            })
+        nodes = [{
+            'id': entity['id'],
+            'name': entity['name'],
+            'type': entity['type'],
+            'strength': entity.get('strength', 0),
+            'group': NODE_GROUP_BY_TYPE.get(entity['type'], 0),
+            'isSeed': entity.get('isSeed', False)
+        } for entity in subgraph['entities']]
+
+        links = [{
+            'source': edge['sourceEntityId'],
+            'target': edge['targetEntityId'],
+            'type': edge['edgeType'],
+            'weight': edge['weight'],
+            'value': edge['weight'] * 10
+        } for edge in subgraph['edges']]
 
         return jsonify({
             'success': True,
@@ -1935,7 +2370,7 @@ def get_knowledge_subgraph(child_id):
         }), 200
 
     except Exception as e:
-        logger.error(f"Failed to get subgraph: {e}", exc_info=True)
+        logger.error("Failed to get subgraph: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -1949,50 +2384,57 @@ def get_knowledge_clusters(child_id):
         JSON with cluster list, each containing entities and graph data
     """
     try:
-        from graph_query_service import GraphQueryService
-
         user_id = g.user_id
-        graph_service = GraphQueryService(db)
+
+        cache_key = ('clusters', user_id, child_id,
+                     knowledge_graph_service.get_graph_version(user_id, child_id))
+        payload = _graph_cache_get(cache_key)
+        if payload is not None:
+            return jsonify(payload), 200
+
+        graph_service = GraphQueryService(firestore_service.db)
 
         # Find clusters
         clusters = graph_service.find_interest_clusters(user_id, child_id, min_cluster_size=2)
 
-        # Build D3 graph for each cluster
-        result = []
-        for cluster in clusters:
-            cluster_entity_ids = [e['id'] for e in cluster['entities']]
+        # Fetch the co-occurrence edges once and bucket them into clusters in a single
+        # pass, instead of re-streaming the whole edge collection for every cluster
+        edges_ref = firestore_service.db.collection("users").document(user_id)\
+            .collection("children").document(child_id)\
+            .collection("edges")
 
-            # Get edges within cluster
-            edges_ref = db.collection("users").document(user_id)\
-                .collection("children").document(child_id)\
-                .collection("edges")
+        cluster_entity_sets = [{e['id'] for e in cluster['entities']} for cluster in clusters]
+        clusters_by_entity = {}
+        for idx, entity_set in enumerate(cluster_entity_sets):
+            for entity_id in entity_set:
+                clusters_by_entity.setdefault(entity_id, []).append(idx)
 
-            cluster_edges = []
+        edges_by_cluster = [[] for _ in clusters]
+        if clusters:
             for edge_doc in edges_ref.where("edgeType", "==", "temporal_cooccurrence").stream():
                 edge = edge_doc.to_dict()
-                if (edge['sourceEntityId'] in cluster_entity_ids and
-                    edge['targetEntityId'] in cluster_entity_ids):
-                    cluster_edges.append(edge)
+                for idx in clusters_by_entity.get(edge['sourceEntityId'], ()):
+                    if edge['targetEntityId'] in cluster_entity_sets[idx]:
+                        edges_by_cluster[idx].append(edge)
 
+        # Build D3 graph for each cluster
+        result = []
+        for cluster, cluster_edges in zip(clusters, edges_by_cluster):
             # Convert to D3 format
-            nodes = []
-            for entity in cluster['entities']:
-                nodes.append({
-                    'id': entity['id'],
-                    'name': entity['name'],
-                    'type': entity['type'],
-                    'strength': entity.get('strength', 0),
-                    'group': _get_node_group(entity['type'])
-                })
-
-            links = []
-            for edge in cluster_edges:
-                links.append({
-                    'source': edge['sourceEntityId'],
-                    'target': edge['targetEntityId'],
-                    'weight': edge['weight'],
-                    'value': edge['weight'] * 10
-                })
+            nodes = [{
+                'id': entity['id'],
+                'name': entity['name'],
+                'type': entity['type'],
+                'strength': entity.get('strength', 0),
+                'group': NODE_GROUP_BY_TYPE.get(entity['type'], 0)
+            } for entity in cluster['entities']]
+
+            links = [{
+                'source': edge['sourceEntityId'],
+                'target': edge['targetEntityId'],
+                'weight': edge['weight'],
+                'value': edge['weight'] * 10
+            } for edge in cluster_edges]
 
             result.append({
                 'clusterId': cluster['clusterId'],
@@ -2005,30 +2447,124 @@ def get_knowledge_clusters(child_id):
                 }
             })
 
-        return jsonify({'success': True, 'clusters': result}), 200
+        payload = {'success': True, 'clusters': result}
+        _graph_cache_put(cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
-        logger.error(f"Failed to get clusters: {e}", exc_info=True)
+        logger.error("Failed to get clusters: %s", e, exc_info=True)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-def _get_node_group(entity_type):
-    """Map entity type to group number for D3 color coding"""
-    type_map = {
-        'topic': 1,
-        'skill': 2,
-        'interest': 3,
-        'concept': 4,
-        'personality_trait': 5
-    }
-    return type_map.get(entity_type, 0)
+# Firestore caps the number of disjunctions ('in' values, multiplied across 'in'
+# filters) in a single query
+FIRESTORE_MAX_DISJUNCTIONS = 30
+
+
+def _query_edges_filtered(edges_ref, entity_ids, min_weight, edge_types=None, max_edges=None):
+    """
+    Fetch edges between `entity_ids` with weight >= min_weight
+
+    Source-entity membership, the weight threshold and (when it fits in the
+    disjunction limit) the edge-type filter are applied by Firestore, one query
+    per chunk of source IDs, run concurrently. Only the target-entity check is
+    left to Python. With max_edges, each query reads heaviest-first in pages of
+    max_edges until max_edges of its edges pass that check (or it runs out), and
+    the heaviest max_edges edges overall are returned.
+    """
+    if not entity_ids:
+        return []
+
+    server_edge_types = edge_types if edge_types and len(edge_types) <= FIRESTORE_MAX_DISJUNCTIONS else None
+    chunk_size = max(1, FIRESTORE_MAX_DISJUNCTIONS // len(server_edge_types or [None]))
+    source_ids = list(entity_ids)
+
+    # Hash sets for the per-edge filter Firestore can't apply
+    target_ids = entity_ids if isinstance(entity_ids, (set, frozenset)) else frozenset(entity_ids)
+    edge_type_set = frozenset(edge_types) if edge_types else None
+
+    def keep(edge):
+        return edge['targetEntityId'] in target_ids and (edge_type_set is None or edge['edgeType'] in edge_type_set)
+
+    def fetch(chunk):
+        query = edges_ref.where("sourceEntityId", "in", chunk)
+        if server_edge_types:
+            query = query.where("edgeType", "in", server_edge_types)
+        query = query.where("weight", ">=", min_weight).order_by("weight", direction="DESCENDING")
+        if not max_edges:
+            return [edge for edge in (doc.to_dict() for doc in query.stream()) if keep(edge)]
+
+        matched = []
+        page_query = query
+        while True:
+            docs = list(page_query.limit(max_edges).stream())
+            matched.extend(edge for edge in (doc.to_dict() for doc in docs) if keep(edge))
+            if len(matched) >= max_edges or len(docs) < max_edges:
+                return matched
+            page_query = query.start_after(docs[-1])
+
+    chunks = [source_ids[i:i + chunk_size] for i in range(0, len(source_ids), chunk_size)]
+
+    edges = []
+    for chunk_edges in FIRESTORE_POOL.map(fetch, chunks):
+        edges.extend(chunk_edges)
+
+    if max_edges and len(edges) > max_edges:
+        edges.sort(key=lambda edge: edge['weight'], reverse=True)
+        del edges[max_edges:]
+    return edges
+
+
+# Built graph payloads keyed on (endpoint, user, child, graph version, filters). The
+# graph version changes on every knowledge extraction, so writes in this process
+# invalidate immediately; the TTL bounds staleness from other workers.
+GRAPH_CACHE_TTL_SECONDS = 30
+GRAPH_CACHE_MAX_ENTRIES = 1024
+_graph_cache = {}  # key -> (expires_at, payload)
+_graph_cache_lock = threading.Lock()
+
+
+def _graph_cache_get(key):
+    with _graph_cache_lock:
+        entry = _graph_cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    return None
+
+
+def _graph_cache_put(key, payload):
+    now = time.time()
+    with _graph_cache_lock:
+        if len(_graph_cache) >= GRAPH_CACHE_MAX_ENTRIES:
+            for stale_key in [k for k, (expires_at, _) in _graph_cache.items() if expires_at <= now]:
+                del _graph_cache[stale_key]
+            if len(_graph_cache) >= GRAPH_CACHE_MAX_ENTRIES:
+                _graph_cache.clear()
+        _graph_cache[key] = (now + GRAPH_CACHE_TTL_SECONDS, payload)
+
+
+# Graph timeRange query param -> lookback window
+TIME_RANGE_SECONDS = {
+    'last_week': 7 * 24 * 3600,
+    'last_month': 30 * 24 * 3600,
+}
+
+# Entity type -> group number for D3 color coding (0 for unknown types)
+NODE_GROUP_BY_TYPE = {
+    'topic': 1,
+    'skill': 2,
+    'interest': 3,
+    'concept': 4,
+    'personality_trait': 5
+}
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5005)), debug=True)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5005)), debug=os.getenv("FLASK_DEBUG") == "1")
 # To run this app, ensure you have the required environment variables set:
 # - OPENAI_API_KEY for OpenAI API access
 # - PORT for the Flask server port (default is 5005)
+# - FLASK_DEBUG=1 to enable the debugger and reloader for local development
 # Make sure to install the required packages:
 # pip install Flask openai
 # Also, ensure you have the whisper_stt.py and gpt_reply.py modules implemented as needed.
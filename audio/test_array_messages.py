@@ -146,26 +146,23 @@ def test_overflow_handling():
     print(f"\n[2] Adding 55 message pairs (110 messages)...")
     print("   This will trigger overflow handling at 100 messages...")
 
-    overflow_triggered = False
-    for i in range(55):
-        success, overflow = firestore_service.add_message_batch(
-            user_id=user_id,
-            conversation_id=conversation_id,
-            child_message=f"Test message {i+1}",
-            toy_message=f"Response {i+1}"
-        )
+    message_count = firestore_service.add_message_pairs(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        message_pairs=[(f"Test message {i+1}", f"Response {i+1}") for i in range(55)]
+    )
 
-        if overflow and not overflow_triggered:
-            print(f"   ⚠ Overflow triggered at message pair {i+1}")
-            overflow_triggered = True
+    if message_count is None:
+        print("ERROR: Failed to add message pairs")
+        return False
 
-        if (i + 1) % 10 == 0:
-            print(f"   Progress: {i+1}/55 pairs added")
+    print(f"   ✓ 55/55 pairs added in one transaction")
 
     # Verify final state
     print(f"\n[3] Verifying final state...")
     conv = firestore_service.get_conversation(user_id, conversation_id)
     messages_in_array = len(conv.get('messages', []))
+    overflow_triggered = message_count > messages_in_array
 
     print(f"   ✓ Total message count: {conv.get('messageCount')}")
     print(f"   ✓ Messages in main array: {messages_in_array}")
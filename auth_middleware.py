@@ -1,13 +1,33 @@
 # auth_middleware.py
 
 import functools
+import threading
 import time
-from flask import request, jsonify
-from firestore_service import firestore_service
-
-# Simple in-memory cache
-auth_cache = {}
+from collections import OrderedDict
+from flask import request, jsonify, make_response
+from google.cloud.firestore_v1.base_query import FieldFilter
+from firestore_service import firestore_service, SingleFlight, BACKGROUND_POOL
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# In-memory LRU caches with TTL, bounded so header fuzzing can't grow them forever
+auth_cache = OrderedDict()  # key -> (expires_at, auth_context), least recently used first
+auth_neg_cache = OrderedDict()  # key -> (expires_at, (message, status)) for rejected credentials
+_auth_cache_lock = threading.Lock()
 CACHE_TTL_SECONDS = 300  # 5 minutes
+NEG_CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 10000
+
+# Concurrent cache misses for the same credentials share one Firestore validation
+_auth_flights = SingleFlight()
+
+# User/toy doc fields kept in auth_context["user_data"] / ["toy_data"]
+AUTH_USER_FIELDS = ("email", "displayName")
+AUTH_TOY_FIELDS = ("name", "assignedChildId", "status")
+
+# Rejections worth remembering - unknown user/device, not missing headers or outages
+NEG_CACHE_STATUSES = (403, 404)
 
 
 class AuthenticationError(Exception):
@@ -35,7 +55,7 @@ def validate_auth_headers():
 
     # Log if ESP32 still sends session ID (backward compatibility during migration)
     if session_id:
-        print(f"[INFO] Ignoring ESP32-provided session ID: {session_id} (backend manages sessions)")
+        logger.info("Ignoring ESP32-provided session ID: %s (backend manages sessions)", session_id)
 
     if not toy_id:
         raise AuthenticationError("Missing required header: X-Device-ID", 400)
@@ -46,28 +66,62 @@ def validate_auth_headers():
     return email, user_id, toy_id, session_id
 
 
-def check_cache(email, user_id, toy_id, session_id):
+def _cache_key(email, user_id, toy_id):
     # Cache key uses email OR user_id (whichever is provided)
     # Note: session_id removed from cache key (sessions managed separately by session_manager)
-    cache_key = email if email else user_id
-    key = f"{cache_key}:{toy_id}"
-    entry = auth_cache.get(key)
+    return (email or user_id, toy_id)
+
+
+def _lru_get(cache, key):
+    with _auth_cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return entry[1]
+
+
+def _lru_put(cache, key, value, ttl):
+    with _auth_cache_lock:
+        cache[key] = (time.time() + ttl, value)
+        cache.move_to_end(key)
+        while len(cache) > CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
 
-    if entry and entry["expires_at"] > time.time():
-        return entry.get("auth_context")
 
-    return None
+def check_cache(email, user_id, toy_id, session_id):
+    return _lru_get(auth_cache, _cache_key(email, user_id, toy_id))
 
 
 def write_cache(email, user_id, toy_id, session_id, auth_context):
-    # Cache key uses email OR user_id (whichever is provided)
-    # Note: session_id removed from cache key (sessions managed separately by session_manager)
-    cache_key = email if email else user_id
-    key = f"{cache_key}:{toy_id}"
-    auth_cache[key] = {
-        "auth_context": auth_context,
-        "expires_at": time.time() + CACHE_TTL_SECONDS,
-    }
+    _lru_put(auth_cache, _cache_key(email, user_id, toy_id), auth_context, CACHE_TTL_SECONDS)
+
+
+def check_negative_cache(email, user_id, toy_id):
+    """Return the cached (message, status) rejection for these credentials, if any"""
+    return _lru_get(auth_neg_cache, _cache_key(email, user_id, toy_id))
+
+
+def write_negative_cache(email, user_id, toy_id, message, status):
+    _lru_put(auth_neg_cache, _cache_key(email, user_id, toy_id), (message, status), NEG_CACHE_TTL_SECONDS)
+
+
+def clear_negative_cache(toy_id):
+    """Forget cached rejections for a device, e.g. right after it is registered"""
+    with _auth_cache_lock:
+        for key in [key for key in auth_neg_cache if key[1] == toy_id]:
+            del auth_neg_cache[key]
+
+
+def _backfill_email_lookup(email_ref, user_id):
+    """Write the emails/ lookup doc found by the query fallback - best-effort, off the auth path"""
+    try:
+        email_ref.set({"user_id": user_id})
+    except Exception as e:
+        logger.warning("[AUTH] Failed to backfill email lookup for user %s: %s", user_id, e)
 
 
 def validate_with_firestore(email, user_id, toy_id):
@@ -85,50 +139,123 @@ def validate_with_firestore(email, user_id, toy_id):
     if not firestore_service.db:
         raise AuthenticationError("Authentication service unavailable", 503)
 
+    db = firestore_service.db
+
+    def get_user_and_toy(user_id):
+        # The user and toy docs are independent, so fetch both in one get_all
+        # round-trip instead of two sequential gets
+        user_ref = db.collection("users").document(user_id)
+        toy_ref = user_ref.collection("toys").document(toy_id)
+        snapshots = {snap.reference.path: snap for snap in db.get_all([user_ref, toy_ref])}
+        return snapshots[user_ref.path], snapshots[toy_ref.path]
+
     # Look up user by email OR user_id
     if email:
-        # Query users collection by email
-        users_ref = firestore_service.db.collection("users")
-        query = users_ref.where("email", "==", email.lower().strip()).limit(1)
-        users = list(query.stream())
+        normalized_email = email.lower().strip()
+
+        # Resolve the email through its emails/ lookup doc (one get), checking the
+        # user still has that email in case it changed since the mapping was written
+        user_doc = None
+        email_ref = firestore_service.email_lookup_ref(normalized_email)
+        email_doc = email_ref.get()
+        mapped_user_id = email_doc.to_dict().get("user_id") if email_doc.exists else None
+        if mapped_user_id:
+            user_doc, toy_doc = get_user_and_toy(mapped_user_id)
+            if not user_doc.exists or (user_doc.to_dict().get("email") or "").lower().strip() != normalized_email:
+                user_doc = None
+
+        if user_doc is None:
+            # No (valid) mapping - users created outside create_account - so fall
+            # back to querying by email and backfill the mapping for next time
+            query = db.collection("users").where(filter=FieldFilter("email", "==", normalized_email)).limit(1)
+            users = list(query.stream())
+
+            if not users:
+                raise AuthenticationError("User not found with email", 404)
+
+            user_doc = users[0]
+            BACKGROUND_POOL.submit(_backfill_email_lookup, email_ref, user_doc.id)
+
+            # Check if device/toy exists in user's toys subcollection
+            toy_doc = db.collection("users").document(user_doc.id)\
+                .collection("toys").document(toy_id).get()
 
-        if not users:
-            raise AuthenticationError("User not found with email", 404)
-
-        user_doc = users[0]
         user_id = user_doc.id  # Get the actual user_id from the document
-        print(f"[AUTH] ✓ User found by email: {email} -> {user_id}")
+        logger.info("[AUTH] ✓ User found by email: %s -> %s", email, user_id)
     else:
-        # Direct lookup by user_id
-        user_ref = firestore_service.db.collection("users").document(user_id)
-        user_doc = user_ref.get()
+        user_doc, toy_doc = get_user_and_toy(user_id)
 
         if not user_doc.exists:
             raise AuthenticationError("User not found", 404)
 
-        print(f"[AUTH] ✓ User {user_id} verified")
-
-    # Check if device/toy exists in user's toys subcollection
-    toy_ref = firestore_service.db.collection("users").document(user_id)\
-        .collection("toys").document(toy_id)
-    toy_doc = toy_ref.get()
+        logger.info("[AUTH] ✓ User %s verified", user_id)
 
     if not toy_doc.exists:
         raise AuthenticationError("Device not associated with this user", 403)
 
-    print(f"[AUTH] ✓ Device {toy_id} verified")
+    logger.info("[AUTH] ✓ Device %s verified", toy_id)
 
-    # Return validation data for caching
+    # Return validation data for caching - only the doc fields handlers read, so
+    # cached entries stay small. Handlers needing more fetch the doc themselves.
+    user_data = user_doc.to_dict()
+    toy_data = toy_doc.to_dict()
     return {
         "user_id": user_id,
         "toy_id": toy_id,
-        "email": user_doc.to_dict().get("email", ""),
-        "user_data": user_doc.to_dict(),
-        "toy_data": toy_doc.to_dict()
+        "email": user_data.get("email", ""),
+        "user_data": {field: user_data[field] for field in AUTH_USER_FIELDS if field in user_data},
+        "toy_data": {field: toy_data[field] for field in AUTH_TOY_FIELDS if field in toy_data}
     }
 
 
-def require_device_auth(f):
+def get_requested_user_ids(view_kwargs):
+    """
+    Collect every user_id the request names: URL path, query string and JSON
+    body (parsed with Flask's cache so the view doesn't re-parse it).
+    """
+    candidates = [view_kwargs.get("user_id"), request.args.get("user_id")]
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            candidates.append(body.get("user_id"))
+    return [user_id for user_id in candidates if user_id]
+
+
+def require_device_auth(f=None, *, enforce_user_match=False, conditional=False):
+    """
+    Authenticate the device headers before running the view.
+
+    With enforce_user_match=True, a request naming any user_id (path, query or
+    body) that differs from the authenticated user is rejected with 403 before
+    the view runs. A missing user_id is left for the view to report.
+
+    With conditional=True, successful GET responses carry an ETag of their body,
+    and a request whose If-None-Match matches gets an empty 304 instead - for
+    metadata the ESP32 polls and that rarely changes.
+    """
+    if f is None:
+        return functools.partial(require_device_auth, enforce_user_match=enforce_user_match,
+                                 conditional=conditional)
+
+    def check_user_match(kwargs):
+        if not enforce_user_match:
+            return None
+        auth_user_id = request.auth_context.get("user_id")
+        if any(user_id != auth_user_id for user_id in get_requested_user_ids(kwargs)):
+            logger.warning("[AUTH] ✗ User mismatch for %s", request.path)
+            return jsonify({"error": "Unauthorized - can only access your own data"}), 403
+        return None
+
+    def run_view(args, kwargs):
+        rv = check_user_match(kwargs) or f(*args, **kwargs)
+        if not conditional or request.method != "GET":
+            return rv
+        response = make_response(rv)
+        if response.status_code == 200 and not response.is_streamed:
+            response.add_etag()
+            response.make_conditional(request)
+        return response
+
     @functools.wraps(f)
     def wrapper(*args, **kwargs):
         try:
@@ -137,31 +264,46 @@ def require_device_auth(f):
             # Check cache
             cached_context = check_cache(email, user_id, toy_id, session_id)
             if cached_context:
-                print("[AUTH] ✓ Cache hit")
+                logger.debug("[AUTH] ✓ Cache hit")
                 request.auth_context = cached_context
-                return f(*args, **kwargs)
-
-            # Validate with Firestore
-            print("[AUTH] Cache miss → Validating with Firestore…")
-            auth_context = validate_with_firestore(email, user_id, toy_id)
-
-            # Cache the result
-            write_cache(email, user_id, toy_id, session_id, auth_context)
+                return run_view(args, kwargs)
+
+            # Credentials rejected moments ago are rejected again without a Firestore read
+            rejection = check_negative_cache(email, user_id, toy_id)
+            if rejection:
+                logger.debug("[AUTH] ✗ Negative cache hit")
+                message, status = rejection
+                return jsonify({"error": message}), status
+
+            def validate_and_cache():
+                logger.info("[AUTH] Cache miss → Validating with Firestore…")
+                try:
+                    auth_context = validate_with_firestore(email, user_id, toy_id)
+                except AuthenticationError as e:
+                    if e.status in NEG_CACHE_STATUSES:
+                        write_negative_cache(email, user_id, toy_id, e.message, e.status)
+                    raise
+
+                write_cache(email, user_id, toy_id, session_id, auth_context)
+                return auth_context
+
+            # Validate with Firestore - a burst of requests from a cold device waits on
+            # the first one's lookup (and its result or rejection) instead of each
+            # querying Firestore
+            auth_context = _auth_flights.do(_cache_key(email, user_id, toy_id), validate_and_cache)
 
             # Set context for the endpoint to use
             request.auth_context = auth_context
 
-            print("[AUTH] ✓ Auth succeeded")
-            return f(*args, **kwargs)
+            logger.info("[AUTH] ✓ Auth succeeded")
+            return run_view(args, kwargs)
 
         except AuthenticationError as e:
-            print(f"[AUTH] ✗ {e.message}")
+            logger.warning("[AUTH] ✗ %s", e.message)
             return jsonify({"error": e.message}), e.status
 
         except Exception as e:
-            print(f"[AUTH] Unexpected error: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("[AUTH] Unexpected error: %s", e, exc_info=True)
             return jsonify({"error": "Internal server error"}), 500
 
     return wrapper
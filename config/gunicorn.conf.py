@@ -0,0 +1,66 @@
+"""
+Gunicorn production configuration
+
+Usage: gunicorn -c config/gunicorn.conf.py app:app
+"""
+import multiprocessing
+import os
+
+# Server socket
+bind = "127.0.0.1:5005"
+
+# Worker processes
+# Threaded workers: request handlers spend most of their time waiting on Firestore
+# gRPC and the STT/LLM/TTS APIs, all of which release the GIL, so one worker can
+# overlap many in-flight requests. The app (and its Firestore client) is imported
+# after fork - no preload_app - so no gRPC channel is shared across processes.
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Timeouts
+timeout = 300
+keepalive = 5
+
+# Logging
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+# Process naming
+proc_name = "luno-backend"
+
+# Server mechanics
+daemon = False
+pidfile = None
+
+
+def post_fork(server, worker):
+    """
+    Import the speech/LLM modules once per worker right after fork.
+
+    app.py imports these lazily inside the /upload and /text_upload handlers,
+    so this is where production chooses to pay the import cost - before the
+    worker accepts its first request instead of during it.
+    """
+    import whisper_stt
+    import gemini_reply
+    import tts_elevenlabs_streaming
+    server.log.info(f"Worker {worker.pid}: speech/LLM modules preloaded")
+
+
+def post_worker_init(worker):
+    """
+    Warm each upstream's persistent HTTP connection pool once per worker.
+
+    The OpenAI and Gemini SDK clients and the ElevenLabs requests.Session are
+    module-level and keep connections alive, so doing the TLS handshakes here
+    keeps them out of the first utterance's latency.
+    """
+    import whisper_stt
+    import gemini_reply
+    import tts_elevenlabs_streaming
+
+    whisper_stt.warmup_connection()
+    gemini_reply.warmup_connection()
+    tts_elevenlabs_streaming.warmup_connection()
@@ -4,12 +4,14 @@ Initializes Firebase Admin SDK for Firestore access
 """
 
 import os
+import threading
 import firebase_admin
 from firebase_admin import credentials, firestore
 import json
 
 # Global Firestore client instance
 db = None
+_init_lock = threading.Lock()
 
 def initialize_firebase():
     """
@@ -28,6 +30,17 @@ def initialize_firebase():
         print("[INFO] Firebase already initialized")
         return db
 
+    # Double-checked: threads racing in on a cold worker would otherwise both call
+    # initialize_app, and the loser's "already exists" ValueError would leave it
+    # without a client
+    with _init_lock:
+        if db is None:
+            db = _create_client()
+        return db
+
+
+def _create_client():
+    """Initialize the default Firebase app and return its Firestore client (None on failure)"""
     try:
         # Method 1: Service Account JSON file
         service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH")
@@ -53,10 +66,10 @@ def initialize_firebase():
             print("[INFO] Firebase initialized with Application Default Credentials")
             print("[INFO] Using project: luno-companion-app-dev")
 
-        db = firestore.client()
+        client = firestore.client()
         print("[INFO] Firestore client initialized successfully")
         print(f"[INFO] Connected to project: {firebase_admin.get_app().project_id}")
-        return db
+        return client
 
     except Exception as e:
         print(f"[ERROR] Failed to initialize Firebase: {e}")
@@ -74,9 +87,8 @@ def get_firestore_client():
     Get the Firestore client instance
     Initializes if not already done
     """
-    global db
     if db is None:
-        db = initialize_firebase()
+        return initialize_firebase()
     return db
 
 
@@ -3,15 +3,164 @@ Firestore Service Layer
 Handles all Firestore operations for conversations, messages, and stats
 """
 
-from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
 from firebase_admin import firestore
 from firebase_config import get_firestore_client
+from google.api_core import exceptions as google_exceptions
 from logging_config import get_logger
+import hashlib
+import os
+import queue
 import re
+import threading
 import time
 
+try:
+    # RE2 matches in linear time - no catastrophic backtracking on child input.
+    # Its \b and \w are ASCII-only while stdlib re's are Unicode-aware, so a keyword
+    # next to a non-ASCII letter (e.g. "sadé") flags under RE2 but not under re
+    import re2 as _safety_re
+except ImportError:
+    _safety_re = re
+
 logger = get_logger(__name__)
 
+# Shared bounded pool for running independent Firestore RPCs concurrently
+FIRESTORE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="firestore")
+
+# Post-conversation work (AI title, knowledge graph extraction) - kept apart from
+# FIRESTORE_POOL so slow LLM calls never hold up request-path RPCs
+BACKGROUND_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fs-bg")
+
+# Non-critical writes applied in order by a background thread, keeping the
+# Firestore round-trip off the request path. Whatever has queued up is committed
+# together as one WriteBatch (up to WRITE_BATCH_MAX updates per commit); if that
+# commit fails, each document's updates are retried as their own batch so one bad
+# update can't drop other users' writes.
+WRITE_QUEUE = queue.Queue()
+WRITE_BATCH_MAX = 50
+WRITE_RETRY_ATTEMPTS = 3
+WRITE_RETRY_BACKOFF_SECONDS = 0.2
+WRITE_FLUSH_TIMEOUT_SECONDS = 5
+
+# Commit errors raised before the write was applied - safe to retry, even with Increment
+_RETRYABLE_WRITE_ERRORS = (google_exceptions.Aborted, google_exceptions.ServiceUnavailable)
+
+_pending_writes = {}  # document path -> queued updates not yet committed
+_pending_writes_lock = threading.Lock()
+
+
+def _enqueue_write(ref, patch):
+    with _pending_writes_lock:
+        _pending_writes[ref.path] = _pending_writes.get(ref.path, 0) + 1
+    WRITE_QUEUE.put((ref, patch))
+
+
+def _flush_writes(ref, timeout=WRITE_FLUSH_TIMEOUT_SECONDS):
+    """
+    Wait until every update queued for `ref` so far has been committed
+
+    Returns:
+        bool: False if the writer didn't get there within `timeout` seconds
+    """
+    with _pending_writes_lock:
+        if not _pending_writes.get(ref.path):
+            return True
+    done = threading.Event()
+    WRITE_QUEUE.put((None, done))  # the writer sets it once everything before it is committed
+    return done.wait(timeout)
+
+
+def _commit_with_retry(writes):
+    for attempt in range(WRITE_RETRY_ATTEMPTS):
+        batch = get_firestore_client().batch()
+        for ref, patch in writes:
+            batch.update(ref, patch)
+        try:
+            batch.commit()
+            return
+        except _RETRYABLE_WRITE_ERRORS:
+            if attempt == WRITE_RETRY_ATTEMPTS - 1:
+                raise
+            time.sleep(WRITE_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+
+def _commit_writes(writes):
+    try:
+        _commit_with_retry(writes)
+        return
+    except Exception as e:
+        by_document = {}
+        for ref, patch in writes:
+            by_document.setdefault(ref.path, []).append((ref, patch))
+        if len(by_document) == 1:
+            logger.error("Queued writes to %s failed | Error: %s", writes[0][0].path, e, exc_info=True)
+            return
+        logger.warning("Queued batch of %s writes failed, committing per document | Error: %s", len(writes), e)
+
+    for path, document_writes in by_document.items():
+        try:
+            _commit_with_retry(document_writes)
+        except Exception as e:
+            logger.error("Queued writes to %s failed | Error: %s", path, e, exc_info=True)
+
+
+def _drain_writes():
+    while True:
+        items = [WRITE_QUEUE.get()]
+        # Stop collecting at a flush marker so it's released right after the writes before it
+        while len(items) < WRITE_BATCH_MAX and items[-1][0] is not None:
+            try:
+                items.append(WRITE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        writes = [(ref, patch) for ref, patch in items if ref is not None]
+        try:
+            if writes:
+                _commit_writes(writes)
+        finally:
+            with _pending_writes_lock:
+                for ref, _ in writes:
+                    remaining = _pending_writes.get(ref.path, 0) - 1
+                    if remaining > 0:
+                        _pending_writes[ref.path] = remaining
+                    else:
+                        _pending_writes.pop(ref.path, None)
+            for ref, done in items:
+                if ref is None:
+                    done.set()
+            for _ in items:
+                WRITE_QUEUE.task_done()
+
+
+threading.Thread(target=_drain_writes, daemon=True, name="firestore-writes").start()
+
+# Process-local TTL cache for rarely-changing child/toy docs (device-info hot path)
+DOC_CACHE_TTL_SECONDS = int(os.getenv("FIRESTORE_DOC_CACHE_TTL", 60))
+DOC_CACHE_MAX_ENTRIES = 10000
+
+# Conversation messages array: newest MESSAGE_ARRAY_CAP kept. Appends are blind
+# ArrayUnion updates, each followed by a check of the conversation's messageCount
+# against messagesTrimmedAt (the count at the last trim) - document state, so it
+# holds across processes. The array is trimmed once it may exceed the cap by
+# MESSAGE_TRIM_SLACK, and again when the conversation ends.
+MESSAGE_ARRAY_CAP = 150
+MESSAGE_TRIM_SLACK = 10
+
+# Message IDs are "<sender>_<timestamp>" (see _message_id), which survive trims that
+# shift array indices - message pages use them as cursors
+_MESSAGE_ID_RE = re.compile(r"[a-z]+_\d{20}")
+
+# Conversation list views: every conversation field except the messages array,
+# which is fetched separately through get_conversation_messages_page
+CONVERSATION_LIST_FIELDS = (
+    "status", "type", "createdAt", "childId", "toyId", "childName", "toyName",
+    "startTime", "lastActivityAt", "endTime", "duration", "durationMinutes",
+    "title", "titleGeneratedAt", "messageCount", "firstMessagePreview",
+    "flagged", "flagType", "flagReason", "severity", "flagStatus",
+)
+
 # Safety check keywords for content moderation
 SAFETY_KEYWORDS = {
     'personal_info': [
@@ -29,17 +178,168 @@ SAFETY_KEYWORDS = {
     ],
 }
 
+# SAFETY_KEYWORDS compiled once at import, one alternation per category so each
+# category is a single search - case-insensitive (inline (?i), which RE2 and re both
+# accept), so content needn't be lowercased.
+# Kept per category (not one regex for all) so the first category in order still wins.
+_COMPILED_SAFETY = {
+    flag_type: _safety_re.compile("(?i)" + "|".join(f"(?:{pattern})" for pattern in patterns))
+    for flag_type, patterns in SAFETY_KEYWORDS.items()
+}
+
+# Severity recorded for each flag type (anything else is "low")
+SEVERITY_BY_FLAG_TYPE = {
+    'personal_info': 'critical',
+    'inappropriate_content': 'high',
+    'emotional_distress': 'medium',
+}
+
+# Cheap pre-checks: a category is only searched when its hint matches. Every
+# personal_info pattern needs a digit (phone, SSN, address) or an "@" (email),
+# which most child/toy utterances don't contain.
+_SAFETY_HINTS = {
+    'personal_info': re.compile(r"[\d@]"),
+}
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key onto one in-flight call"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the in-flight call
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+def _message_id(message):
+    """Stable ID for a messages-array entry: sender plus its microsecond timestamp"""
+    timestamp = message.get("timestamp")
+    # Legacy entries can hold ISO strings (or no timestamp), which strftime codes can't format
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            timestamp = None
+    stamp = f"{timestamp:%Y%m%d%H%M%S%f}" if isinstance(timestamp, datetime) else "0" * 20
+    return f"{message.get('sender', 'unknown')}_{stamp}"
+
 
 class FirestoreService:
     """Main service class for Firestore operations"""
 
     def __init__(self):
         self.db = get_firestore_client()
+        self._doc_cache = {}  # document path -> (expires_at, data or None)
+        self._doc_cache_lock = threading.Lock()
+        self._doc_flights = SingleFlight()
+        self._openai_client = None  # created on first title generation
 
     def is_available(self):
         """Check if Firestore is available"""
         return self.db is not None
 
+    # ==================== CACHED DOCUMENT READS ====================
+
+    def get_documents_cached(self, refs):
+        """
+        Read documents through the TTL cache
+
+        Cache misses are fetched together in a single get_all round-trip, and
+        concurrent requests missing the same docs share that one RPC.
+        Returns a dict of document path -> data (None if the doc doesn't exist).
+        """
+        now = time.time()
+        results = {}
+        missing = []
+        with self._doc_cache_lock:
+            for ref in refs:
+                entry = self._doc_cache.get(ref.path)
+                if entry is not None and entry[0] > now:
+                    results[ref.path] = entry[1]
+                else:
+                    missing.append(ref)
+
+        if not missing:
+            return results
+
+        flight_key = tuple(sorted(ref.path for ref in missing))
+        results.update(self._doc_flights.do(flight_key, lambda: self._fetch_and_cache(missing)))
+        return results
+
+    def _fetch_and_cache(self, refs):
+        """Fetch docs in one get_all and store them in the TTL cache"""
+        fetched = {ref.path: None for ref in refs}
+        for snap in self.db.get_all(refs):
+            if snap.exists:
+                fetched[snap.reference.path] = snap.to_dict()
+
+        now = time.time()
+        expires_at = now + DOC_CACHE_TTL_SECONDS
+        with self._doc_cache_lock:
+            if len(self._doc_cache) + len(fetched) > DOC_CACHE_MAX_ENTRIES:
+                self._doc_cache = {
+                    path: entry for path, entry in self._doc_cache.items() if entry[0] > now
+                }
+                if len(self._doc_cache) + len(fetched) > DOC_CACHE_MAX_ENTRIES:
+                    self._doc_cache.clear()
+            for path, data in fetched.items():
+                self._doc_cache[path] = (expires_at, data)
+
+        return fetched
+
+    def _child_ref(self, user_id, child_id):
+        return self.db.collection("users").document(user_id)\
+            .collection("children").document(child_id)
+
+    def _toy_ref(self, user_id, toy_id):
+        return self.db.collection("users").document(user_id)\
+            .collection("toys").document(toy_id)
+
+    def email_lookup_ref(self, email):
+        """
+        Ref to the emails/{sha1(normalized email)} doc mapping an email to its
+        user_id, so auth can resolve an email with a get() instead of a query
+        """
+        key = hashlib.sha1(email.lower().strip().encode("utf-8")).hexdigest()
+        return self.db.collection("emails").document(key)
+
+    def get_child_cached(self, user_id, child_id):
+        """Get child doc data via the TTL cache (None if not found)"""
+        ref = self._child_ref(user_id, child_id)
+        return self.get_documents_cached([ref]).get(ref.path)
+
+    def get_toy_cached(self, user_id, toy_id):
+        """Get toy doc data via the TTL cache (None if not found)"""
+        ref = self._toy_ref(user_id, toy_id)
+        return self.get_documents_cached([ref]).get(ref.path)
+
+    def invalidate_cached_docs(self, *refs):
+        """Drop documents from the TTL cache after a write"""
+        with self._doc_cache_lock:
+            for ref in refs:
+                self._doc_cache.pop(ref.path, None)
+
     # ==================== CONVERSATION OPERATIONS ====================
 
     def create_conversation(self, user_id, child_id, toy_id=None, conversation_type="conversation"):
@@ -63,9 +363,9 @@ class FirestoreService:
             return None
 
         try:
-            # Get denormalized names for quick display
-            child_name = self._get_child_name(user_id, child_id)
-            toy_name = self._get_toy_name(user_id, toy_id) if toy_id else None
+            # Get denormalized names for quick display - through the doc cache, with
+            # misses for both docs sharing one get_all round-trip
+            child_name, toy_name = self._get_names(user_id, child_id, toy_id)
 
             conversation_data = {
                 # Core Metadata
@@ -106,8 +406,9 @@ class FirestoreService:
             }
 
             # Generate custom conversation ID: {child_id}_{toy_id}_{timestamp}
+            # One clock read, so the date and timestamp parts always agree
             timestamp = int(time.time())
-            date_str = datetime.now().strftime("%Y%m%d")
+            date_str = time.strftime("%Y%m%d", time.localtime(timestamp))
 
             toy_part = toy_id if toy_id else "notoy"
             conversation_id = f"{child_id}_{toy_part}_{date_str}_{timestamp}"
@@ -122,16 +423,16 @@ class FirestoreService:
             if toy_id:
                 self._update_toy_status(user_id, toy_id, status="online")
 
-            logger.info(f"Created conversation with array-based messages: {conversation_id}")
+            logger.info("Created conversation with array-based messages: %s", conversation_id)
             return conversation_id
 
         except Exception as e:
-            logger.error(f"Failed to create conversation for user {user_id} | Error: {str(e)}", exc_info=True)
+            logger.error("Failed to create conversation for user %s | Error: %s", user_id, e, exc_info=True)
             return None
 
     def add_message(self, user_id, conversation_id, sender, content):
         """
-        Add a single message to a conversation using ARRAY-BASED storage with cap
+        Add a single message to a conversation using ARRAY-BASED storage
         NOTE: Prefer using add_message_batch() for better performance
 
         Args:
@@ -156,9 +457,8 @@ class FirestoreService:
             safety_result = self._check_message_safety(content)
 
             # Create message object with timestamp
-            # NOTE: Use datetime instead of SERVER_TIMESTAMP for arrays in transactions
-            from datetime import datetime as dt_now
-            timestamp_now = dt_now.utcnow()
+            # NOTE: Use datetime - SERVER_TIMESTAMP isn't allowed inside array elements
+            timestamp_now = datetime.utcnow()
 
             message = {
                 "sender": sender,
@@ -168,58 +468,37 @@ class FirestoreService:
                 "flagReason": safety_result.get("flagReason"),
             }
 
-            # Use transaction for atomic read-modify-write with array cap
-            @firestore.transactional
-            def update_in_transaction(transaction, conv_ref):
-                snapshot = conv_ref.get(transaction=transaction)
-
-                # Check if conversation exists
-                if not snapshot.exists:
-                    raise ValueError(f"Conversation {conversation_id} does not exist for user {user_id}. Please create the conversation first.")
-
-                snapshot_data = snapshot.to_dict()
-                current_messages = snapshot_data.get('messages', [])
-                message_count = snapshot_data.get('messageCount', 0)
-
-                # Array cap: Keep last 149 messages, add 1 new = 150 max
-                if len(current_messages) >= 150:
-                    new_messages = current_messages[-149:] + [message]
-                else:
-                    new_messages = current_messages + [message]
-
-                # Prepare update data
-                update_data = {
-                    "messages": new_messages,
-                    "messageCount": message_count + 1,
-                    "lastActivityAt": firestore.SERVER_TIMESTAMP
-                }
-
-                # Add flag data if message flagged
-                if safety_result["flagged"]:
-                    update_data.update({
-                        "flagged": True,
-                        "flagType": safety_result.get("flagType"),
-                        "flagReason": safety_result.get("flagReason"),
-                        "severity": safety_result.get("severity")
-                    })
+            # Blind append like add_message_batch() - no read of the messages array;
+            # update() fails if the conversation doesn't exist, and the 150 message
+            # cap is enforced by _check_messages after the write
+            update_data = {
+                "messages": firestore.ArrayUnion([message]),
+                "messageCount": firestore.Increment(1),
+                "lastActivityAt": firestore.SERVER_TIMESTAMP
+            }
 
-                # Update conversation document
-                transaction.update(conv_ref, update_data)
+            # Add flag data if message flagged
+            if safety_result["flagged"]:
+                update_data.update({
+                    "flagged": True,
+                    "flagType": safety_result.get("flagType"),
+                    "flagReason": safety_result.get("flagReason"),
+                    "severity": safety_result.get("severity")
+                })
 
-            # Execute transaction
-            transaction = self.db.transaction()
-            update_in_transaction(transaction, conv_ref)
+            conv_ref.update(update_data)
+            self._note_appended(conv_ref)
 
-            logger.info(f"Added {sender} message to conversation {conversation_id}")
+            logger.info("Added %s message to conversation %s", sender, conversation_id)
             return True
 
         except Exception as e:
-            logger.error(f"Failed to add message to conversation {conversation_id} | Error: {str(e)}", exc_info=True)
+            logger.error("Failed to add message to conversation %s | Error: %s", conversation_id, e, exc_info=True)
             return False
 
     def add_message_batch(self, user_id, conversation_id, child_message, toy_message):
         """
-        Add both child and toy messages in a single transaction (ARRAY-BASED VERSION)
+        Add both child and toy messages in a single update (ARRAY-BASED VERSION)
         Messages are stored as an array field in the conversation document with a 150 message cap
 
         Args:
@@ -240,85 +519,237 @@ class FirestoreService:
             conv_ref = self.db.collection("users").document(user_id)\
                 .collection("conversations").document(conversation_id)
 
-            # Check safety for child message
-            child_safety = self._check_message_safety(child_message)
+            update_data, child_message_id, toy_message_id = self._message_pair_update(conv_ref, child_message, toy_message)
 
-            # Create message objects with timestamps
-            # NOTE: Use datetime instead of SERVER_TIMESTAMP for arrays in transactions
-            from datetime import datetime as dt_now
-            timestamp_now = dt_now.utcnow()
+            conv_ref.update(update_data)
+            self._note_appended(conv_ref)
 
-            child_msg = {
-                "sender": "child",
-                "content": child_message,
-                "timestamp": timestamp_now,
-                "flagged": child_safety["flagged"],
-                "flagReason": child_safety.get("flagReason")
-            }
+            logger.info("Batch saved messages to conversation %s array (1 update)", conversation_id)
+            return child_message_id, toy_message_id
 
-            toy_msg = {
-                "sender": "toy",
-                "content": toy_message,
-                "timestamp": timestamp_now,
-                "flagged": False,
-                "flagReason": None
-            }
+        except Exception as e:
+            logger.error("Failed to batch save messages to conversation %s | Error: %s", conversation_id, e, exc_info=True)
+            return None, None
 
-            # Use transaction for atomic read-modify-write
-            @firestore.transactional
-            def update_in_transaction(transaction, conv_ref):
-                snapshot = conv_ref.get(transaction=transaction)
-                snapshot_data = snapshot.to_dict()
-                current_messages = snapshot_data.get('messages', [])
-                message_count = snapshot_data.get('messageCount', 0)
+    def _message_pair_update(self, conv_ref, child_message, toy_message):
+        """
+        Build the conversation update appending a child/toy message pair
 
-                # Array cap: Keep last 148 messages, add 2 new = 150 max
-                if len(current_messages) >= 149:
-                    new_messages = current_messages[-(149-1):] + [child_msg, toy_msg]
-                else:
-                    new_messages = current_messages + [child_msg, toy_msg]
+        Returns:
+            tuple: (update_data, child_message_id, toy_message_id)
+        """
+        # Check safety for child message
+        child_safety = self._check_message_safety(child_message)
+
+        # Create message objects with timestamps
+        # NOTE: Use datetime - SERVER_TIMESTAMP isn't allowed inside array elements
+        timestamp_now = datetime.utcnow()
+
+        child_msg = {
+            "sender": "child",
+            "content": child_message,
+            "timestamp": timestamp_now,
+            "flagged": child_safety["flagged"],
+            "flagReason": child_safety.get("flagReason")
+        }
+
+        toy_msg = {
+            "sender": "toy",
+            "content": toy_message,
+            "timestamp": timestamp_now,
+            "flagged": False,
+            "flagReason": None
+        }
+
+        # Blind append - ArrayUnion/Increment are applied server-side, so no read or
+        # transaction; the array cap is enforced by _check_messages after the write
+        update_data = {
+            "messages": firestore.ArrayUnion([child_msg, toy_msg]),
+            "messageCount": firestore.Increment(2),
+            "lastActivityAt": firestore.SERVER_TIMESTAMP
+        }
+
+        # Add flag data if message flagged
+        if child_safety["flagged"]:
+            update_data.update({
+                "flagged": True,
+                "flagType": child_safety.get("flagType"),
+                "flagReason": child_safety.get("flagReason"),
+                "severity": child_safety.get("severity")
+            })
 
-                # Build update data
-                update_data = {
-                    "messages": new_messages,
-                    "messageCount": message_count + 2,
-                    "lastActivityAt": firestore.SERVER_TIMESTAMP
-                }
+        # Message IDs (timestamp-based - no count is read), as returned by the messages endpoint
+        child_message_id = _message_id(child_msg)
+        toy_message_id = _message_id(toy_msg)
+        return update_data, child_message_id, toy_message_id
+
+    def enqueue_message_batch(self, user_id, conversation_id, child_message, toy_message):
+        """
+        Queue a child/toy message pair for the background writer and return immediately
+
+        Same update as add_message_batch(), committed with whatever else is queued -
+        for the reply path, where the caller shouldn't wait on Firestore.
+
+        Returns:
+            tuple: (child_message_id, toy_message_id) - synthetic IDs for compatibility
+        """
+        if not self.is_available():
+            logger.warning("Firestore not available, skipping queued message save")
+            return None, None
+
+        conv_ref = self.db.collection("users").document(user_id)\
+            .collection("conversations").document(conversation_id)
+        update_data, child_message_id, toy_message_id = self._message_pair_update(conv_ref, child_message, toy_message)
+        _enqueue_write(conv_ref, update_data)
+        self._note_appended(conv_ref)
+        return child_message_id, toy_message_id
+
+    def add_message_pairs(self, user_id, conversation_id, message_pairs):
+        """
+        Append many child/toy message pairs in a single transaction (bulk seeding)
+
+        Same array layout and 150 message cap as add_message_batch(), but the
+        conversation document is read and written once for all pairs instead of
+        once per pair.
+
+        Args:
+            user_id: Parent user ID
+            conversation_id: Conversation ID
+            message_pairs: List of (child_message, toy_message) tuples
 
-                # Add flag data if message flagged
+        Returns:
+            int: messageCount after the write, or None on failure
+        """
+        if not self.is_available():
+            logger.warning("Firestore not available, skipping bulk message save")
+            return None
+
+        try:
+            conv_ref = self.db.collection("users").document(user_id)\
+                .collection("conversations").document(conversation_id)
+
+            timestamp_now = datetime.utcnow()
+
+            new_messages = []
+            flag_data = None
+            for i, (child_message, toy_message) in enumerate(message_pairs):
+                # One microsecond apart per pair, so each pair's message IDs are distinct
+                pair_timestamp = timestamp_now + timedelta(microseconds=i)
+                child_safety = self._check_message_safety(child_message)
                 if child_safety["flagged"]:
-                    update_data.update({
+                    flag_data = {
                         "flagged": True,
                         "flagType": child_safety.get("flagType"),
                         "flagReason": child_safety.get("flagReason"),
                         "severity": child_safety.get("severity")
-                    })
+                    }
+                new_messages.append({
+                    "sender": "child",
+                    "content": child_message,
+                    "timestamp": pair_timestamp,
+                    "flagged": child_safety["flagged"],
+                    "flagReason": child_safety.get("flagReason")
+                })
+                new_messages.append({
+                    "sender": "toy",
+                    "content": toy_message,
+                    "timestamp": pair_timestamp,
+                    "flagged": False,
+                    "flagReason": None
+                })
 
-                # Store first message preview if this is the first exchange
-                if message_count == 0:
-                    update_data["firstMessagePreview"] = child_message[:50]
+            @firestore.transactional
+            def update_in_transaction(transaction, conv_ref):
+                snapshot_data = conv_ref.get(transaction=transaction).to_dict()
+                message_count = snapshot_data.get('messageCount', 0)
+
+                update_data = {
+                    # Array cap: keep the newest MESSAGE_ARRAY_CAP messages
+                    "messages": (snapshot_data.get('messages', []) + new_messages)[-MESSAGE_ARRAY_CAP:],
+                    "messageCount": message_count + len(new_messages),
+                    "lastActivityAt": firestore.SERVER_TIMESTAMP
+                }
+                if update_data["messageCount"] > MESSAGE_ARRAY_CAP:
+                    update_data["messagesTrimmedAt"] = update_data["messageCount"]
+                if flag_data:
+                    update_data.update(flag_data)
+                if message_count == 0 and message_pairs:
+                    update_data["firstMessagePreview"] = message_pairs[0][0][:50]
 
-                # Update conversation document
                 transaction.update(conv_ref, update_data)
+                return update_data["messageCount"]
 
-                return message_count
+            message_count = update_in_transaction(self.db.transaction(), conv_ref)
 
-            # Execute transaction
-            transaction = self.db.transaction()
-            message_count = update_in_transaction(transaction, conv_ref)
+            logger.info("Bulk saved %s message pairs to conversation %s (1 transaction)", len(message_pairs), conversation_id)
+            return message_count
 
-            # Generate synthetic message IDs for compatibility
-            child_msg_count = (message_count // 2) + 1
-            toy_msg_count = (message_count // 2) + 1
-            child_message_id = f"child_{child_msg_count}"
-            toy_message_id = f"toy_{toy_msg_count}"
+        except Exception as e:
+            logger.error("Failed to bulk save messages to conversation %s | Error: %s", conversation_id, e, exc_info=True)
+            return None
 
-            logger.info(f"Batch saved messages to conversation {conversation_id} array (1 transaction)")
-            return child_message_id, toy_message_id
+    def _note_appended(self, conv_ref):
+        """Check the messages array cap after an append, off the request path"""
+        FIRESTORE_POOL.submit(self._check_messages, conv_ref)
+
+    def _check_messages(self, conv_ref):
+        """
+        Trim the messages array once it may hold more than MESSAGE_ARRAY_CAP + MESSAGE_TRIM_SLACK,
+        and fill in firstMessagePreview once the first exchange has landed
 
+        Reads only messageCount, messagesTrimmedAt and firstMessagePreview, not the
+        array. A queued append that hasn't landed yet is picked up by the next check.
+        """
+        try:
+            data = conv_ref.get(
+                field_paths=["messageCount", "messagesTrimmedAt", "firstMessagePreview"]
+            ).to_dict() or {}
         except Exception as e:
-            logger.error(f"Failed to batch save messages to conversation {conversation_id} | Error: {str(e)}", exc_info=True)
-            return None, None
+            logger.error("Failed to check message cap for %s | Error: %s", conv_ref.path, e, exc_info=True)
+            return
+
+        message_count = data.get("messageCount", 0)
+        trimmed_at = data.get("messagesTrimmedAt")
+        # Upper bound on the array length: never trimmed, every message is still in
+        # it; otherwise a full array plus whatever was appended since the trim
+        if trimmed_at is None:
+            array_bound = message_count
+        else:
+            array_bound = MESSAGE_ARRAY_CAP + message_count - trimmed_at
+        if array_bound > MESSAGE_ARRAY_CAP + MESSAGE_TRIM_SLACK or data.get("firstMessagePreview") is None:
+            self._trim_messages(conv_ref)
+
+    def _trim_messages(self, conv_ref):
+        """
+        Cut the conversation's messages array down to the newest MESSAGE_ARRAY_CAP
+
+        Runs as a transaction, so an append landing between the read and the write
+        makes it retry instead of being dropped. Records the messageCount it trimmed
+        at as messagesTrimmedAt for _check_messages, and sets a missing
+        firstMessagePreview from the first child message.
+        """
+        @firestore.transactional
+        def trim_in_transaction(transaction, conv_ref):
+            snapshot_data = conv_ref.get(transaction=transaction).to_dict() or {}
+            messages = snapshot_data.get('messages', [])
+            message_count = snapshot_data.get('messageCount', 0)
+
+            update_data = {}
+            if len(messages) > MESSAGE_ARRAY_CAP:
+                update_data["messages"] = messages[-MESSAGE_ARRAY_CAP:]
+            if message_count > MESSAGE_ARRAY_CAP and snapshot_data.get('messagesTrimmedAt') != message_count:
+                update_data["messagesTrimmedAt"] = message_count
+            if snapshot_data.get('firstMessagePreview') is None:
+                first_child = next((m for m in messages if m.get("sender") == "child"), None)
+                if first_child:
+                    update_data["firstMessagePreview"] = first_child.get("content", "")[:50]
+            if update_data:
+                transaction.update(conv_ref, update_data)
+
+        try:
+            trim_in_transaction(self.db.transaction(), conv_ref)
+        except Exception as e:
+            logger.error("Failed to trim messages for %s | Error: %s", conv_ref.path, e, exc_info=True)
 
     def end_conversation(self, user_id, conversation_id, duration_minutes):
         """
@@ -330,7 +761,7 @@ class FirestoreService:
             duration_minutes: Duration in minutes
         """
         if not self.is_available():
-            print("[WARNING] Firestore not available, skipping conversation end")
+            logger.warning("Firestore not available, skipping conversation end")
             return
 
         try:
@@ -338,10 +769,15 @@ class FirestoreService:
             conversation_ref = self.db.collection("users").document(user_id)\
                 .collection("conversations").document(conversation_id)
 
+            # Let queued reply-path appends land first, so the read below (title, KG
+            # extraction, preview backfill, messageCount) sees the final turns
+            if not _flush_writes(conversation_ref):
+                logger.warning("Queued writes for conversation %s not flushed before ending", conversation_id)
+
             # Get conversation data
             conv_doc = conversation_ref.get()
             if not conv_doc.exists:
-                print(f"[ERROR] Conversation {conversation_id} not found")
+                logger.error("Conversation %s not found", conversation_id)
                 return
 
             conv_data = conv_doc.to_dict()
@@ -354,75 +790,66 @@ class FirestoreService:
             total_message_count = conv_data.get("messageCount", len(messages))
 
             # Update conversation status with both duration fields
-            conversation_ref.update({
+            end_update = {
                 "status": "ended",
                 "endTime": firestore.SERVER_TIMESTAMP,
                 "duration": duration_minutes,  # Legacy field
                 "durationMinutes": duration_minutes,
-                "messageCount": total_message_count,
-            })
+            }
+
+            # Backfill the preview if the post-append check hasn't set it yet
+            if not conv_data.get("firstMessagePreview"):
+                first_child = next((m for m in messages if m.get("sender") == "child"), None)
+                if first_child:
+                    end_update["firstMessagePreview"] = first_child.get("content", "")[:50]
+
+            # Conversation end and user stats committed together - one round-trip
+            batch = self.db.batch()
+            batch.update(conversation_ref, end_update)
+            self._update_user_stats(batch, user_id, duration_minutes,
+                                    is_flagged=conv_data.get("flagged", False))
+            batch.commit()
+
+            # Final trim of the appended messages array
+            if len(messages) > MESSAGE_ARRAY_CAP:
+                FIRESTORE_POOL.submit(self._trim_messages, conversation_ref)
+                messages = messages[-MESSAGE_ARRAY_CAP:]
 
-            # Trigger AI title generation asynchronously
-            import threading
-            threading.Thread(
-                target=self._generate_ai_title,
-                args=(user_id, conversation_id, messages),
-                daemon=True
-            ).start()
+            # Trigger AI title generation asynchronously (the title only looks at the opening)
+            BACKGROUND_POOL.submit(self._generate_ai_title, user_id, conversation_id, messages[:10])
 
             # Trigger knowledge graph extraction asynchronously
             if total_message_count >= 4:  # Only extract if meaningful conversation
-                threading.Thread(
-                    target=self._extract_knowledge_graph,
-                    args=(user_id, conversation_id, child_id, messages),
-                    daemon=True
-                ).start()
-
-            # Update user stats
-            self._update_user_stats(user_id, child_id, conversation_id, duration_minutes)
+                BACKGROUND_POOL.submit(
+                    self._extract_knowledge_graph, user_id, conversation_id, child_id, messages
+                )
 
-            print(f"[INFO] Ended conversation {conversation_id}, duration: {duration_minutes}m, {total_message_count} messages")
+            logger.info("Ended conversation %s, duration: %sm, %s messages", conversation_id, duration_minutes, total_message_count)
 
         except Exception as e:
-            print(f"[ERROR] Failed to end conversation: {e}")
+            logger.error("Failed to end conversation: %s", e)
 
     # ==================== STATS OPERATIONS ====================
 
-    def _update_user_stats(self, user_id, child_id, conversation_id, duration_minutes):
-        """Update user statistics after conversation ends (ARRAY-BASED SCHEMA)"""
-        try:
-            user_ref = self.db.collection("users").document(user_id)
-
-            # NEW PATH: conversations directly under user
-            conversation_ref = user_ref.collection("conversations").document(conversation_id)
-
-            # Get conversation to check if flagged
-            conv_doc = conversation_ref.get()
-            if not conv_doc.exists:
-                print(f"[WARNING] Conversation {conversation_id} not found for stats update")
-                return
-
-            conversation = conv_doc.to_dict()
-            is_flagged = conversation.get("flagged", False)
-
-            # Increment stats
-            user_ref.update({
-                "stats.totalConversations": firestore.Increment(1),
-                "stats.totalConversationDurationSec": firestore.Increment(duration_minutes * 60),
-                "stats.lastConversationAt": firestore.SERVER_TIMESTAMP,
+    def _update_user_stats(self, batch, user_id, duration_minutes, is_flagged):
+        """Add the user statistics update for an ended conversation to `batch` (ARRAY-BASED SCHEMA)"""
+        user_ref = self.db.collection("users").document(user_id)
+
+        # Increment stats - flagged stats ride the same write
+        stats = {
+            "totalConversations": firestore.Increment(1),
+            "totalConversationDurationSec": firestore.Increment(duration_minutes * 60),
+            "lastConversationAt": firestore.SERVER_TIMESTAMP,
+        }
+        if is_flagged:
+            stats.update({
+                "flaggedConversations": firestore.Increment(1),
+                "lastFlaggedAt": firestore.SERVER_TIMESTAMP,
             })
-
-            # If flagged, update flagged stats
-            if is_flagged:
-                user_ref.update({
-                    "stats.flaggedConversations": firestore.Increment(1),
-                    "stats.lastFlaggedAt": firestore.SERVER_TIMESTAMP,
-                })
-
-            print(f"[INFO] Updated user stats for user: {user_id}")
-
-        except Exception as e:
-            print(f"[ERROR] Failed to update user stats: {e}")
+        # Merge rather than update: a conversations subcollection can exist without
+        # its users/{uid} doc, and update() would fail the whole batch - leaving the
+        # conversation un-ended with no title or KG extraction
+        batch.set(user_ref, {"stats": stats}, merge=True)
 
     # ==================== HELPER METHODS ====================
 
@@ -439,20 +866,17 @@ class FirestoreService:
             str: Generated title
         """
         try:
-            from openai import OpenAI
-            import os
-
             if not messages:
                 title = "Empty Conversation"
             else:
                 # Build context from first 10 messages
-                message_context = "\n".join([
+                message_context = "\n".join(
                     f"{msg.get('sender', 'unknown')}: {msg.get('content', '')}"
                     for msg in messages[:10]
-                ])
+                )
 
                 # Call GPT for title generation
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                client = self._get_openai_client()
                 prompt = f"""Generate a brief 2-4 word title for this conversation between a child and Luna (AI toy).
 
 Conversation:
@@ -485,14 +909,21 @@ Title:"""
                 "titleGeneratedAt": firestore.SERVER_TIMESTAMP
             })
 
-            print(f"[INFO] AI title generated for {conversation_id}: '{title}'")
+            logger.info("AI title generated for %s: '%s'", conversation_id, title)
             return title
 
         except Exception as e:
-            print(f"[ERROR] AI title generation failed: {e}")
+            logger.error("AI title generation failed: %s", e)
             # Fallback to simple title extraction
             return self._generate_simple_title(messages)
 
+    def _get_openai_client(self):
+        """Shared OpenAI client, so title calls reuse its pooled HTTPS connections"""
+        if self._openai_client is None:
+            from openai import OpenAI
+            self._openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._openai_client
+
     def _generate_simple_title(self, messages):
         """
         Fallback: Generate simple title from first child message
@@ -552,7 +983,7 @@ Title:"""
             # Avoid circular import by importing here
             from knowledge_graph_service import knowledge_graph_service
 
-            logger.info(f"[KG] Starting knowledge extraction for conversation {conversation_id}")
+            logger.info("[KG] Starting knowledge extraction for conversation %s", conversation_id)
 
             knowledge_graph_service.extract_and_store(
                 user_id=user_id,
@@ -561,43 +992,39 @@ Title:"""
                 messages=messages
             )
 
-            logger.info(f"[KG] Knowledge extraction completed for conversation {conversation_id}")
+            logger.info("[KG] Knowledge extraction completed for conversation %s", conversation_id)
 
         except Exception as e:
-            logger.error(f"[KG] Knowledge extraction failed for {conversation_id}: {e}", exc_info=True)
+            logger.error("[KG] Knowledge extraction failed for %s: %s", conversation_id, e, exc_info=True)
             # Don't crash - extraction is non-critical, conversation already ended successfully
 
-    def _get_child_name(self, user_id, child_id):
-        """Get child name from Firestore"""
-        try:
-            child_ref = self.db.collection("users").document(user_id)\
-                .collection("children").document(child_id)
-            child_doc = child_ref.get()
-            if child_doc.exists:
-                return child_doc.to_dict().get("name")
-            return None
-        except Exception as e:
-            print(f"[ERROR] Failed to get child name: {e}")
-            return None
+    def _get_names(self, user_id, child_id, toy_id):
+        """
+        Get (child name, toy name) via the doc TTL cache - either is None if not found
 
-    def _get_toy_name(self, user_id, toy_id):
-        """Get toy name from Firestore"""
+        Names change rarely; writers that rename a child or toy drop the cached doc
+        with invalidate_cached_docs().
+        """
         try:
-            toy_ref = self.db.collection("users").document(user_id)\
-                .collection("toys").document(toy_id)
-            toy_doc = toy_ref.get()
-            if toy_doc.exists:
-                return toy_doc.to_dict().get("name")
-            return None
+            child_ref = self._child_ref(user_id, child_id)
+            refs = [child_ref]
+            toy_ref = self._toy_ref(user_id, toy_id) if toy_id else None
+            if toy_ref:
+                refs.append(toy_ref)
+
+            docs = self.get_documents_cached(refs)
+            child_data = docs.get(child_ref.path)
+            toy_data = docs.get(toy_ref.path) if toy_ref else None
+            return (child_data.get("name") if child_data else None,
+                    toy_data.get("name") if toy_data else None)
         except Exception as e:
-            print(f"[ERROR] Failed to get toy name: {e}")
-            return None
+            logger.error("Failed to get child/toy names: %s", e)
+            return None, None
 
     def _update_toy_status(self, user_id, toy_id, status="online"):
         """Update toy status and last connected time"""
         try:
-            toy_ref = self.db.collection("users").document(user_id)\
-                .collection("toys").document(toy_id)
+            toy_ref = self._toy_ref(user_id, toy_id)
 
             # Check if toy exists
             toy_doc = toy_ref.get()
@@ -607,10 +1034,10 @@ Title:"""
                     "status": status,
                     "lastConnected": firestore.SERVER_TIMESTAMP
                 })
-                print(f"[INFO] Updated toy {toy_id} status to {status}")
+                logger.info("Updated toy %s status to %s", toy_id, status)
             else:
                 # Toy doesn't exist - create a basic toy document
-                print(f"[WARNING] Toy {toy_id} not found, creating basic toy document")
+                logger.warning("Toy %s not found, creating basic toy document", toy_id)
                 toy_data = {
                     "deviceId": toy_id,  # Same as document ID
                     "name": f"Toy {toy_id[-6:]}",  # Use last 6 chars of ID
@@ -634,10 +1061,12 @@ Title:"""
                     "wifiConnected": True
                 }
                 toy_ref.set(toy_data)
-                print(f"[INFO] Created basic toy document for {toy_id}")
+                logger.info("Created basic toy document for %s", toy_id)
+
+            self.invalidate_cached_docs(toy_ref)
 
         except Exception as e:
-            print(f"[ERROR] Failed to update toy status: {e}")
+            logger.error("Failed to update toy status: %s", e)
 
     def _check_message_safety(self, content):
         """
@@ -646,34 +1075,42 @@ Title:"""
         Returns:
             dict with 'flagged', 'flagType', 'flagReason', 'severity'
         """
-        content_lower = content.lower()
-
-        for flag_type, patterns in SAFETY_KEYWORDS.items():
-            for pattern in patterns:
-                if re.search(pattern, content_lower, re.IGNORECASE):
-                    severity = self._determine_severity(flag_type)
-                    return {
-                        "flagged": True,
-                        "flagType": flag_type,
-                        "flagReason": f"Detected {flag_type.replace('_', ' ')}",
-                        "severity": severity,
-                    }
+        for flag_type, pattern in _COMPILED_SAFETY.items():
+            hint = _SAFETY_HINTS.get(flag_type)
+            if hint is not None and not hint.search(content):
+                continue
+            if pattern.search(content):
+                return {
+                    "flagged": True,
+                    "flagType": flag_type,
+                    "flagReason": f"Detected {flag_type.replace('_', ' ')}",
+                    "severity": SEVERITY_BY_FLAG_TYPE.get(flag_type, "low"),
+                }
 
         return {"flagged": False}
 
-    def _determine_severity(self, flag_type):
-        """Determine severity based on flag type"""
-        if flag_type == "personal_info":
-            return "critical"
-        elif flag_type == "inappropriate_content":
-            return "high"
-        elif flag_type == "emotional_distress":
-            return "medium"
-        else:
-            return "low"
-
     # ==================== QUERY OPERATIONS ====================
 
+    def _apply_cursor(self, query, user_id, cursor):
+        """
+        Resume a conversation query after the conversation with ID `cursor`
+
+        The cursor document's snapshot supplies the order-by values, so the query
+        continues exactly where the previous page ended.
+
+        Raises:
+            ValueError: If `cursor` is not a conversation ID
+        """
+        if not cursor:
+            return query
+
+        cursor_doc = self.db.collection("users").document(user_id)\
+            .collection("conversations").document(cursor).get()
+        if not cursor_doc.exists:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+        return query.start_after(cursor_doc)
+
     def get_conversation(self, user_id, conversation_id):
         """Get a specific conversation (UNIFIED SCHEMA)"""
         if not self.is_available():
@@ -690,10 +1127,10 @@ Title:"""
             return None
 
         except Exception as e:
-            print(f"[ERROR] Failed to get conversation: {e}")
+            logger.error("Failed to get conversation: %s", e)
             return None
 
-    def get_conversation_messages(self, user_id, conversation_id, limit=100):
+    def get_conversation_messages(self, user_id, conversation_id, limit=100, cursor=None):
         """
         Get messages for a conversation (ARRAY-BASED SCHEMA)
 
@@ -701,12 +1138,31 @@ Title:"""
             user_id: Parent user ID
             conversation_id: Conversation ID
             limit: Maximum number of messages to return (default: 100)
+            cursor: Optional nextCursor from a previous page (returns older messages)
 
         Returns:
             List of message dicts from the messages array
         """
+        messages, _ = self.get_conversation_messages_page(user_id, conversation_id, limit, cursor)
+        return messages
+
+    def get_conversation_messages_page(self, user_id, conversation_id, limit=100, cursor=None):
+        """
+        Get one page of messages, newest page first (ARRAY-BASED SCHEMA)
+
+        Messages live in an array on the conversation document whose front is
+        trimmed as it grows, so array indices shift; the cursor is instead the ID of
+        the oldest message already returned, and the next page is the `limit`
+        messages before it.
+
+        Returns:
+            tuple: (messages, next_cursor) - next_cursor is None on the oldest page
+
+        Raises:
+            ValueError: If `cursor` is not a message ID
+        """
         if not self.is_available():
-            return []
+            return [], None
 
         try:
             # Get conversation document
@@ -715,29 +1171,47 @@ Title:"""
 
             conv_doc = conv_ref.get()
             if not conv_doc.exists:
-                print(f"[ERROR] Conversation {conversation_id} not found")
-                return []
+                logger.error("Conversation %s not found", conversation_id)
+                return [], None
 
             conv_data = conv_doc.to_dict()
             messages = conv_data.get("messages", [])
-
-            # Apply limit (keep most recent messages)
-            if len(messages) > limit:
-                messages = messages[-limit:]
-
-            # Add index as ID for compatibility
-            for idx, msg in enumerate(messages):
+            for msg in messages:
                 if "id" not in msg:
-                    msg["id"] = f"msg_{idx}"
-
-            return messages
+                    msg["id"] = _message_id(msg)
 
+            # Page window: the `limit` messages before the cursor (default: most recent)
+            if cursor is None:
+                end = len(messages)
+            else:
+                end = next((i for i in range(len(messages) - 1, -1, -1)
+                            if messages[i]["id"] == cursor), None)
+                if end is None:
+                    if not _MESSAGE_ID_RE.fullmatch(cursor):
+                        raise ValueError(f"Invalid cursor: {cursor}")
+                    end = 0  # cursor message trimmed away - so is everything older
+            start = max(0, end - limit)
+            page = messages[start:end]
+
+            next_cursor = page[0]["id"] if start > 0 else None
+            return page, next_cursor
+
+        except ValueError:
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to get conversation messages: {e}")
-            return []
+            logger.error("Failed to get conversation messages: %s", e)
+            return [], None
+
+    def get_child_conversations(self, user_id, child_id, limit=50, cursor=None):
+        """
+        Get recent conversations for a child (UNIFIED SCHEMA)
 
-    def get_child_conversations(self, user_id, child_id, limit=50):
-        """Get recent conversations for a child (UNIFIED SCHEMA)"""
+        Args:
+            cursor: Optional conversation ID of the last item of the previous page
+
+        Raises:
+            ValueError: If `cursor` is not a conversation ID
+        """
         if not self.is_available():
             return []
 
@@ -745,9 +1219,10 @@ Title:"""
             # NEW QUERY: Filter by childId at user level
             conversations_ref = self.db.collection("users").document(user_id)\
                 .collection("conversations")\
+                .select(CONVERSATION_LIST_FIELDS)\
                 .where("childId", "==", child_id)\
-                .order_by("startTime", direction=firestore.Query.DESCENDING)\
-                .limit(limit)
+                .order_by("startTime", direction=firestore.Query.DESCENDING)
+            conversations_ref = self._apply_cursor(conversations_ref, user_id, cursor).limit(limit)
 
             conversations = []
             for doc in conversations_ref.stream():
@@ -757,61 +1232,69 @@ Title:"""
 
             return conversations
 
+        except ValueError:
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to get child conversations: {e}")
+            logger.error("Failed to get child conversations: %s", e)
             return []
 
-    def get_active_conversations(self, user_id, limit=20):
+    def get_active_conversations(self, user_id, limit=20, cursor=None):
         """Get all active conversations across all children (NEW METHOD)"""
         if not self.is_available():
             return []
 
         try:
-            # Collection-group query for active conversations
-            conversations_ref = self.db.collection_group("conversations")\
+            # Query only this user's conversations (served by a COLLECTION-scope composite
+            # index) rather than every user's via a collection group + client-side filter
+            conversations_ref = self.db.collection("users").document(user_id)\
+                .collection("conversations")\
+                .select(CONVERSATION_LIST_FIELDS)\
                 .where("status", "==", "active")\
-                .order_by("lastActivityAt", direction=firestore.Query.DESCENDING)\
-                .limit(limit)
+                .order_by("lastActivityAt", direction=firestore.Query.DESCENDING)
+            conversations_ref = self._apply_cursor(conversations_ref, user_id, cursor).limit(limit)
 
             conversations = []
             for doc in conversations_ref.stream():
                 conv_data = doc.to_dict()
                 conv_data["id"] = doc.id
-                # Filter to only this user's conversations
-                if doc.reference.parent.parent.id == user_id:
-                    conversations.append(conv_data)
+                conversations.append(conv_data)
 
             return conversations
 
+        except ValueError:
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to get active conversations: {e}")
+            logger.error("Failed to get active conversations: %s", e)
             return []
 
-    def get_flagged_conversations(self, user_id, limit=50):
+    def get_flagged_conversations(self, user_id, limit=50, cursor=None):
         """Get all flagged conversations (NEW METHOD)"""
         if not self.is_available():
             return []
 
         try:
-            # Collection-group query for flagged conversations
-            conversations_ref = self.db.collection_group("conversations")\
+            # Query only this user's conversations (served by a COLLECTION-scope composite
+            # index) rather than every user's via a collection group + client-side filter
+            conversations_ref = self.db.collection("users").document(user_id)\
+                .collection("conversations")\
+                .select(CONVERSATION_LIST_FIELDS)\
                 .where("flagged", "==", True)\
                 .where("flagStatus", "==", "unreviewed")\
-                .order_by("startTime", direction=firestore.Query.DESCENDING)\
-                .limit(limit)
+                .order_by("startTime", direction=firestore.Query.DESCENDING)
+            conversations_ref = self._apply_cursor(conversations_ref, user_id, cursor).limit(limit)
 
             conversations = []
             for doc in conversations_ref.stream():
                 conv_data = doc.to_dict()
                 conv_data["id"] = doc.id
-                # Filter to only this user's conversations
-                if doc.reference.parent.parent.id == user_id:
-                    conversations.append(conv_data)
+                conversations.append(conv_data)
 
             return conversations
 
+        except ValueError:
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to get flagged conversations: {e}")
+            logger.error("Failed to get flagged conversations: %s", e)
             return []
 
     def get_active_conversation_for_toy(self, user_id, toy_id):
@@ -836,7 +1319,7 @@ Title:"""
             return None
 
         except Exception as e:
-            print(f"[ERROR] Failed to get active conversation for toy: {e}")
+            logger.error("Failed to get active conversation for toy: %s", e)
             return None
 
     def get_active_conversation_for_child(self, user_id, child_id):
@@ -861,7 +1344,7 @@ Title:"""
             return None
 
         except Exception as e:
-            print(f"[ERROR] Failed to get active conversation for child: {e}")
+            logger.error("Failed to get active conversation for child: %s", e)
             return None
 
     # ==================== SESSION OPERATIONS (REMOVED - NOW USING UNIFIED CONVERSATIONS) ====================
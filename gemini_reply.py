@@ -17,6 +17,9 @@ CHARACTER_PROMPT = (
     "Respond with 2-5 complete sentences (30-100 words). Keep responses natural and engaging without special formatting or emojis."
 )
 
+GEMINI_MODEL = 'models/gemini-2.5-flash'  # Latest fast model
+FALLBACK_REPLY = "Hi! I'm Luna! Sorry, I had a little hiccup. Can you try again?"
+
 # Simple in-memory session storage
 CONVERSATIONS = {}
 
@@ -32,7 +35,7 @@ def clear_session_history(session_id):
     """
     if session_id in CONVERSATIONS:
         del CONVERSATIONS[session_id]
-        logger.info(f"Cleared conversation history for session {session_id}")
+        logger.info("Cleared conversation history for session %s", session_id)
 
 
 def get_session_message_count(session_id):
@@ -63,107 +66,168 @@ def get_gpt_reply(user_text, session_id="default", user_id=None, conversation_id
         str: Luna's reply
     """
     try:
-        logger.info(f"Gemini request | Session: {session_id} | Message: {user_text}")
+        logger.info("Gemini request | Session: %s | Message: %s", session_id, user_text)
 
-        # Get conversation history for this session
-        if session_id not in CONVERSATIONS:
-            CONVERSATIONS[session_id] = []
+        contents, enhanced_prompt = _build_request(user_text, session_id, user_id, child_id)
 
-        history = CONVERSATIONS[session_id]
+        # Generate response using new API
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=_generation_config(enhanced_prompt)
+        )
 
-        # Fetch child knowledge context if available (graph-based)
-        knowledge_context = ""
-        if child_id and user_id:
-            knowledge_context = _build_knowledge_context(user_id, child_id, user_text)
+        reply = response.text.strip()
 
-        # Build enhanced system prompt
-        enhanced_prompt = CHARACTER_PROMPT
-        if knowledge_context:
-            enhanced_prompt += knowledge_context
+        _record_turn(user_text, reply, session_id, user_id, conversation_id)
 
-        # Build conversation history for the new API
-        contents = []
+        return reply
 
-        # Add previous conversation context (last 6 messages = 3 turns)
-        for msg in history[-6:]:
-            role = "user" if msg["role"] == "user" else "model"
-            contents.append({
-                "role": role,
-                "parts": [{"text": msg["content"]}]
-            })
+    except Exception as e:
+        logger.error("Gemini request failed | Session: %s | Error: %s", session_id, e, exc_info=True)
+        return FALLBACK_REPLY
 
-        # Add current message
-        contents.append({
-            "role": "user",
-            "parts": [{"text": user_text}]
-        })
 
-        logger.debug(f"Using {len(contents)-1} previous messages for context")
+def stream_gpt_reply(user_text, session_id="default", user_id=None, conversation_id=None, child_id=None):
+    """
+    Streaming variant of get_gpt_reply - yields reply text chunks as Gemini produces them
 
-        # Generate response using new API
-        response = client.models.generate_content(
-            model='models/gemini-2.5-flash',  # Latest fast model
+    Lets TTS start on the first sentence while the rest of the reply is still
+    being generated. The full reply is saved to session memory and Firestore
+    once the stream completes, exactly like get_gpt_reply.
+
+    Args:
+        user_text: User's message
+        session_id: Session identifier
+        user_id: Parent user ID
+        conversation_id: Conversation ID for Firestore
+        child_id: Child ID for knowledge graph context
+
+    Yields:
+        str: Reply text chunks (the fallback reply if the request fails before any text)
+    """
+    chunks = []
+    try:
+        logger.info("Gemini stream request | Session: %s | Message: %s", session_id, user_text)
+
+        contents, enhanced_prompt = _build_request(user_text, session_id, user_id, child_id)
+
+        stream = client.models.generate_content_stream(
+            model=GEMINI_MODEL,
             contents=contents,
-            config={
-                'temperature': 0.9,
-                'top_p': 0.95,
-                'top_k': 40,
-                'max_output_tokens': 1024,
-                'system_instruction': enhanced_prompt,
-            }
+            config=_generation_config(enhanced_prompt)
         )
 
-        reply = response.text.strip()
+        for chunk in stream:
+            text = chunk.text
+            if text:
+                chunks.append(text)
+                yield text
 
-        # Save conversation turn to memory
-        CONVERSATIONS[session_id].append({"role": "user", "content": user_text})
-        CONVERSATIONS[session_id].append({"role": "assistant", "content": reply})
-
-        # Keep only last 10 messages (5 turns) to manage memory
-        if len(CONVERSATIONS[session_id]) > 10:
-            CONVERSATIONS[session_id] = CONVERSATIONS[session_id][-10:]
-
-        # Save to Firestore if metadata is provided
-        if user_id and conversation_id:
-            try:
-                # Save child message to array
-                logger.info(f"Saving child message to Firestore | Conversation: {conversation_id} | User: {user_id}")
-                success_child = firestore_service.add_message(
-                    user_id=user_id,
-                    conversation_id=conversation_id,
-                    sender="child",
-                    content=user_text
-                )
-                if success_child:
-                    logger.info(f"Child message saved successfully | Conversation: {conversation_id}")
-                else:
-                    logger.error(f"Failed to save child message | Conversation: {conversation_id}")
-
-                # Save toy message to array
-                logger.info(f"Saving toy message to Firestore | Conversation: {conversation_id} | User: {user_id}")
-                success_toy = firestore_service.add_message(
-                    user_id=user_id,
-                    conversation_id=conversation_id,
-                    sender="toy",
-                    content=reply
-                )
-                if success_toy:
-                    logger.info(f"Toy message saved successfully | Conversation: {conversation_id}")
-                else:
-                    logger.error(f"Failed to save toy message | Conversation: {conversation_id}")
-
-            except Exception as e:
-                logger.error(f"Failed to save messages to Firestore | Conversation: {conversation_id} | Error: {str(e)}", exc_info=True)
-                # Continue execution even if Firestore fails
-
-        logger.info(f"Gemini reply generated | Session: {session_id} | Reply: {reply[:100]}{'...' if len(reply) > 100 else ''}")
-        logger.debug(f"Session {session_id} now has {len(CONVERSATIONS[session_id])} messages")
+    except Exception as e:
+        logger.error("Gemini stream failed | Session: %s | Error: %s", session_id, e, exc_info=True)
+        if not chunks:
+            yield FALLBACK_REPLY
+            return
+
+    reply = "".join(chunks).strip()
+    if reply:
+        _record_turn(user_text, reply, session_id, user_id, conversation_id)
 
-        return reply
 
+def warmup_connection():
+    """Open the Gemini client's pooled TLS connection before the first reply"""
+    try:
+        client.models.get(model=GEMINI_MODEL)
+        logger.info("Gemini connection warmed up")
     except Exception as e:
-        logger.error(f"Gemini request failed | Session: {session_id} | Error: {str(e)}", exc_info=True)
-        return "Hi! I'm Luna! Sorry, I had a little hiccup. Can you try again?"
+        logger.warning("Gemini warmup failed: %s", e)
+
+
+def _build_request(user_text, session_id, user_id, child_id):
+    """
+    Build Gemini contents (history + current message) and the system prompt
+
+    Returns:
+        tuple: (contents, enhanced_prompt)
+    """
+    # Get conversation history for this session
+    if session_id not in CONVERSATIONS:
+        CONVERSATIONS[session_id] = []
+
+    history = CONVERSATIONS[session_id]
+
+    # Fetch child knowledge context if available (graph-based)
+    knowledge_context = ""
+    if child_id and user_id:
+        knowledge_context = _build_knowledge_context(user_id, child_id, user_text)
+
+    # Build enhanced system prompt
+    enhanced_prompt = CHARACTER_PROMPT
+    if knowledge_context:
+        enhanced_prompt += knowledge_context
+
+    # Build conversation history for the new API
+    contents = []
+
+    # Add previous conversation context (last 6 messages = 3 turns)
+    for msg in history[-6:]:
+        role = "user" if msg["role"] == "user" else "model"
+        contents.append({
+            "role": role,
+            "parts": [{"text": msg["content"]}]
+        })
+
+    # Add current message
+    contents.append({
+        "role": "user",
+        "parts": [{"text": user_text}]
+    })
+
+    logger.debug("Using %s previous messages for context", len(contents)-1)
+
+    return contents, enhanced_prompt
+
+
+def _generation_config(system_instruction):
+    """Gemini generation settings shared by the blocking and streaming calls"""
+    return {
+        'temperature': 0.9,
+        'top_p': 0.95,
+        'top_k': 40,
+        'max_output_tokens': 1024,
+        'system_instruction': system_instruction,
+    }
+
+
+def _record_turn(user_text, reply, session_id, user_id, conversation_id):
+    """Save a completed turn to session memory and (if metadata is provided) Firestore"""
+    # Save conversation turn to memory
+    CONVERSATIONS[session_id].append({"role": "user", "content": user_text})
+    CONVERSATIONS[session_id].append({"role": "assistant", "content": reply})
+
+    # Keep only last 10 messages (5 turns) to manage memory
+    if len(CONVERSATIONS[session_id]) > 10:
+        CONVERSATIONS[session_id] = CONVERSATIONS[session_id][-10:]
+
+    # Queue both messages to Firestore as one append if metadata is provided - the
+    # background writer commits it, so the reply isn't held up by the round-trip
+    if user_id and conversation_id:
+        try:
+            logger.info("Queueing turn for Firestore | Conversation: %s | User: %s", conversation_id, user_id)
+            firestore_service.enqueue_message_batch(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                child_message=user_text,
+                toy_message=reply
+            )
+
+        except Exception as e:
+            logger.error("Failed to queue messages for Firestore | Conversation: %s | Error: %s", conversation_id, e, exc_info=True)
+            # Continue execution even if Firestore fails
+
+    logger.info("Gemini reply generated | Session: %s | Reply: %s%s", session_id, reply[:100], '...' if len(reply) > 100 else '')
+    logger.debug("Session %s now has %s messages", session_id, len(CONVERSATIONS[session_id]))
 
 
 def _build_knowledge_context(user_id, child_id, current_message=""):
@@ -214,7 +278,7 @@ def _build_knowledge_context(user_id, child_id, current_message=""):
                 cluster_names = ', '.join([e['name'] for e in largest['entities'][:5]])
                 context_parts.append(f"- Interest area: {largest['label']} ({cluster_names})")
         except Exception as e:
-            logger.debug(f"[KG] Cluster detection skipped: {e}")
+            logger.debug("[KG] Cluster detection skipped: %s", e)
 
         # 4. Skills with learning progressions
         try:
@@ -239,7 +303,7 @@ def _build_knowledge_context(user_id, child_id, current_message=""):
                 if skill_context:
                     context_parts.append(f"- Skills: {', '.join(skill_context)}")
         except Exception as e:
-            logger.debug(f"[KG] Skills context skipped: {e}")
+            logger.debug("[KG] Skills context skipped: %s", e)
 
         # 5. Recent milestones
         milestones = _build_milestone_context(user_id, child_id, knowledge_graph_service)
@@ -269,12 +333,12 @@ def _build_knowledge_context(user_id, child_id, current_message=""):
         context_parts.append("Reference related topics naturally. Build on their interest areas.")
 
         context = "\n".join(context_parts)
-        logger.debug(f"[KG] Built graph-based knowledge context: {len(context)} chars")
+        logger.debug("[KG] Built graph-based knowledge context: %s chars", len(context))
 
         return context
 
     except Exception as e:
-        logger.error(f"[KG] Failed to build knowledge context: {e}", exc_info=True)
+        logger.error("[KG] Failed to build knowledge context: %s", e, exc_info=True)
         return ""
 
 
@@ -300,11 +364,11 @@ def _detect_mentioned_entities(user_id, child_id, message, kg_service):
             if name_lower in message_lower:
                 mentioned.append(entity)
 
-        logger.debug(f"[KG] Detected {len(mentioned)} entities in message")
+        logger.debug("[KG] Detected %s entities in message", len(mentioned))
         return mentioned[:5]  # Limit to 5
 
     except Exception as e:
-        logger.debug(f"[KG] Entity detection failed: {e}")
+        logger.debug("[KG] Entity detection failed: %s", e)
         return []
 
 
@@ -343,7 +407,7 @@ def _build_related_entities_context(user_id, child_id, mentioned_entities, graph
         return result if result else None
 
     except Exception as e:
-        logger.debug(f"[KG] Related entities context failed: {e}")
+        logger.debug("[KG] Related entities context failed: %s", e)
         return None
 
 
@@ -377,7 +441,7 @@ def _build_emotional_context(user_id, child_id, mentioned_entities, graph_servic
         return None
 
     except Exception as e:
-        logger.debug(f"[KG] Emotional context failed: {e}")
+        logger.debug("[KG] Emotional context failed: %s", e)
         return None
 
 
@@ -415,5 +479,5 @@ def _build_milestone_context(user_id, child_id, kg_service):
         return ', '.join(milestone_names)
 
     except Exception as e:
-        logger.debug(f"[KG] Milestone context failed: {e}")
+        logger.debug("[KG] Milestone context failed: %s", e)
         return None
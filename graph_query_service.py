@@ -49,7 +49,7 @@ class GraphQueryService:
                 totalEdges: int
         """
         try:
-            logger.debug(f"[GraphQuery] Finding related entities for {entity_id}, max_depth={max_depth}")
+            logger.debug("[GraphQuery] Finding related entities for %s, max_depth=%s", entity_id, max_depth)
 
             entities_by_depth = defaultdict(list)
             visited_entities = set()
@@ -103,7 +103,7 @@ class GraphQueryService:
             }
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error finding related entities: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error finding related entities: %s", e, exc_info=True)
             return {'entities': {}, 'edges': [], 'totalEntities': 0, 'totalEdges': 0}
 
     def get_entity_neighbors(self, user_id: str, child_id: str, entity_id: str,
@@ -154,7 +154,7 @@ class GraphQueryService:
             return neighbors[:limit]
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error getting neighbors: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error getting neighbors: %s", e, exc_info=True)
             return []
 
     def find_interest_clusters(self, user_id: str, child_id: str,
@@ -171,7 +171,7 @@ class GraphQueryService:
             List of cluster dicts: {clusterId, label, size, entities}
         """
         try:
-            logger.debug(f"[GraphQuery] Finding interest clusters for child {child_id}")
+            logger.debug("[GraphQuery] Finding interest clusters for child %s", child_id)
 
             # Get all interest/topic entities
             entities = self._get_entities_by_types(user_id, child_id, ['interest', 'topic'])
@@ -248,11 +248,11 @@ class GraphQueryService:
 
                     cluster_id += 1
 
-            logger.debug(f"[GraphQuery] Found {len(clusters)} clusters")
+            logger.debug("[GraphQuery] Found %s clusters", len(clusters))
             return clusters
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error finding clusters: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error finding clusters: %s", e, exc_info=True)
             return []
 
     def extract_context_subgraph(self, user_id: str, child_id: str,
@@ -273,7 +273,7 @@ class GraphQueryService:
             Dict with entities and edges
         """
         try:
-            logger.debug(f"[GraphQuery] Extracting subgraph from {len(seed_entities)} seeds")
+            logger.debug("[GraphQuery] Extracting subgraph from %s seeds", len(seed_entities))
 
             all_entities = []
             all_edges = []
@@ -285,11 +285,18 @@ class GraphQueryService:
                 queue.append((seed_id, 0))
                 visited.add(seed_id)
 
+            fetched = {}  # entity_id -> entity dict (None if missing)
+
             while queue and len(all_entities) < max_entities:
                 entity_id, current_depth = queue.popleft()
 
-                # Get entity
-                entity = self._get_entity(user_id, child_id, entity_id)
+                # Get entity - on a miss, batch-fetch it along with the entities queued
+                # behind it (up to what can still fit) in one get_all round-trip
+                if entity_id not in fetched:
+                    remaining = max_entities - len(all_entities)
+                    pending = [entity_id] + [qid for qid, _ in queue if qid not in fetched]
+                    fetched.update(self._get_entities(user_id, child_id, pending[:remaining]))
+                entity = fetched.get(entity_id)
                 if entity:
                     entity['isSeed'] = entity_id in seed_entities
                     all_entities.append(entity)
@@ -320,7 +327,7 @@ class GraphQueryService:
             }
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error extracting subgraph: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error extracting subgraph: %s", e, exc_info=True)
             return {'entities': [], 'edges': [], 'totalEntities': 0, 'totalEdges': 0}
 
     def get_prerequisite_chain(self, user_id: str, child_id: str,
@@ -338,7 +345,7 @@ class GraphQueryService:
             List of prerequisite entities (ordered from most prerequisite to entity)
         """
         try:
-            logger.debug(f"[GraphQuery] Finding prerequisite chain for {entity_id}")
+            logger.debug("[GraphQuery] Finding prerequisite chain for %s", entity_id)
 
             prerequisites = []
             visited = set([entity_id])
@@ -385,7 +392,7 @@ class GraphQueryService:
             return prerequisites
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error getting prerequisite chain: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error getting prerequisite chain: %s", e, exc_info=True)
             return []
 
     def find_learning_path(self, user_id: str, child_id: str,
@@ -405,7 +412,7 @@ class GraphQueryService:
             List of entities in path (start to target) or None if no path found
         """
         try:
-            logger.debug(f"[GraphQuery] Finding path from {start_entity_id} to {target_entity_id}")
+            logger.debug("[GraphQuery] Finding path from %s to %s", start_entity_id, target_entity_id)
 
             # BFS with path tracking
             queue = deque([(start_entity_id, [start_entity_id])])
@@ -442,11 +449,11 @@ class GraphQueryService:
                         visited.add(next_id)
                         queue.append((next_id, path + [next_id]))
 
-            logger.debug(f"[GraphQuery] No path found")
+            logger.debug("[GraphQuery] No path found")
             return None
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error finding path: {e}", exc_info=True)
+            logger.error("[GraphQuery] Error finding path: %s", e, exc_info=True)
             return None
 
     # Helper methods
@@ -466,9 +473,27 @@ class GraphQueryService:
             return None
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error getting entity {entity_id}: {e}")
+            logger.error("[GraphQuery] Error getting entity %s: %s", entity_id, e)
             return None
 
+    def _get_entities(self, user_id: str, child_id: str, entity_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        """Get several entities by ID in one batched get_all RPC"""
+        try:
+            entities_ref = self.db.collection("users").document(user_id)\
+                .collection("children").document(child_id)\
+                .collection("entities")
+
+            entities = {entity_id: None for entity_id in entity_ids}
+            for entity_doc in self.db.get_all([entities_ref.document(eid) for eid in entity_ids]):
+                if entity_doc.exists:
+                    entities[entity_doc.id] = entity_doc.to_dict()
+
+            return entities
+
+        except Exception as e:
+            logger.error("[GraphQuery] Error getting entities %s: %s", entity_ids, e)
+            return {entity_id: None for entity_id in entity_ids}
+
     def _get_entity_edges(self, user_id: str, child_id: str, entity_id: str,
                          edge_types: Optional[List[str]] = None,
                          min_weight: float = 0.0) -> List[Dict]:
@@ -512,7 +537,7 @@ class GraphQueryService:
             return all_edges
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error getting edges for {entity_id}: {e}")
+            logger.error("[GraphQuery] Error getting edges for %s: %s", entity_id, e)
             return []
 
     def _get_entities_by_types(self, user_id: str, child_id: str,
@@ -533,5 +558,5 @@ class GraphQueryService:
             return all_entities
 
         except Exception as e:
-            logger.error(f"[GraphQuery] Error getting entities by type: {e}")
+            logger.error("[GraphQuery] Error getting entities by type: %s", e)
             return []
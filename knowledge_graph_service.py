@@ -9,6 +9,7 @@ Extracts and stores knowledge entities from conversations:
 - Personality Traits (character attributes & emotional intelligence)
 """
 
+import itertools
 import json
 import re
 from datetime import datetime
@@ -16,10 +17,20 @@ from typing import Dict, List, Optional, Any
 from openai import OpenAI
 import os
 from google.cloud import firestore
-from firestore_service import firestore_service
+from firestore_service import firestore_service, FIRESTORE_POOL
 from logging_config import get_logger
 
 logger = get_logger(__name__)
+
+# Summary stat name -> entity type counted for it
+SUMMARY_COUNT_TYPES = {
+    "topicsCount": "topic",
+    "skillsCount": "skill",
+    "interestsCount": "interest",
+    "conceptsCount": "concept",
+    "traitsCount": "personality_trait",
+}
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
@@ -35,6 +46,17 @@ class KnowledgeGraphService:
         """
         self.fs = firestore_svc
         self.db = firestore_svc.db
+        # (user_id, child_id) -> version, changed after every extraction so callers can
+        # key caches of graph reads on it
+        self._graph_versions = {}
+        self._version_counter = itertools.count(1)
+
+    def get_graph_version(self, user_id: str, child_id: str) -> int:
+        """Current version of a child's graph (changes whenever extraction writes to it)"""
+        return self._graph_versions.get((user_id, child_id), 0)
+
+    def _bump_graph_version(self, user_id: str, child_id: str):
+        self._graph_versions[(user_id, child_id)] = next(self._version_counter)
 
     def extract_and_store(self, user_id: str, conversation_id: str, child_id: str, messages: List[Dict]):
         """
@@ -47,14 +69,14 @@ class KnowledgeGraphService:
             messages: List of message dicts from conversation
         """
         try:
-            logger.info(f"[KG] Starting extraction for conversation {conversation_id}")
+            logger.info("[KG] Starting extraction for conversation %s", conversation_id)
 
             # Get child profile for age_level context
             child_doc = self.db.collection("users").document(user_id)\
                 .collection("children").document(child_id).get()
 
             if not child_doc.exists:
-                logger.error(f"[KG] Child {child_id} not found")
+                logger.error("[KG] Child %s not found", child_id)
                 return
 
             child_data = child_doc.to_dict()
@@ -64,7 +86,7 @@ class KnowledgeGraphService:
             extracted_data = self._call_extraction_llm(messages, child_age_level)
 
             if not extracted_data:
-                logger.warning(f"[KG] No data extracted from conversation {conversation_id}")
+                logger.warning("[KG] No data extracted from conversation %s", conversation_id)
                 return
 
             # Store entities and build entity name -> ID mapping
@@ -91,7 +113,7 @@ class KnowledgeGraphService:
             # Extract and store edges (relationships)
             relationships = extracted_data.get('relationships', [])
             if relationships:
-                logger.debug(f"[KG] Found {len(relationships)} relationships to extract")
+                logger.debug("[KG] Found %s relationships to extract", len(relationships))
                 self._extract_and_store_edges(
                     user_id, child_id, conversation_id,
                     relationships, entities_map
@@ -103,10 +125,14 @@ class KnowledgeGraphService:
             # Update summary document
             self._update_summary(user_id, child_id)
 
-            logger.info(f"[KG] Extraction complete for {conversation_id}: {entity_count} entities")
+            logger.info("[KG] Extraction complete for %s: %s entities", conversation_id, entity_count)
 
         except Exception as e:
-            logger.error(f"[KG] Extraction failed for {conversation_id}: {e}", exc_info=True)
+            logger.error("[KG] Extraction failed for %s: %s", conversation_id, e, exc_info=True)
+
+        finally:
+            # Even a partial extraction may have written entities/edges
+            self._bump_graph_version(user_id, child_id)
 
     def _call_extraction_llm(self, messages: List[Dict], child_age_level: str) -> Optional[Dict]:
         """
@@ -135,18 +161,19 @@ class KnowledgeGraphService:
             # Parse JSON response
             extracted_data = json.loads(response_text)
 
-            logger.debug(f"[KG] Extracted {len(extracted_data.get('topics', []))} topics, "
-                        f"{len(extracted_data.get('skills', []))} skills, "
-                        f"{len(extracted_data.get('interests', []))} interests")
+            logger.debug("[KG] Extracted %s topics, "
+                        "%s skills, "
+                        "%s interests",
+                         len(extracted_data.get('topics', [])), len(extracted_data.get('skills', [])), len(extracted_data.get('interests', [])))
 
             return extracted_data
 
         except json.JSONDecodeError as e:
-            logger.error(f"[KG] Failed to parse LLM response as JSON: {e}")
-            logger.error(f"[KG] Response text: {response_text[:500]}")
+            logger.error("[KG] Failed to parse LLM response as JSON: %s", e)
+            logger.error("[KG] Response text: %s", response_text[:500])
             return None
         except Exception as e:
-            logger.error(f"[KG] LLM extraction failed: {e}", exc_info=True)
+            logger.error("[KG] LLM extraction failed: %s", e, exc_info=True)
             return None
 
     def _build_extraction_prompt(self, messages: List[Dict], child_age_level: str) -> str:
@@ -454,7 +481,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             return None
 
         except Exception as e:
-            logger.error(f"[KG] Error resolving entity match: {e}")
+            logger.error("[KG] Error resolving entity match: %s", e)
             return None
 
     def _create_or_update_entity(self, user_id: str, child_id: str, entity_data: Dict,
@@ -472,13 +499,13 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
         try:
             name = entity_data.get("name")
             if not name:
-                logger.warning(f"[KG] Entity missing name: {entity_data}")
+                logger.warning("[KG] Entity missing name: %s", entity_data)
                 return
 
             # Check minimum confidence threshold
             confidence = entity_data.get("confidence", 0)
             if confidence < 0.7:
-                logger.debug(f"[KG] Skipping low-confidence entity: {name} ({confidence})")
+                logger.debug("[KG] Skipping low-confidence entity: %s (%s)", name, confidence)
                 return
 
             # Generate entity ID
@@ -523,7 +550,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 update_data["recentObservations"] = recent_obs[-5:]
 
                 entity_ref.update(update_data)
-                logger.debug(f"[KG] Updated entity: {entity_id}")
+                logger.debug("[KG] Updated entity: %s", entity_id)
 
             else:
                 # CREATE new entity
@@ -617,10 +644,10 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                     }
 
                 entity_ref.set(new_entity)
-                logger.debug(f"[KG] Created entity: {entity_id}")
+                logger.debug("[KG] Created entity: %s", entity_id)
 
         except Exception as e:
-            logger.error(f"[KG] Error creating/updating entity: {e}", exc_info=True)
+            logger.error("[KG] Error creating/updating entity: %s", e, exc_info=True)
 
     def _extract_and_store_edges(self, user_id: str, child_id: str, conversation_id: str,
                                  relationships: List[Dict], entities_map: Dict[str, str]):
@@ -635,12 +662,12 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             entities_map: Mapping of "type_name" to entity ID
         """
         try:
-            logger.debug(f"[KG] Extracting {len(relationships)} relationships")
+            logger.debug("[KG] Extracting %s relationships", len(relationships))
 
             for rel in relationships:
                 # Skip low-confidence relationships
                 if rel.get('confidence', 0) < 0.7:
-                    logger.debug(f"[KG] Skipping low-confidence relationship: {rel.get('sourceEntity')} -> {rel.get('targetEntity')} ({rel.get('confidence')})")
+                    logger.debug("[KG] Skipping low-confidence relationship: %s -> %s (%s)", rel.get('sourceEntity'), rel.get('targetEntity'), rel.get('confidence'))
                     continue
 
                 # Resolve entity IDs from names
@@ -651,7 +678,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 target_id = entities_map.get(target_key)
 
                 if not source_id or not target_id:
-                    logger.warning(f"[KG] Could not resolve entity IDs for relationship: {source_key} -> {target_key}")
+                    logger.warning("[KG] Could not resolve entity IDs for relationship: %s -> %s", source_key, target_key)
                     continue
 
                 # Create or update edge
@@ -664,7 +691,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 )
 
         except Exception as e:
-            logger.error(f"[KG] Error extracting edges: {e}", exc_info=True)
+            logger.error("[KG] Error extracting edges: %s", e, exc_info=True)
 
     def _create_or_update_edge(self, user_id: str, child_id: str, conversation_id: str,
                                source_id: str, source_type: str, source_name: str,
@@ -734,7 +761,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 update_data['evidenceSnippets'] = snippets[-3:]
 
                 edge_ref.update(update_data)
-                logger.debug(f"[KG] Updated edge: {edge_id} (new weight: {new_weight:.2f})")
+                logger.debug("[KG] Updated edge: %s (new weight: %.2f)", edge_id, new_weight)
 
             else:
                 # CREATE new edge
@@ -765,13 +792,13 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 }
 
                 edge_ref.set(new_edge)
-                logger.debug(f"[KG] Created edge: {edge_id}")
+                logger.debug("[KG] Created edge: %s", edge_id)
 
             # Update entity edge stats
             self._update_entity_edge_stats(user_id, child_id, source_id, target_id, edge_type)
 
         except Exception as e:
-            logger.error(f"[KG] Error creating/updating edge {edge_type} {source_id}->{target_id}: {e}", exc_info=True)
+            logger.error("[KG] Error creating/updating edge %s %s->%s: %s", edge_type, source_id, target_id, e, exc_info=True)
 
     def _update_entity_edge_stats(self, user_id: str, child_id: str,
                                   source_id: str, target_id: str, edge_type: str):
@@ -821,10 +848,10 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                     'lastGraphUpdateAt': datetime.utcnow()
                 })
 
-            logger.debug(f"[KG] Updated edge stats for {source_id} and {target_id}")
+            logger.debug("[KG] Updated edge stats for %s and %s", source_id, target_id)
 
         except Exception as e:
-            logger.error(f"[KG] Error updating entity edge stats: {e}", exc_info=True)
+            logger.error("[KG] Error updating entity edge stats: %s", e, exc_info=True)
 
     def _create_observation(self, user_id: str, child_id: str, conversation_id: str, extracted_data: Dict):
         """
@@ -876,10 +903,10 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 .collection("observations").document(observation_id)
 
             observation_ref.set(observation_doc)
-            logger.debug(f"[KG] Created observation: {observation_id}")
+            logger.debug("[KG] Created observation: %s", observation_id)
 
         except Exception as e:
-            logger.error(f"[KG] Error creating observation: {e}", exc_info=True)
+            logger.error("[KG] Error creating observation: %s", e, exc_info=True)
 
     def _update_summary(self, user_id: str, child_id: str):
         """
@@ -890,69 +917,57 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             child_id: Child ID
         """
         try:
-            # Query all entities for this child
             entities_ref = self.db.collection("users").document(user_id)\
                 .collection("children").document(child_id)\
                 .collection("entities")
 
-            entities = list(entities_ref.stream())
-
-            # Count by type
-            stats = {
-                "totalEntities": len(entities),
-                "topicsCount": 0,
-                "skillsCount": 0,
-                "interestsCount": 0,
-                "conceptsCount": 0,
-                "traitsCount": 0,
+            def count(query):
+                return query.count().get()[0][0].value
+
+            def top(entity_type, order_field, direction):
+                query = entities_ref.where("type", "==", entity_type)\
+                    .order_by(order_field, direction=direction).limit(5)
+                return [doc.to_dict() for doc in query.stream()]
+
+            # Server-side count aggregations plus top-5 queries, run concurrently -
+            # instead of streaming every entity document just to count and rank them.
+            # order_by skips entities missing the ranked field; legacy ones get the
+            # old defaults from scripts/backfill_entity_ranking_fields.py
+            count_futures = {
+                stat: FIRESTORE_POOL.submit(count, entities_ref.where("type", "==", entity_type))
+                for stat, entity_type in SUMMARY_COUNT_TYPES.items()
             }
-
-            topics = []
-            skills = []
-            interests = []
-
-            for entity_doc in entities:
-                entity = entity_doc.to_dict()
-                entity_type = entity.get("type", "")
-
-                if entity_type == "topic":
-                    stats["topicsCount"] += 1
-                    topics.append({
-                        "id": entity["id"],
-                        "name": entity["name"],
-                        "count": entity.get("mentionCount", 1)
-                    })
-                elif entity_type == "skill":
-                    stats["skillsCount"] += 1
-                    skills.append({
-                        "id": entity["id"],
-                        "name": entity["name"],
-                        "level": entity.get("attributes", {}).get("masteryLevel", "emerging")
-                    })
-                elif entity_type == "interest":
-                    stats["interestsCount"] += 1
-                    interests.append({
-                        "id": entity["id"],
-                        "name": entity["name"],
-                        "strength": entity.get("strength", 0.5)
-                    })
-                elif entity_type == "concept":
-                    stats["conceptsCount"] += 1
-                elif entity_type == "personality_trait":
-                    stats["traitsCount"] += 1
-
-            # Sort and get top 5
-            topics.sort(key=lambda x: x["count"], reverse=True)
-            skills.sort(key=lambda x: x["name"])
-            interests.sort(key=lambda x: x["strength"], reverse=True)
+            total_future = FIRESTORE_POOL.submit(count, entities_ref)
+            topics_future = FIRESTORE_POOL.submit(top, "topic", "mentionCount", firestore.Query.DESCENDING)
+            skills_future = FIRESTORE_POOL.submit(top, "skill", "name", firestore.Query.ASCENDING)
+            interests_future = FIRESTORE_POOL.submit(top, "interest", "strength", firestore.Query.DESCENDING)
+
+            stats = {"totalEntities": total_future.result()}
+            stats.update({stat: future.result() for stat, future in count_futures.items()})
+
+            topics = [{
+                "id": entity["id"],
+                "name": entity["name"],
+                "count": entity.get("mentionCount", 1)
+            } for entity in topics_future.result()]
+            skills = [{
+                "id": entity["id"],
+                "name": entity["name"],
+                "level": entity.get("attributes", {}).get("masteryLevel", "emerging")
+            } for entity in skills_future.result()]
+            interests = [{
+                "id": entity["id"],
+                "name": entity["name"],
+                "strength": entity.get("strength", 0.5)
+            } for entity in interests_future.result()]
 
             summary_doc = {
                 "childId": child_id,
                 "lastUpdatedAt": datetime.utcnow(),  # Use datetime for set() operation
                 "stats": stats,
-                "topTopics": topics[:5],
-                "topSkills": skills[:5],
-                "topInterests": interests[:5],
+                "topTopics": topics,
+                "topSkills": skills,
+                "topInterests": interests,
                 "learningProfile": {
                     "ageLevel": "elementary",  # Get from child profile
                     "curiosityScore": 0.8,  # Calculate from entity data
@@ -966,10 +981,10 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
                 .collection("knowledgeGraph").document("summary")
 
             summary_ref.set(summary_doc, merge=True)
-            logger.debug(f"[KG] Updated summary for child {child_id}")
+            logger.debug("[KG] Updated summary for child %s", child_id)
 
         except Exception as e:
-            logger.error(f"[KG] Error updating summary: {e}", exc_info=True)
+            logger.error("[KG] Error updating summary: %s", e, exc_info=True)
 
     def get_summary(self, user_id: str, child_id: str) -> Optional[Dict]:
         """
@@ -995,7 +1010,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             return summary_doc.to_dict()
 
         except Exception as e:
-            logger.error(f"[KG] Error getting summary: {e}", exc_info=True)
+            logger.error("[KG] Error getting summary: %s", e, exc_info=True)
             return None
 
     def get_entities(self, user_id: str, child_id: str, filters: Dict) -> List[Dict]:
@@ -1005,7 +1020,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
         Args:
             user_id: Parent user ID
             child_id: Child ID
-            filters: Dict with optional keys: type, limit, orderBy
+            filters: Dict with optional keys: type, types, limit, orderBy
 
         Returns:
             List of entity dicts
@@ -1020,6 +1035,13 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             # Filter by type
             if filters.get("type"):
                 query = query.where("type", "==", filters["type"])
+            elif filters.get("types"):
+                # Firestore caps 'in' at 30 values - more than every entity type there is
+                types = list(dict.fromkeys(filters["types"]))[:30]
+                if len(types) == 1:
+                    query = query.where("type", "==", types[0])
+                else:
+                    query = query.where("type", "in", types)
 
             # Order by field
             order_by = filters.get("orderBy", "strength")
@@ -1038,7 +1060,7 @@ RESPOND ONLY WITH VALID JSON. NO EXPLANATIONS."""
             return entities
 
         except Exception as e:
-            logger.error(f"[KG] Error querying entities: {e}", exc_info=True)
+            logger.error("[KG] Error querying entities: %s", e, exc_info=True)
             return []
 
 
@@ -9,9 +9,9 @@ sleep 2
 echo "Starting Gunicorn..."
 cd /home/ec2-user/backend
 source venv/bin/activate
-gunicorn --bind 127.0.0.1:5005 \
+gunicorn --config config/gunicorn.conf.py \
+    --bind 127.0.0.1:5005 \
     --workers 4 \
-    --threads 2 \
     --timeout 300 \
     --access-logfile /var/log/luno/access.log \
     --error-logfile /var/log/luno/error.log \
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Backfill Knowledge Graph Entity Ranking Fields
+Sets mentionCount / strength on entity documents created without them
+
+The knowledge graph summary ranks topTopics by mentionCount and topInterests by
+strength with Firestore order_by queries, which leave out documents missing the
+field. This gives legacy entities the same defaults the summary used to assume
+(mentionCount 1, strength 0.5) so they are ranked again.
+"""
+
+from firebase_config import get_firestore_client
+
+RANKING_DEFAULTS = {
+    "mentionCount": 1,
+    "strength": 0.5,
+}
+BATCH_SIZE = 400
+
+
+def main():
+    db = get_firestore_client()
+    if db is None:
+        print("✗ Firestore not available")
+        return
+
+    batch = db.batch()
+    pending = 0
+    scanned = 0
+    updated = 0
+
+    for doc in db.collection_group("entities").select(list(RANKING_DEFAULTS)).stream():
+        scanned += 1
+        data = doc.to_dict()
+        missing = {field: value for field, value in RANKING_DEFAULTS.items() if field not in data}
+        if not missing:
+            continue
+
+        batch.update(doc.reference, missing)
+        pending += 1
+        updated += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"✓ Scanned {scanned} entities, backfilled {updated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -207,8 +207,8 @@ bind = "127.0.0.1:5005"
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-threads = 2
+worker_class = "gthread"
+threads = 8
 
 # Timeouts
 timeout = 300
@@ -252,7 +252,6 @@ ExecStart=/opt/luno/backend/venv/bin/gunicorn \
     --config /opt/luno/backend/config/gunicorn.conf.py \
     --bind 127.0.0.1:5005 \
     --workers 4 \
-    --threads 2 \
     --timeout 300 \
     --access-logfile /var/log/luno/access.log \
     --error-logfile /var/log/luno/error.log \
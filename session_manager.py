@@ -1,4 +1,5 @@
 import os
+import sched
 import time
 import threading
 from datetime import datetime, timedelta
@@ -6,6 +7,9 @@ from datetime import datetime, timedelta
 # Server start time for restart detection
 SERVER_START_TIME = time.time()
 
+# Safety-net sweep interval for orphaned/missed sessions (expiry timers handle the common case)
+SAFETY_NET_INTERVAL_SECONDS = int(os.getenv("SESSION_SAFETY_NET_INTERVAL", 600))  # Default 10 minutes
+
 class SessionManager:
     def __init__(self, firestore_service):
         """
@@ -15,12 +19,91 @@ class SessionManager:
             firestore_service: FirestoreService instance for database operations
         """
         self.fs = firestore_service
-        self._lock = threading.Lock()  # Thread safety for ACTIVE_CONVERSATIONS
+        self._lock = threading.RLock()  # Guards every read/write/iteration of ACTIVE_CONVERSATIONS
         self.INACTIVITY_TIMEOUT_SECONDS = int(os.getenv("SESSION_INACTIVITY_TIMEOUT", 120))  # Default 2 minutes (reasonable for conversations)
         self.ACTIVE_CONVERSATIONS = {}  # In-memory cache: session_id -> session_data
 
+        # Expiry scheduler: one daemon thread sleeps until the next session expiry
+        # (or safety-net tick) instead of polling Firestore on a fixed interval
+        self._wakeup = threading.Event()
+        self._scheduler = sched.scheduler(time.time, self._scheduler_delay)
+        self._scheduler_thread = None
+
         print(f"[INFO] SessionManager initialized with {self.INACTIVITY_TIMEOUT_SECONDS}s inactivity timeout")
 
+    # ==================== EXPIRY SCHEDULER ====================
+
+    def start_background_scheduler(self):
+        """
+        Start the single background thread that ends sessions at their expiry time
+
+        Expiry timers are registered as sessions enter memory; a safety-net sweep
+        runs every SAFETY_NET_INTERVAL_SECONDS to catch orphans from other workers.
+        """
+        if self._scheduler_thread is not None:
+            return
+
+        self._scheduler.enter(SAFETY_NET_INTERVAL_SECONDS, 2, self._run_safety_net)
+        self._scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
+        self._scheduler_thread.start()
+
+    def _scheduler_delay(self, timeout):
+        """Sleep until the next event is due, waking early if a new event was scheduled"""
+        if timeout > 0:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def _run_scheduler(self):
+        """Scheduler thread body (the safety-net event keeps the queue non-empty)"""
+        while True:
+            try:
+                self._scheduler.run()
+            except Exception as e:
+                print(f"[ERROR] Session scheduler failed: {e}")
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+    def _schedule_expiry(self, session_id, expires_at):
+        """Register an expiry check for a session at an absolute epoch time"""
+        self._scheduler.enterabs(expires_at, 1, self.cleanup_session, (session_id,))
+        self._wakeup.set()
+
+    def _run_safety_net(self):
+        """Periodic sweep for sessions the expiry timers could not see"""
+        try:
+            self.cleanup_expired_sessions()
+        finally:
+            self._scheduler.enter(SAFETY_NET_INTERVAL_SECONDS, 2, self._run_safety_net)
+
+    def cleanup_session(self, session_id):
+        """
+        Expiry timer callback for a single session
+
+        Reschedules itself if the session saw activity since the timer was set,
+        otherwise confirms expiry with Firestore and ends the session.
+
+        Args:
+            session_id: Session ID (conversation_id)
+        """
+        with self._lock:
+            session_data = self.ACTIVE_CONVERSATIONS.get(session_id)
+        if not session_data:
+            return  # Already ended
+
+        last_activity = session_data.get('last_activity', session_data.get('start_time'))
+        expires_at = last_activity + self.INACTIVITY_TIMEOUT_SECONDS
+        if expires_at > time.time():
+            self._schedule_expiry(session_id, expires_at)
+            return
+
+        user_id = session_data.get('user_id')
+        if self.is_session_expired(session_id, user_id):
+            print(f"[INFO] Expiry timer: Ending expired session {session_id}")
+            self.end_session(session_id, user_id, reason="cleanup_expired")
+        else:
+            # Another worker recorded activity on this conversation
+            self._schedule_expiry(session_id, time.time() + self.INACTIVITY_TIMEOUT_SECONDS)
+
     def generate_session_id(self, toy_id, user_id):
         """
         Generate unique session ID
@@ -66,14 +149,15 @@ class SessionManager:
         # Look for any active session for this toy-user pair in memory
         with self._lock:
             cached_session_id = None
+            cached_session = None
             for sid, data in self.ACTIVE_CONVERSATIONS.items():
                 if data.get('toy_id') == toy_id and data.get('user_id') == user_id:
                     cached_session_id = sid
+                    cached_session = data
                     break
 
         if cached_session_id:
             # BUGFIX: Check if cached session has expired
-            cached_session = self.ACTIVE_CONVERSATIONS[cached_session_id]
             last_activity = cached_session.get('last_activity', cached_session.get('start_time'))
             time_since_activity = time.time() - last_activity
 
@@ -162,7 +246,9 @@ class SessionManager:
             'message_count': firestore_session.get('messageCount', 0),
         }
 
-        self.ACTIVE_CONVERSATIONS[conversation_id] = session_data
+        with self._lock:
+            self.ACTIVE_CONVERSATIONS[conversation_id] = session_data
+        self._schedule_expiry(conversation_id, last_activity + self.INACTIVITY_TIMEOUT_SECONDS)
         return session_data
 
     def _create_new_session(self, toy_id, user_id, child_id=None):
@@ -220,6 +306,7 @@ class SessionManager:
 
         with self._lock:
             self.ACTIVE_CONVERSATIONS[conversation_id] = session_data
+        self._schedule_expiry(conversation_id, current_time + self.INACTIVITY_TIMEOUT_SECONDS)
 
         print(f"[INFO] Created new conversation: {conversation_id} (status: active)")
         return session_data
@@ -234,9 +321,11 @@ class SessionManager:
         """
         # Update in-memory cache
         current_time = time.time()
-        if session_id in self.ACTIVE_CONVERSATIONS:
-            self.ACTIVE_CONVERSATIONS[session_id]['message_count'] += 1
-            self.ACTIVE_CONVERSATIONS[session_id]['last_activity'] = current_time
+        with self._lock:
+            session_data = self.ACTIVE_CONVERSATIONS.get(session_id)
+            if session_data:
+                session_data['message_count'] += 1
+                session_data['last_activity'] = current_time
 
         # Note: Firestore lastActivityAt is updated by batch writes in add_message_batch
         # So we don't need a separate update here anymore
@@ -251,7 +340,8 @@ class SessionManager:
             reason: Reason for ending (explicit, inactivity_timeout, server_restart, etc.)
         """
         # Get session data for conversation cleanup
-        session_data = self.ACTIVE_CONVERSATIONS.get(session_id)
+        with self._lock:
+            session_data = self.ACTIVE_CONVERSATIONS.get(session_id)
 
         if session_data:
             conversation_id = session_data.get('conversation_id')
@@ -269,9 +359,9 @@ class SessionManager:
                     duration_minutes=duration_minutes
                 )
 
-            # Remove from memory (thread-safe)
+            # Remove from memory (thread-safe; another thread may have ended it concurrently)
             with self._lock:
-                del self.ACTIVE_CONVERSATIONS[session_id]
+                self.ACTIVE_CONVERSATIONS.pop(session_id, None)
 
             print(f"[INFO] Ended conversation {session_id}, duration: {duration_minutes}m, reason: {reason}")
 
@@ -362,14 +452,16 @@ class SessionManager:
         print("[INFO] Running session cleanup task...")
 
         try:
-            # Check in-memory sessions (thread-safe)
+            # Snapshot in-memory sessions under the lock, then check Firestore without holding it
             expired_sessions = []
 
             with self._lock:
-                for session_id, session_data in list(self.ACTIVE_CONVERSATIONS.items()):
-                    user_id = session_data.get('user_id')
-                    if self.is_session_expired(session_id, user_id):
-                        expired_sessions.append((session_id, user_id))
+                snapshot = list(self.ACTIVE_CONVERSATIONS.items())
+
+            for session_id, session_data in snapshot:
+                user_id = session_data.get('user_id')
+                if self.is_session_expired(session_id, user_id):
+                    expired_sessions.append((session_id, user_id))
 
             # End expired sessions
             for session_id, user_id in expired_sessions:
@@ -437,9 +529,10 @@ class SessionManager:
             str: Conversation ID or None
         """
         # Check in-memory first
-        for conversation_id, data in self.ACTIVE_CONVERSATIONS.items():
-            if data.get('toy_id') == toy_id and data.get('user_id') == user_id:
-                return conversation_id
+        with self._lock:
+            for conversation_id, data in self.ACTIVE_CONVERSATIONS.items():
+                if data.get('toy_id') == toy_id and data.get('user_id') == user_id:
+                    return conversation_id
 
         # Check Firestore (unified schema)
         conversation = self.fs.get_active_conversation_for_toy(user_id, toy_id)
@@ -0,0 +1,270 @@
+"""
+Unit tests for the in-process auth caches and SingleFlight
+
+Covers the LRU/TTL caches behind require_device_auth, which rejections the
+negative cache remembers, and how SingleFlight shares a leader's result or
+error. Nothing here talks to Firestore - validate_with_firestore is replaced.
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+import auth_middleware
+from auth_middleware import AuthenticationError, require_device_auth
+from firestore_service import SingleFlight
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    auth_middleware.auth_cache.clear()
+    auth_middleware.auth_neg_cache.clear()
+    yield
+    auth_middleware.auth_cache.clear()
+    auth_middleware.auth_neg_cache.clear()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(auth_middleware, "time", fake)
+    return fake
+
+
+# ==================== LRU / TTL ====================
+
+def test_lru_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(auth_middleware, "CACHE_MAX_ENTRIES", 3)
+    cache = auth_middleware.auth_cache
+
+    for key in ("a", "b", "c"):
+        auth_middleware._lru_put(cache, key, key.upper(), ttl=60)
+    assert auth_middleware._lru_get(cache, "a") == "A"  # "a" is now most recent
+
+    auth_middleware._lru_put(cache, "d", "D", ttl=60)
+
+    assert list(cache) == ["c", "a", "d"]
+    assert auth_middleware._lru_get(cache, "b") is None
+
+
+def test_lru_put_refreshes_existing_key(monkeypatch):
+    monkeypatch.setattr(auth_middleware, "CACHE_MAX_ENTRIES", 2)
+    cache = auth_middleware.auth_cache
+
+    auth_middleware._lru_put(cache, "a", 1, ttl=60)
+    auth_middleware._lru_put(cache, "b", 2, ttl=60)
+    auth_middleware._lru_put(cache, "a", 3, ttl=60)
+    auth_middleware._lru_put(cache, "c", 4, ttl=60)
+
+    assert list(cache) == ["a", "c"]
+    assert auth_middleware._lru_get(cache, "a") == 3
+
+
+def test_lru_entry_expires_after_ttl(clock):
+    cache = auth_middleware.auth_cache
+    auth_middleware._lru_put(cache, "a", "A", ttl=30)
+
+    clock.now += 29
+    assert auth_middleware._lru_get(cache, "a") == "A"
+
+    clock.now += 1
+    assert auth_middleware._lru_get(cache, "a") is None
+    assert "a" not in cache  # expired entries are dropped on read
+
+
+def test_positive_cache_uses_auth_ttl(clock):
+    context = {"user_id": "user1", "toy_id": "toy1"}
+    auth_middleware.write_cache(None, "user1", "toy1", None, context)
+
+    clock.now += auth_middleware.CACHE_TTL_SECONDS - 1
+    assert auth_middleware.check_cache(None, "user1", "toy1", None) == context
+
+    clock.now += 1
+    assert auth_middleware.check_cache(None, "user1", "toy1", None) is None
+
+
+def test_negative_cache_uses_short_ttl(clock):
+    auth_middleware.write_negative_cache(None, "user1", "toy1", "Device not found", 404)
+    assert auth_middleware.check_negative_cache(None, "user1", "toy1") == ("Device not found", 404)
+
+    clock.now += auth_middleware.NEG_CACHE_TTL_SECONDS
+    assert auth_middleware.check_negative_cache(None, "user1", "toy1") is None
+
+
+def test_clear_negative_cache_only_drops_that_device():
+    auth_middleware.write_negative_cache(None, "user1", "toy1", "Device not found", 404)
+    auth_middleware.write_negative_cache("a@example.com", None, "toy1", "Device not found", 404)
+    auth_middleware.write_negative_cache(None, "user1", "toy2", "Device not found", 404)
+
+    auth_middleware.clear_negative_cache("toy1")
+
+    assert auth_middleware.check_negative_cache(None, "user1", "toy1") is None
+    assert auth_middleware.check_negative_cache("a@example.com", None, "toy1") is None
+    assert auth_middleware.check_negative_cache(None, "user1", "toy2") == ("Device not found", 404)
+
+
+# ==================== NEGATIVE CACHE IN require_device_auth ====================
+
+HEADERS = {"X-User-ID": "user1", "X-Device-ID": "toy1"}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/protected")
+    @require_device_auth
+    def protected():
+        return jsonify({"ok": True})
+
+    return app.test_client()
+
+
+def rejecting_validator(status, calls):
+    def validate(email, user_id, toy_id):
+        calls.append((email, user_id, toy_id))
+        raise AuthenticationError("rejected", status)
+    return validate
+
+
+@pytest.mark.parametrize("status", [403, 404])
+def test_unknown_credentials_are_negatively_cached(client, monkeypatch, status):
+    calls = []
+    monkeypatch.setattr(auth_middleware, "validate_with_firestore", rejecting_validator(status, calls))
+
+    assert client.get("/protected", headers=HEADERS).status_code == status
+    assert client.get("/protected", headers=HEADERS).status_code == status
+
+    assert len(calls) == 1
+    assert auth_middleware.check_negative_cache(None, "user1", "toy1") == ("rejected", status)
+
+
+@pytest.mark.parametrize("status", [400, 500, 503])
+def test_other_rejections_are_not_cached(client, monkeypatch, status):
+    calls = []
+    monkeypatch.setattr(auth_middleware, "validate_with_firestore", rejecting_validator(status, calls))
+
+    assert client.get("/protected", headers=HEADERS).status_code == status
+    assert client.get("/protected", headers=HEADERS).status_code == status
+
+    assert len(calls) == 2
+    assert auth_middleware.check_negative_cache(None, "user1", "toy1") is None
+
+
+def test_missing_headers_are_not_cached(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(auth_middleware, "validate_with_firestore", rejecting_validator(404, calls))
+
+    assert client.get("/protected", headers={"X-User-ID": "user1"}).status_code == 400
+
+    assert calls == []
+    assert len(auth_middleware.auth_neg_cache) == 0
+
+
+def test_successful_validation_is_cached(client, monkeypatch):
+    calls = []
+
+    def validate(email, user_id, toy_id):
+        calls.append((email, user_id, toy_id))
+        return {"user_id": user_id, "toy_id": toy_id}
+
+    monkeypatch.setattr(auth_middleware, "validate_with_firestore", validate)
+
+    assert client.get("/protected", headers=HEADERS).status_code == 200
+    assert client.get("/protected", headers=HEADERS).status_code == 200
+
+    assert len(calls) == 1
+
+
+# ==================== SingleFlight ====================
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.005)
+
+
+def test_singleflight_followers_share_leader_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append("leader")
+        release.wait(2)
+        return "value"
+
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", slow)))
+    leader.start()
+    wait_for(lambda: "key" in flights._calls)
+
+    follower = threading.Thread(target=lambda: results.append(flights.do("key", lambda: calls.append("follower"))))
+    follower.start()
+    time.sleep(0.05)  # let the follower block on the leader's future
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert calls == ["leader"]
+    assert results == ["value", "value"]
+    assert flights._calls == {}
+
+
+def test_singleflight_propagates_leader_error_to_followers():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        release.wait(2)
+        raise AuthenticationError("Device not found", 404)
+
+    def call(fn):
+        try:
+            flights.do("key", fn)
+        except AuthenticationError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call, args=(failing,))
+    leader.start()
+    wait_for(lambda: "key" in flights._calls)
+
+    follower = threading.Thread(target=call, args=(lambda: errors.append("follower ran its own call"),))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+    assert errors[0].status == 404
+
+
+def test_singleflight_runs_again_after_a_failure():
+    flights = SingleFlight()
+
+    with pytest.raises(ValueError):
+        flights.do("key", lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+    assert flights._calls == {}
+    assert flights.do("key", lambda: "retried") == "retried"
+
+
+def test_singleflight_keys_are_independent():
+    flights = SingleFlight()
+    assert flights.do("a", lambda: 1) == 1
+    assert flights.do("b", lambda: 2) == 2
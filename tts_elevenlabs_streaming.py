@@ -1,7 +1,26 @@
 import os
+import re
 import requests
 import subprocess
 import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Persistent HTTP session: keeps TLS connections to ElevenLabs alive across requests
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.2)
+))
+
+# Sentence boundary used to cut streamed LLM text into TTS segments
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# Segments shorter than this are merged with the next sentence to limit API calls
+MIN_SEGMENT_CHARS = 40
 
 def synthesize_speech_streaming(text, output_path):
     """
@@ -43,7 +62,7 @@ def synthesize_speech_streaming(text, output_path):
         print(f"[INFO] Streaming speech with ElevenLabs for: '{text[:50]}{'...' if len(text) > 50 else ''}'")
 
         # Make streaming API request
-        response = requests.post(url, json=data, headers=headers, timeout=30, stream=True)
+        response = SESSION.post(url, json=data, headers=headers, timeout=30, stream=True)
         response.raise_for_status()
 
         # Write streaming chunks to temporary file
@@ -106,7 +125,92 @@ def synthesize_speech_streaming(text, output_path):
         raise
 
 
+def warmup_connection():
+    """Open the pooled TLS connection to ElevenLabs before the first real request"""
+    api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not api_key:
+        return
+    try:
+        SESSION.get("https://api.elevenlabs.io/v1/voices", headers={"xi-api-key": api_key}, timeout=5)
+        print("[INFO] ElevenLabs connection warmed up")
+    except requests.RequestException as e:
+        print(f"[WARN] ElevenLabs warmup failed: {e}")
+
+
 # Keep the same function name for drop-in replacement
 def synthesize_speech(text, output_path):
     """Wrapper to maintain compatibility with existing code"""
     return synthesize_speech_streaming(text, output_path)
+
+
+def synthesize_speech_from_stream(text_chunks, output_path):
+    """
+    Synthesize speech from an iterator of text chunks (e.g. a streaming LLM reply).
+
+    Text is cut into sentence segments as it arrives; each segment is sent to
+    ElevenLabs as soon as it is complete, so synthesis of early sentences overlaps
+    generation of later ones. Segment WAVs are joined in order into `output_path`,
+    keeping the same single 16kHz mono WAV the ESP32 expects.
+
+    Returns:
+        str: The full text that was synthesized
+    """
+    abs_output_path = os.path.abspath(output_path)
+    base, _ = os.path.splitext(abs_output_path)
+
+    full_text = []
+    pending = ""
+    futures = []
+
+    def submit(segment):
+        part_path = f"{base}.seg{len(futures)}.wav"
+        futures.append((part_path, executor.submit(synthesize_speech_streaming, segment, part_path)))
+
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            for chunk in text_chunks:
+                full_text.append(chunk)
+                pending += chunk
+
+                # Emit every complete sentence, holding back the trailing fragment
+                parts = SENTENCE_END.split(pending)
+                pending = parts.pop()
+                segment = ""
+                for part in parts:
+                    segment = f"{segment} {part}".strip()
+                    if len(segment) >= MIN_SEGMENT_CHARS:
+                        submit(segment)
+                        segment = ""
+                pending = f"{segment} {pending}".strip()
+
+            if pending:
+                submit(pending)
+
+            part_paths = []
+            for part_path, future in futures:
+                future.result()
+                part_paths.append(part_path)
+
+            _concatenate_wavs(part_paths, abs_output_path)
+    finally:
+        # Leaving the executor waits for in-flight segments, so none are still being
+        # written - covers a failing text stream as well as a failed segment
+        for part_path, _ in futures:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+
+    print(f"[INFO] Streamed TTS joined {len(futures)} segment(s) into {abs_output_path}")
+    return "".join(full_text).strip()
+
+
+def _concatenate_wavs(part_paths, output_path):
+    """Join same-format WAV files into one WAV file"""
+    if not part_paths:
+        raise ValueError("No audio segments to join")
+
+    with wave.open(output_path, "wb") as out:
+        for idx, part_path in enumerate(part_paths):
+            with wave.open(part_path, "rb") as part:
+                if idx == 0:
+                    out.setparams(part.getparams())
+                out.writeframes(part.readframes(part.getnframes()))
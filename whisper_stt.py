@@ -40,7 +40,17 @@ def transcribe_audio(file_path):
         print(f"[ERROR] Whisper transcription failed: {e}")
         return None
 
-file_path = "/Users/rohankhan/Desktop/plushieAI/temp/a.m4a"
-text = transcribe_audio(file_path)
+def warmup_connection():
+    """Open the OpenAI client's pooled TLS connection before the first transcription"""
+    try:
+        client.models.list()
+        print("[INFO] Whisper (OpenAI) connection warmed up")
+    except Exception as e:
+        print(f"[WARN] Whisper warmup failed: {e}")
+
 
-print(f"[TRANSCRIPT] {text}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Manual check: python whisper_stt.py <audio_file>
+    import sys
+    text = transcribe_audio(sys.argv[1])
+    print(f"[TRANSCRIPT] {text}")